@@ -1,2 +1,19 @@
 from .models import *
+from .expression import *
+from .validation import *
+from .buffers import *
+from .circular import *
+from .spectral import *
+from .rolling import *
+from .filters import *
+from .polars import *
+from .profiling import *
+from .breaker import *
+from .snapshot import *
 from .calculator import *
+from .graph import *
+from .events import *
+from .cse import *
+from .engine import *
+from .runner import *
+from .replay import *
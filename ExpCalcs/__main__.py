@@ -0,0 +1,115 @@
+import argparse
+import logging
+import os
+import sys
+
+from .models import Config
+from .engine import Engine
+from .runner import EngineRunner
+from .replay import replay_logs
+
+if sys.platform.startswith("win"):
+    from Expedition import ExpeditionDLL
+else:
+    # Dummy import for non-Windows platforms
+    from dummy_client import DummyExpeditionDLL as ExpeditionDLL
+
+logger = logging.getLogger("ExpCalcs")
+
+
+def run(args: argparse.Namespace) -> int:
+    with open(args.config) as f:
+        config = Config.model_validate_json(f.read())
+
+    expedition = ExpeditionDLL(config.expedition.install_path)
+    engine = Engine(config, expedition, time_step=args.time_step)
+    runner = EngineRunner(engine)
+
+    logger.info("Running %d math channels, ticking every %ss", len(engine.calculators), engine.time_step)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    return 0
+
+
+def replay(args: argparse.Namespace) -> int:
+    with open(args.config) as f:
+        config = Config.model_validate_json(f.read())
+
+    if args.output and len(args.logs) == 1:
+        outputs = [args.output]
+    else:
+        # the results of each log are written next to it, or to the output directory
+        outputs = [os.path.join(args.output or os.path.dirname(log),
+                                os.path.splitext(os.path.basename(log))[0] + "_replay.csv")
+                   for log in args.logs]
+    ticks = replay_logs(config, args.logs, outputs, processes=args.processes, time_step=args.time_step,
+                        chunk_size=args.chunk_size, time_column=args.time_column, time_scale=args.time_scale)
+    for output, count in zip(outputs, ticks):
+        logger.info("Wrote %d ticks of %d math channels to %s", count, len(config.math_channels), output)
+    return 0
+
+
+def benchmark(args: argparse.Namespace) -> int:
+    # the simulation is only needed to benchmark, so it is not imported with the package
+    from .benchmark import run_benchmarks, write_benchmarks
+
+    windows = {'both': (False, True), 'with': (True,), 'without': (False,)}[args.windows]
+    benchmarks = run_benchmarks(args.channels, windows, label=args.label, ticks=args.ticks,
+                                time_step=args.time_step, latency=args.latency, latency_per_var=args.latency_per_var)
+    write_benchmarks(benchmarks, args.output)
+    logger.info("Wrote the results of %d benchmarks to %s", len(benchmarks['results']), args.output)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ExpCalcs", description="Calculate math channels for Expedition")
+    parser.add_argument("--log-level", default="INFO", help="logging level, e.g. DEBUG, INFO, WARNING")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the math channels of a config without the GUI")
+    run_parser.add_argument("config", help="path to the config json file")
+    run_parser.add_argument("--time-step", type=float, default=0.1,
+                            help="time between runs of channels without an update rate, in seconds")
+    run_parser.set_defaults(func=run)
+
+    replay_parser = subparsers.add_parser("replay", help="run the math channels of a config over CSV logs")
+    replay_parser.add_argument("config", help="path to the config json file")
+    replay_parser.add_argument("logs", nargs="+", help="paths to the CSV logs, with a column for each Expedition var")
+    replay_parser.add_argument("-o", "--output",
+                               help="path of the CSV file of the results of a single log, or directory of the results "
+                                    "of several. By default each log's results are written next to it")
+    replay_parser.add_argument("--processes", type=int,
+                               help="number of logs replayed in parallel, the number of CPUs by default")
+    replay_parser.add_argument("--chunk-size", type=int, default=100_000, help="number of rows of a log read at a time")
+    replay_parser.add_argument("--time-step", type=float, default=0.1,
+                               help="time between runs of channels without an update rate, in seconds")
+    replay_parser.add_argument("--time-column", default="Utc", help="name of the time column of the log")
+    replay_parser.add_argument("--time-scale", type=float, default=86400.0,
+                               help="seconds per unit of the time column, Expedition logs days")
+    replay_parser.set_defaults(func=replay)
+
+    benchmark_parser = subparsers.add_parser("benchmark",
+                                             help="time the ticks of generated configs against a simulated Expedition")
+    benchmark_parser.add_argument("-o", "--output", default="benchmark.json",
+                                  help="path of the json file of the results")
+    benchmark_parser.add_argument("--channels", type=int, nargs="+", default=[10, 100, 1000, 5000],
+                                  help="numbers of channels of the configs")
+    benchmark_parser.add_argument("--windows", choices=["both", "with", "without"], default="both",
+                                  help="run the configs with rolling channels, without, or both")
+    benchmark_parser.add_argument("--ticks", type=int, default=600, help="number of ticks timed for each config")
+    benchmark_parser.add_argument("--time-step", type=float, default=0.1, help="time between ticks, in seconds")
+    benchmark_parser.add_argument("--latency", type=float, default=0.0, help="time every DLL call takes, in seconds")
+    benchmark_parser.add_argument("--latency-per-var", type=float, default=0.0,
+                                  help="extra time per var of a batched DLL call, in seconds")
+    benchmark_parser.add_argument("--label", help="name of the run stored with the results, e.g. the release")
+    benchmark_parser.set_defaults(func=benchmark)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from Expedition import Var
+
+from .models import Config, ExpeditionConfig, InputVar, MathChannelConfig
+from .engine import Engine
+from .simulation import SIMULATED_VARS, SimulatedClock, SimulatedExpeditionDLL
+
+__all__ = ["benchmark_config", "run_benchmark", "run_benchmarks", "write_benchmarks"]
+
+logger = logging.getLogger(__name__)
+
+# (expression, inputs, output is a heading), {k} is replaced by a constant that differs between channels
+_PLAIN_CHANNELS = (
+    ("bsp * cos(radians(twa)) * {k}", ("Bsp", "Twa"), False),
+    ("tws * sin(radians(twa)) + {k}", ("Tws", "Twa"), False),
+    ("hypot(aws * cos(radians(awa)) - bsp, aws * sin(radians(awa))) * {k}", ("Aws", "Awa", "Bsp"), False),
+    ("wrap_heading(hdg + twa + {k})", ("Hdg", "Twa"), True),
+    ("clip(roll / (20 + {k}), -1, 1)", ("Roll",), False),
+    ("ema(bsp, 1 + {k}) - ema(vmg, 2 + {k})", ("Bsp", "Vmg"), False),
+)
+
+_ROLLING_CHANNELS = (
+    ("mean(bsp) * {k}", ("Bsp",), False),
+    ("std(twa) + {k}", ("Twa",), False),
+    ("mean(twd) + {k}", ("Twd",), True),
+    ("max(tws) - min(tws) + {k}", ("Tws",), False),
+    ("rolling_median(bsp) + {k}", ("Bsp",), False),
+    ("mean(bsp * cos(radians(twa))) * {k}", ("Bsp", "Twa"), False),
+)
+
+_WINDOW_LENGTHS = ("10s", "30s", "1m", "5m")
+
+_INPUT_NAMES = {var.name: var.name.lower() for var in SIMULATED_VARS}
+
+
+def benchmark_config(channels: int, windowed: bool = False) -> Config:
+    """
+    Make a config of math channels over the inputs of the simulated Expedition
+    :param channels: number of channels
+    :param windowed: if True every other channel is a rolling channel, with windows of 10s to 5m
+    :return: Config
+    """
+    # the channels write to vars the simulation does not generate, so they do not depend on each other
+    outputs = [var for var in Var if var not in SIMULATED_VARS]
+    math_channels = []
+    for index in range(channels):
+        rolling = windowed and index % 2 == 1
+        templates = _ROLLING_CHANNELS if rolling else _PLAIN_CHANNELS
+        expression, inputs, heading = templates[(index // 2 if windowed else index) % len(templates)]
+        math_channels.append(MathChannelConfig(
+            name=f"Channel{index}",
+            output_expedition_var_enum_string=outputs[index % len(outputs)].name,
+            expression=expression.format(k=1 + index % 100 / 100),
+            inputs=[InputVar(expedition_var_enum_string=name, local_var_name=_INPUT_NAMES[name]) for name in inputs],
+            output_is_heading=heading,
+            window_length=_WINDOW_LENGTHS[index // 2 % len(_WINDOW_LENGTHS)] if rolling else None,
+        ))
+    return Config(expedition=ExpeditionConfig(install_path=""), math_channels=math_channels)
+
+
+def _percentiles(durations: np.ndarray) -> Dict[str, float]:
+    return {
+        'mean': float(np.mean(durations)),
+        'p50': float(np.percentile(durations, 50)),
+        'p90': float(np.percentile(durations, 90)),
+        'p99': float(np.percentile(durations, 99)),
+        'p99.9': float(np.percentile(durations, 99.9)),
+        'max': float(np.max(durations)),
+    }
+
+
+def _memory(config: Config, time_step: float, ticks: int, seed: Optional[int]) -> Dict[str, int]:
+    # memory is traced in a run of its own, tracing slows everything down too much to time the ticks
+    tracemalloc.start()
+    try:
+        clock = SimulatedClock()
+        expedition = SimulatedExpeditionDLL(clock=clock, seed=seed)
+        baseline = tracemalloc.get_traced_memory()[0]
+        engine = Engine(config, expedition, time_step=time_step)
+        for _ in range(ticks):
+            clock.advance(engine.time_step)
+            engine.tick(clock())
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'memory_bytes': current - baseline, 'peak_memory_bytes': peak - baseline}
+
+
+def run_benchmark(config: Config,
+                  ticks: int = 600,
+                  warmup_ticks: int = 50,
+                  time_step: float = 0.1,
+                  latency: float = 0.0,
+                  latency_per_var: float = 0.0,
+                  memory_ticks: int = 10,
+                  seed: Optional[int] = 0) -> Dict[str, Any]:
+    """
+    Time the ticks of an engine running a config against the simulated Expedition. The simulated clock is moved on
+    by a time step before every tick, so the ticks run back to back rather than in real time.
+    :param config: Config
+    :param ticks: number of ticks timed
+    :param warmup_ticks: number of ticks run before the timed ones
+    :param time_step: the engine's time step, in seconds
+    :param latency: time every DLL call takes, in seconds
+    :param latency_per_var: extra time per var of a batched DLL call, in seconds
+    :param memory_ticks: number of ticks run while tracing memory, 0 to not measure memory
+    :param seed: seed of the simulation
+    :return: tick durations in seconds, DLL calls and vars per tick, memory in bytes and the settings of the run
+    """
+    clock = SimulatedClock()
+    expedition = SimulatedExpeditionDLL(clock=clock, latency=latency, latency_per_var=latency_per_var, seed=seed)
+    started = time.perf_counter()
+    engine = Engine(config, expedition, time_step=time_step)
+    build_time = time.perf_counter() - started
+
+    for _ in range(warmup_ticks):
+        clock.advance(engine.time_step)
+        engine.tick(clock())
+
+    calls = expedition.calls.copy()
+    vars_read = expedition.vars_read
+    vars_written = expedition.vars_written
+    durations = np.empty(ticks)
+    for tick in range(ticks):
+        clock.advance(engine.time_step)
+        expedition.update()
+        started = time.perf_counter()
+        engine.tick(clock())
+        durations[tick] = time.perf_counter() - started
+    calls = expedition.calls - calls
+
+    result = {
+        'channels': len(config.math_channels),
+        'rolling_channels': sum(1 for math_channel in config.math_channels if math_channel.window_length),
+        'time_step': engine.time_step,
+        'ticks': ticks,
+        'latency': latency,
+        'latency_per_var': latency_per_var,
+        'build_seconds': build_time,
+        'tick_seconds': _percentiles(durations),
+        'overruns': int(np.count_nonzero(durations > engine.time_step)),
+        'calls_per_tick': {name: count / ticks for name, count in sorted(calls.items())},
+        'vars_read_per_tick': (expedition.vars_read - vars_read) / ticks,
+        'vars_written_per_tick': (expedition.vars_written - vars_written) / ticks,
+    }
+    if memory_ticks:
+        result.update(_memory(config, time_step, memory_ticks, seed))
+    return result
+
+
+def run_benchmarks(channel_counts: Sequence[int] = (10, 100, 1000, 5000),
+                   windows: Sequence[bool] = (False, True),
+                   label: Optional[str] = None,
+                   **kwargs) -> Dict[str, Any]:
+    """
+    Run the benchmark over configs of each number of channels, with and without windows
+    :param channel_counts: numbers of channels
+    :param windows: whether the configs have rolling channels
+    :param label: name of the run, e.g. the release being benchmarked
+    :param kwargs: passed on to run_benchmark
+    :return: the results of each config, with the label, time and machine of the run
+    """
+    results: List[Dict[str, Any]] = []
+    for channels in channel_counts:
+        for windowed in windows:
+            result = run_benchmark(benchmark_config(channels, windowed), **kwargs)
+            logger.info("%d channels%s: median tick %.2fms, p99 %.2fms, %.1f DLL calls per tick",
+                        channels, " with windows" if windowed else "", result['tick_seconds']['p50'] * 1000,
+                        result['tick_seconds']['p99'] * 1000, sum(result['calls_per_tick'].values()))
+            results.append(result)
+    return {
+        'label': label,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'results': results,
+    }
+
+
+def write_benchmarks(benchmarks: Dict[str, Any], path: str):
+    """
+    Write the results of run_benchmarks to a json file
+    :param benchmarks: the results of run_benchmarks
+    :param path: path of the file
+    """
+    with open(path, 'w') as f:
+        json.dump(benchmarks, f, indent=4)
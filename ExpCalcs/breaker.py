@@ -0,0 +1,120 @@
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, FrozenSet, Optional
+
+__all__ = ["ErrorBreaker"]
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorBreaker:
+    """
+    Circuit breaker for a math channel whose expression keeps failing, e.g. because of a typo or a division by an
+    input that is 0.
+
+    After each consecutive failure the channel skips twice as many evaluations as after the previous one, up to
+    `max_skipped`, so a channel that always fails costs almost nothing. A skipped evaluation gives NaN, like a failed
+    one. The channel is retried straight away if any of its inputs becomes valid or invalid, i.e. not NaN or NaN,
+    and the breaker closes on the first success.
+
+    The first failure of each run of failures is logged with its error. Later ones are counted and logged together,
+    at most once every `log_interval` seconds, and recovery is logged with the number of failures.
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_skipped: int = 128,
+                 log_interval: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param name: name of the channel, for the log
+        :param max_skipped: the most evaluations skipped between retries
+        :param log_interval: least time between logs of the same failing channel, in seconds
+        :param clock: time in seconds
+        """
+        self.name = name
+        self.max_skipped = max_skipped
+        self.log_interval = log_interval
+        self.clock = clock
+        self.failures = 0  # consecutive failures
+        self.skipped = 0  # evaluations skipped since the first of them
+        self.last_error: Optional[str] = None
+        self._skip = 0  # evaluations left to skip before the next retry
+        self._invalid: FrozenSet[str] = frozenset()
+        self._unlogged = 0  # failures since the last log
+        self._last_log = -math.inf  # time of the last log of the current run of failures
+        self._first_failure = -math.inf  # time of the first failure of the current run
+
+    @property
+    def is_open(self) -> bool:
+        """
+        :return: True if the channel's last evaluation failed
+        """
+        return self.failures > 0
+
+    @staticmethod
+    def _invalid_inputs(variables: Dict[str, Any]) -> FrozenSet[str]:
+        # windows are not checked, they can hold NaN long after the input has become valid again
+        return frozenset(name for name, value in variables.items() if isinstance(value, float) and math.isnan(value))
+
+    def allow(self, variables: Dict[str, Any]) -> bool:
+        """
+        Decide whether a failing channel is evaluated this time
+        :param variables: the variables the expression would be evaluated with
+        :return: True to evaluate the channel, False to skip it
+        """
+        if self._skip and self._invalid_inputs(variables) == self._invalid:
+            self._skip -= 1
+            self.skipped += 1
+            self._log()
+            return False
+        return True
+
+    def failure(self, error: str, variables: Dict[str, Any]):
+        """
+        Record a failed evaluation
+        :param error: the error message
+        :param variables: the variables the expression was evaluated with
+        """
+        if not self.failures:
+            self._first_failure = self.clock()
+        self.failures += 1
+        # the exponent is capped, so a channel that fails for hours does not build an ever larger int
+        self._skip = min(2 ** min(self.failures - 1, self.max_skipped.bit_length() + 1) - 1, self.max_skipped)
+        self._invalid = self._invalid_inputs(variables)
+        self.last_error = error
+        self._unlogged += 1
+        self._log()
+
+    def _log(self):
+        now = self.clock()
+        if not self._unlogged or now - self._last_log < self.log_interval:
+            return
+        if self._unlogged == 1 and self.failures == 1:
+            logger.warning("Error evaluating channel '%s': %s", self.name, self.last_error)
+        else:
+            logger.warning("Channel '%s' failed %d times in %.0fs, %d evaluations skipped, last error: %s",
+                           self.name, self._unlogged, now - self._last_log, self.skipped, self.last_error)
+        self._last_log = now
+        self._unlogged = 0
+
+    def success(self):
+        """
+        Record a successful evaluation, closing the breaker if it was open
+        """
+        if self.failures:
+            logger.info("Channel '%s' recovered after %d failures in %.0fs, %d evaluations skipped",
+                        self.name, self.failures, self.clock() - self._first_failure, self.skipped)
+            self.reset()
+
+    def reset(self):
+        """
+        Forget the failures so far, the next failure is logged as the first of a new run of failures
+        """
+        self.failures = 0
+        self.skipped = 0
+        self._skip = 0
+        self._invalid = frozenset()
+        self._unlogged = 0
+        self._last_log = -math.inf
@@ -0,0 +1,308 @@
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Protocol, Union
+
+import numpy as np
+
+__all__ = ["RingBuffer", "InputHistory", "DecimatedHistory", "RollingWindow"]
+
+
+class RingBuffer:
+    """
+    Preallocated circular buffer of floats, ordered newest sample first.
+
+    Every sample is written twice, at its slot and at its slot plus the buffer length, so the
+    window is always a contiguous slice of the underlying storage. This means pushing a sample is
+    O(1) and the newest first view handed to an expression never needs to be copied or re-ordered.
+    """
+
+    def __init__(self, length: int, fill: float = np.nan):
+        if length < 1:
+            raise ValueError("RingBuffer length must be at least 1")
+        self.length = length
+        self._data = np.full(2 * length, fill, dtype=float)
+        self._start = 0  # index of the newest sample
+
+    def push(self, value: float) -> float:
+        """
+        Add a new sample to the front of the buffer, dropping the oldest sample
+        :param value: the new sample
+        :return: the sample that was dropped from the end of the buffer
+        """
+        start = self._start - 1
+        if start < 0:
+            start = self.length - 1
+        dropped = self._data[start]
+        self._data[start] = value
+        self._data[start + self.length] = value
+        self._start = start
+        return dropped
+
+    def fill(self, value: float):
+        """
+        Set every sample in the buffer to the same value
+        """
+        self._data.fill(value)
+
+    def set_newest(self, value: float):
+        """
+        Replace the newest sample
+        """
+        self._data[self._start] = value
+        self._data[self._start + self.length] = value
+
+    def resize(self, length: int, fill: float = np.nan):
+        """
+        Change the length of the buffer, keeping as many of the newest samples as fit
+        :param length: the new length
+        :param fill: value of the new samples at the old end of the buffer, if it grows
+        """
+        if length < 1:
+            raise ValueError("RingBuffer length must be at least 1")
+        data = np.full(length, fill, dtype=float)
+        kept = min(length, self.length)
+        data[:kept] = self._data[self._start:self._start + kept]
+        self.length = length
+        self._data = np.concatenate((data, data))
+        self._start = 0
+
+    def view(self) -> np.ndarray:
+        """
+        Get a read only, newest first view of the buffer without copying it
+        :return: numpy array of length `length`
+        """
+        view = self._data[self._start:self._start + self.length]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def newest(self) -> float:
+        return self._data[self._start]
+
+    @property
+    def oldest(self) -> float:
+        return self._data[self._start + self.length - 1]
+
+    def __len__(self):
+        return self.length
+
+
+class WindowListener(Protocol):
+    def add(self, name: str, value: float): ...
+
+    def remove(self, name: str, value: float): ...
+
+
+class InputHistory:
+    """
+    The recent samples of a set of inputs, taken every `time_step` seconds, ordered newest first.
+
+    A history can be shared by any number of rolling windows that sample at the same time step, so that each input
+    is stored once and each sample is appended once, however many windows use it. Every input has a single buffer,
+    long enough for the longest window that uses it, and each window is a view of its own length of that buffer.
+
+    Until the first sample the buffers are padded with NaN, as if the inputs had been sampled every `time_step`
+    with no data.
+    """
+
+    def __init__(self, time_step: float):
+        self.time_step = time_step
+        self.times = RingBuffer(1)
+        self.buffers: Dict[Hashable, RingBuffer] = {}
+        self._started = False
+
+    def reserve(self, keys: Iterable[Hashable], length: int):
+        """
+        Make sure the history keeps at least `length` samples of some inputs
+        :param keys: the inputs
+        :param length: number of samples
+        """
+        if len(self.times) < length:
+            # padding older than any sample, so that it is outside every window
+            self.times.resize(length, self.times.oldest)
+        for key in keys:
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                self.buffers[key] = RingBuffer(length)
+            elif len(buffer) < length:
+                buffer.resize(length)
+
+    def retain(self, keys: Iterable[Hashable]):
+        """
+        Stop keeping the inputs that are not in `keys`, e.g. when the windows that used them have been removed
+        :param keys: the inputs to keep
+        """
+        keys = set(keys)
+        self.buffers = {key: buffer for key, buffer in self.buffers.items() if key in keys}
+
+    def push(self, timestamp: float, values: Mapping[Hashable, float]):
+        """
+        Add the latest sample of every input
+        :param timestamp: time of the sample, in seconds
+        :param values: the latest value of each input, by key
+        """
+        if not self._started:
+            # the padding is as old as the sample before the first one
+            self.times.fill(timestamp - self.time_step)
+            self._started = True
+        self.times.push(timestamp)
+        for key, buffer in self.buffers.items():
+            buffer.push(values[key])
+
+    def set_newest(self, key: Hashable, value: float):
+        """
+        Replace the latest sample of an input, e.g. when it is the output of a math channel evaluated after the push
+        """
+        self.buffers[key].set_newest(value)
+
+
+class DecimatedHistory(InputHistory):
+    """
+    History of block averages of inputs that are read more often, e.g. the 1 s averages of inputs read every 0.1 s.
+
+    Long windows can use a decimated history in place of the full rate one, so they keep and evaluate a fraction of
+    the samples. Every `block_length` samples given to accumulate() are averaged into one sample of the history,
+    ignoring NaN. A block with no valid samples is NaN. If `circular` is set the inputs are headings in degrees and
+    the blocks are circular means.
+    """
+
+    def __init__(self, time_step: float, block_length: int, circular: bool = False):
+        """
+        :param time_step: time between the samples of the history, which is the length of a block, in seconds
+        :param block_length: number of input samples in a block
+        :param circular: average the inputs as headings
+        """
+        super().__init__(time_step)
+        self.block_length = block_length
+        self.circular = circular
+        self._keys: List[Hashable] = []
+        self._sums = np.zeros((0, 2 if circular else 1))
+        self._counts = np.zeros(0)
+        self._samples = 0
+
+    def reserve(self, keys: Iterable[Hashable], length: int):
+        super().reserve(keys, length)
+        new_keys = [key for key in self.buffers if key not in self._keys]
+        if new_keys:
+            self._keys.extend(new_keys)
+            self._sums = np.vstack((self._sums, np.zeros((len(new_keys), self._sums.shape[1]))))
+            self._counts = np.concatenate((self._counts, np.zeros(len(new_keys))))
+
+    def retain(self, keys: Iterable[Hashable]):
+        super().retain(keys)
+        kept = [index for index, key in enumerate(self._keys) if key in self.buffers]
+        self._keys = [self._keys[index] for index in kept]
+        self._sums = self._sums[kept]
+        self._counts = self._counts[kept]
+
+    def accumulate(self, timestamp: float, values: Mapping[Hashable, float]) -> bool:
+        """
+        Add the latest sample of every input to the current block, pushing the block average when it is complete
+        :param timestamp: time of the sample, in seconds
+        :param values: the latest value of each input, by key
+        :return: True if a block was pushed
+        """
+        samples = np.fromiter((values[key] for key in self._keys), dtype=float, count=len(self._keys))
+        valid = ~np.isnan(samples)
+        samples = np.where(valid, samples, 0.0)
+        if self.circular:
+            radians = np.radians(samples)
+            self._sums[:, 0] += np.where(valid, np.sin(radians), 0.0)
+            self._sums[:, 1] += np.where(valid, np.cos(radians), 0.0)
+        else:
+            self._sums[:, 0] += samples
+        self._counts += valid
+        self._samples += 1
+        if self._samples < self.block_length:
+            return False
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.circular:
+                averages = np.mod(np.degrees(np.arctan2(self._sums[:, 0], self._sums[:, 1])), 360.0)
+            else:
+                averages = self._sums[:, 0] / self._counts
+        averages[self._counts == 0] = np.nan
+        self.push(timestamp, dict(zip(self._keys, averages.tolist())))
+        self._sums.fill(0.0)
+        self._counts.fill(0.0)
+        self._samples = 0
+        return True
+
+
+class RollingWindow:
+    """
+    Time based window over the samples of one or more inputs, ordered newest first.
+
+    A sample stays in the window while it is less than `duration` seconds older than the newest sample. The window
+    uses the timestamp of every sample rather than assuming ticks are exactly `time_step` apart, so it still covers
+    `duration` when ticks are late or missed. The buffers have some spare capacity for ticks that come early, if
+    they fill up the oldest sample is dropped even though it is still inside the window.
+
+    Until it has been running for `duration` the window is padded with NaN, as if it had been running at
+    `time_step` with no data.
+
+    The samples are kept in an InputHistory. A window can have a history of its own, which is updated by push(), or
+    share one with other windows, in which case the history is pushed once for all of them and each window is then
+    updated with advance().
+    """
+
+    def __init__(self,
+                 names: Union[Iterable[str], Mapping[str, Hashable]],
+                 duration: float,
+                 time_step: float,
+                 history: Optional[InputHistory] = None):
+        """
+        :param names: input names, or input name -> key of the input in a shared history
+        :param duration: length of the window, in seconds
+        :param time_step: nominal time between samples, in seconds
+        :param history: shared history of the inputs, if None the window has its own
+        """
+        self.keys: Dict[str, Hashable] = dict(names) if isinstance(names, Mapping) else {name: name for name in names}
+        self.names = list(self.keys)
+        self.duration = duration
+        self.time_step = time_step
+        self.nominal_length = max(int(np.ceil(duration / time_step)), 1)
+        self.capacity = self.nominal_length + int(np.ceil(self.nominal_length * 0.1)) + 1
+        self.history = history if history is not None else InputHistory(time_step)
+        # keep one sample more than the window, so that the sample that drops out of a full window can still be read
+        self.history.reserve(self.keys.values(), self.capacity + 1)
+        self.count = self.capacity  # number of samples in the window, including any padding
+
+    def push(self, timestamp: float, values: Dict[str, float], listener: Optional[WindowListener] = None):
+        """
+        Add the latest sample of every input to the window's own history, then advance the window
+        :param timestamp: time of the sample, in seconds
+        :param values: input name -> latest value
+        :param listener: notified of every sample added to and removed from the window, oldest first
+        """
+        self.history.push(timestamp, {self.keys[name]: value for name, value in values.items()})
+        self.advance(listener)
+
+    def advance(self, listener: Optional[WindowListener] = None):
+        """
+        Take in the latest sample of the history and drop the samples that have fallen out of the window
+        :param listener: notified of every sample added to and removed from the window, oldest first
+        """
+        full = self.count == self.capacity
+        if listener is not None:
+            for name, key in self.keys.items():
+                samples = self.history.buffers[key].view()
+                listener.add(name, float(samples[0]))
+                if full:
+                    listener.remove(name, float(samples[self.capacity]))
+        if not full:
+            self.count += 1
+
+        times = self.history.times.view()
+        cutoff = times[0] - self.duration
+        while self.count and times[self.count - 1] <= cutoff:
+            self.count -= 1
+            if listener is not None:
+                for name, key in self.keys.items():
+                    listener.remove(name, float(self.history.buffers[key].view()[self.count]))
+
+    def view(self, name: str) -> np.ndarray:
+        """
+        Get a read only, newest first view of the samples of an input that are in the window, without copying them
+        :param name: input name
+        :return: numpy array of the samples in the window
+        """
+        return self.history.buffers[self.keys[name]].view()[:self.count]
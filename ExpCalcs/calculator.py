@@ -1,31 +1,151 @@
 from .models import MathChannelConfig
-from typing import Dict, Optional, Union
+from .expression import CompiledExpression, ExpressionError, compile_expression
+from .buffers import InputHistory, RollingWindow
+from .rolling import RollingStatistics
+from .circular import circmean, circstd, wrap_heading
+from .spectral import band_power, dominant_period
+from .snapshot import InputSnapshot
+from .outputs import OutputStage
+from .events import Event
+from .filters import StatefulFilters
+from .polars import PolarError, load_polar
+from .profiling import ChannelStats
+from .breaker import ErrorBreaker
+from typing import Callable, Dict, List, Optional, Union
 from Expedition import Var, ExpeditionDLL
 import numpy as np
 from abc import ABC, abstractmethod
+import ast
+import functools
 import logging
-from PySide6.QtCore import QObject, Signal
+import time
 
 logger = logging.getLogger(__name__)
 
 
-class Calculator(QObject):
-    evaluated = Signal(float)  # Emitted when an expression is successfully evaluated
-    error = Signal(str)  # Emitted when an error occurs during evaluation
+# the functions every expression can use, by the name used in the expression
+DEFAULT_FUNCTIONS: Dict[str, Callable] = {
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
 
+    'arcsin': np.arcsin,
+    'arccos': np.arccos,
+    'arctan': np.arctan,
+
+    'sinh': np.sinh,
+    'cosh': np.cosh,
+    'tanh': np.tanh,
+
+    'arcsinh': np.arcsinh,
+    'arccosh': np.arccosh,
+    'arctanh': np.arctanh,
+
+    'hypot': np.hypot,
+    'arctan2': np.arctan2,
+
+    'degrees': np.degrees,
+    'radians': np.radians,
+    'unwrap': np.unwrap,
+
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'clip': np.clip,
+    'exp': np.exp,
+    'log': np.log,
+    'log2': np.log2,
+    'log10': np.log10,
+
+    'ceil': np.ceil,
+    'floor': np.floor,
+    'trunc': np.trunc,
+    'round': np.round,
+    'rint': np.rint,
+    'fix': np.fix,
+
+    'mean': np.mean,
+    'median': np.median,
+    'min': np.min,
+    'max': np.max,
+    'average': np.average,
+    'std': np.std,
+    'var': np.var,
+    'sum': np.sum,
+    'prod': np.prod,
+    'cumsum': np.cumsum,
+    'cumprod': np.cumprod,
+    'diff': np.diff,
+    'gradient': np.gradient,
+    'cross': np.cross,
+    # np.trapz was renamed np.trapezoid in numpy 2.0 and later removed
+    'trapz': getattr(np, 'trapezoid', None) or np.trapz,
+    'expm1': np.expm1,
+    'log1p': np.log1p,
+    'sign': np.sign,
+    'heaviside': np.heaviside,
+    'power': np.power,
+    'square': np.square,
+    'cbrt': np.cbrt,
+    'reciprocal': np.reciprocal,
+    'negative': np.negative,
+    'positive': np.positive,
+    'signbit': np.signbit,
+    'copysign': np.copysign,
+
+    'rolling_median': np.median,
+    'rolling_quantile': np.quantile,
+
+    'circmean': circmean,
+    'circstd': circstd,
+    'wrap_heading': wrap_heading,
+}
+
+# functions only channels with a window can use, given the time step of the window as `time_step`
+WINDOW_FUNCTIONS: Dict[str, Callable] = {
+    'dominant_period': dominant_period,
+    'band_power': band_power,
+}
+
+# functions only channels with a polar file can use, by the name of the Polar method they call
+POLAR_FUNCTIONS: Dict[str, str] = {
+    'polar_bsp': 'bsp',
+    'target_twa': 'target_twa',
+    'target_bsp': 'target_bsp',
+}
+
+
+class Calculator(ABC):
     def __init__(self,
                  expedition: ExpeditionDLL,
                  expression: str,
                  output_var: Var,
                  output_var_user_name: Optional[str] = None,
-                 name: Optional[str] = None):
-        QObject.__init__(self)
+                 name: Optional[str] = None,
+                 output_is_heading: bool = False,
+                 output_deadband: float = 0.0):
+        self.evaluated = Event()  # Emitted with the result of every evaluation
+        self.error = Event()  # Emitted when an error occurs during evaluation
+        self.stats = ChannelStats()  # evaluation and error counts, and evaluation times recorded by the engine
 
         self.expedition = expedition
         self.expression = expression
         self.output_var = output_var
         self.output_var_user_name = output_var_user_name
         self.name = name if name else expression
+        self.breaker = ErrorBreaker(self.name)  # skips evaluations of a channel that keeps failing
+        self.output_is_heading = output_is_heading
+        self.output_deadband = output_deadband
+
+        # parse and compile the expression once, rather than on every evaluation
+        self.compiled_expression: Optional[CompiledExpression] = None
+        self.compile_error: Optional[str] = None
+        self._own_expression: Optional[CompiledExpression] = None  # the expression before use_compiled_expression()
+        self._rewrite_functions: List[str] = []
+        try:
+            self.compiled_expression = compile_expression(expression)
+        except ExpressionError as e:
+            logger.warning(str(e))
+            self.compile_error = str(e)
 
         self.variables = {}
         self.functions = {'__builtins__': None}
@@ -34,76 +154,22 @@ class Calculator(QObject):
         self.add_default_functions()
         self.add_default_variables()
 
+        # give every filter call in the expression, e.g. ema(bsp, 5), a state of its own
+        self.filters = StatefulFilters()
+        if self.compiled_expression is not None:
+            tree = self.filters.rewrite(self.compiled_expression.tree)
+            if tree is not None:
+                self.compiled_expression = compile_expression(ast.unparse(tree))
+                self.functions.update(self.filters.filters)
+
         if self.output_var_user_name and Var.User0 <= self.output_var <= Var.UserMax:
             self.expedition.set_exp_user_var_name(self.output_var, self.output_var_user_name)
 
     def add_default_functions(self):
         """
-        Add the following Python functions to be used in a mathematical expression:
-        """
-        self.functions['sin'] = np.sin
-        self.functions['cos'] = np.cos
-        self.functions['tan'] = np.tan
-
-        self.functions['arcsin'] = np.arcsin
-        self.functions['arccos'] = np.arccos
-        self.functions['arctan'] = np.arctan
-
-        self.functions['sinh'] = np.sinh
-        self.functions['cosh'] = np.cosh
-        self.functions['tanh'] = np.tanh
-
-        self.functions['arcsinh'] = np.arcsinh
-        self.functions['arccosh'] = np.arccosh
-        self.functions['arctanh'] = np.arctanh
-
-        self.functions['hypot'] = np.hypot
-        self.functions['arctan2'] = np.arctan2
-
-        self.functions['degrees'] = np.degrees
-        self.functions['radians'] = np.radians
-        self.functions['unwrap'] = np.unwrap
-
-        self.functions['abs'] = np.abs
-        self.functions['sqrt'] = np.sqrt
-        self.functions['clip'] = np.clip
-        self.functions['exp'] = np.exp
-        self.functions['log'] = np.log
-        self.functions['log2'] = np.log2
-        self.functions['log10'] = np.log10
-
-        self.functions['ceil'] = np.ceil
-        self.functions['floor'] = np.floor
-        self.functions['trunc'] = np.trunc
-        self.functions['round'] = np.round
-        self.functions['rint'] = np.rint
-        self.functions['fix'] = np.fix
-
-        self.functions['mean'] = np.mean
-        self.functions['median'] = np.median
-        self.functions['average'] = np.average
-        self.functions['std'] = np.std
-        self.functions['var'] = np.var
-        self.functions['sum'] = np.sum
-        self.functions['prod'] = np.prod
-        self.functions['cumsum'] = np.cumsum
-        self.functions['cumprod'] = np.cumprod
-        self.functions['diff'] = np.diff
-        self.functions['gradient'] = np.gradient
-        self.functions['cross'] = np.cross
-        self.functions['trapz'] = np.trapz
-        self.functions['expm1'] = np.expm1
-        self.functions['log1p'] = np.log1p
-        self.functions['sign'] = np.sign
-        self.functions['heaviside'] = np.heaviside
-        self.functions['power'] = np.power
-        self.functions['square'] = np.square
-        self.functions['cbrt'] = np.cbrt
-        self.functions['reciprocal'] = np.reciprocal
-        self.functions['negative'] = np.negative
-        self.functions['positive'] = np.positive
-        self.functions['signbit'] = np.signbit
-        self.functions['copysign'] = np.copysign
+        Add the Python functions of DEFAULT_FUNCTIONS to be used in a mathematical expression
+        """
+        self.functions.update(DEFAULT_FUNCTIONS)
 
     def add_default_variables(self):
         """
@@ -116,53 +182,114 @@ class Calculator(QObject):
     def from_config(config: MathChannelConfig,
                     expedition: ExpeditionDLL,
                     time_step: float = 0.1,
+                    history: Optional[InputHistory] = None,
                     ) -> 'Calculator':
         """
         Create a calculator from a MathChannelConfig
         :param config: MathChannelConfig
         :param expedition: ExpeditionDLL
         :param time_step: time step for rolling calculations
+        :param history: input history shared with other rolling calculations at the same time step
         :return: Calculator
         """
         if config.window_length:
-            return RollingMathChannelCalculator(config, expedition, time_step)
+            return RollingMathChannelCalculator(config, expedition, time_step, history)
         else:
             return MathChannelCalculator(config, expedition)
 
     @abstractmethod
-    def calculate(self) -> float:
+    def calculate(self,
+                  snapshot: Optional[InputSnapshot] = None,
+                  outputs: Optional[OutputStage] = None,
+                  sample: bool = True) -> float:
+        """
+        Evaluate the expression and write the result to the output var
+        :param snapshot: the tick's input snapshot, if None the inputs are read from Expedition
+        :param outputs: the tick's output stage, if None the result is written straight to Expedition
+        :param sample: add the latest inputs to the window first, for channels with a window
+        :return: the result
+        """
         raise NotImplementedError("calculate method must be implemented in a subclass")
 
+    def sample(self, snapshot: Optional[InputSnapshot] = None):
+        """
+        Add the latest inputs to the window without evaluating, for channels with a window
+        """
+
+    def use_compiled_expression(self, compiled_expression: CompiledExpression, functions: Dict[str, object]):
+        """
+        Replace the compiled expression with an equivalent rewritten one, e.g. one that uses shared subexpressions
+        :param compiled_expression: the rewritten expression
+        :param functions: additional functions used by the rewritten expression
+        """
+        if self._own_expression is None:
+            self._own_expression = self.compiled_expression
+        self._rewrite_functions.extend(functions)
+        self.compiled_expression = compiled_expression
+        self.functions.update(functions)
+
+    def restore_compiled_expression(self):
+        """
+        Go back to the channel's own compiled expression, undoing use_compiled_expression()
+        """
+        if self._own_expression is None:
+            return
+        self.compiled_expression = self._own_expression
+        for name in self._rewrite_functions:
+            self.functions.pop(name, None)
+        self._own_expression = None
+        self._rewrite_functions = []
+
+    def write_output(self, value: float, outputs: Optional[OutputStage] = None):
+        """
+        Write the result of an evaluation to the output var
+        :param value: the result
+        :param outputs: the tick's output stage, if None the value is written straight to Expedition
+        """
+        if outputs is None:
+            self.expedition.set_exp_var_value(self.output_var, value)
+        else:
+            outputs.set(self.output_var, value, self.output_deadband, self.output_is_heading)
+
     def evaluate(self, variables: Union[Dict[str, float], Dict[str, np.ndarray]]) -> float:
         """
         Evaluate a mathematical expression using the given variables
         :param variables: a dictionary of variable names and their values
-        :return: the result of the expression
+        :return: the result of the expression, NaN if it could not be evaluated
         """
         self._evaluation_variables = variables
+        result = np.nan
+        error = None
+        if self.breaker.failures and not self.breaker.allow(variables):
+            self.stats.skipped += 1
+            self.evaluated.emit(result)
+            return result
         try:
-            result = eval(self.expression, self._evaluation_variables, self.functions)
-            if isinstance(result, float):
-                self.expedition.set_exp_var_value(self.output_var, result)
-                self.evaluated.emit(result)
-                return result
-            elif isinstance(result, np.ndarray):
-                if result.size == 1:
-                    result = result.item()
-                    self.expedition.set_exp_var_value(self.output_var, result)
-                    self.evaluated.emit(result)
-                    return result
+            if self.compiled_expression is None:
+                raise ExpressionError(self.compile_error)
+            value = self.compiled_expression.evaluate(self._evaluation_variables, self.functions)
+            if self.output_is_heading:
+                value = wrap_heading(value)
+            if isinstance(value, float):
+                result = value
+            elif isinstance(value, np.ndarray):
+                if value.size == 1:
+                    result = value.item()
                 else:
-                    logger.warning(f"Expression returned an array of size {result.size}, expected a single value.")
-                    self.error.emit("Expression returned an array, expected a single value.")
+                    error = f"Expression returned an array of size {value.size}, expected a single value."
         except Exception as e:
-            logger.warning(f"Error evaluating expression: {e}")
-            self.error.emit(str(e))
-            # set the output variable to NaN
+            error = str(e)
 
-        self.expedition.set_exp_var_value(self.output_var, np.nan)
-        self.evaluated.emit(float('nan'))
-        return np.nan
+        # emit outside of the try block, so that an error in a listener is not reported as an expression error
+        self.stats.evaluations += 1
+        if error is not None:
+            self.stats.errors += 1
+            self.breaker.failure(error, variables)
+            self.error.emit(error)
+        elif self.breaker.failures:
+            self.breaker.success()
+        self.evaluated.emit(result)
+        return result
 
     @property
     def evaluation_variables(self) -> Dict[str, Union[float, np.ndarray]]:
@@ -180,35 +307,127 @@ class MathChannelCalculator(Calculator):
                          config.expression,
                          config.output_expedition_var,
                          config.output_expedition_user_name,
-                         config.name)
+                         config.name,
+                         bool(config.output_is_heading),
+                         config.output_deadband or 0.0)
         self.config = config
         self.inputs = config.inputs
+        self.input_vars: List[Var] = [input_var.expedition_var for input_var in self.inputs]
+        self._own_snapshot: Optional[InputSnapshot] = None
+        if config.polar_file:
+            self.add_polar_functions(config.polar_file)
+
+    def add_polar_functions(self, polar_file: str):
+        """
+        Add the lookups of a polar, which take single values or windows:
+        polar_bsp(tws, twa), target_twa(tws, upwind) and target_bsp(tws, upwind)
+        :param polar_file: path of the polar file, loaded once however many channels use it
+        """
+        try:
+            polar = load_polar(polar_file)
+        except PolarError as e:
+            logger.warning(str(e))
+            self.compiled_expression = None
+            self.compile_error = str(e)
+            return
+        self.functions.update({name: getattr(polar, method) for name, method in POLAR_FUNCTIONS.items()})
+
+    def read_inputs(self, snapshot: Optional[InputSnapshot] = None) -> List[float]:
+        """
+        Get the latest values of the inputs
+        :param snapshot: the tick's input snapshot, if None the inputs are read from Expedition
+        :return: input values, in the same order as the inputs
+        """
+        if snapshot is None:
+            if self._own_snapshot is None:
+                self._own_snapshot = InputSnapshot(self.input_vars)
+            snapshot = self._own_snapshot
+            snapshot.read(self.expedition)
+        return [snapshot[var] for var in self.input_vars]
+
+    def timestamp(self, snapshot: Optional[InputSnapshot] = None) -> float:
+        """
+        :param snapshot: the tick's input snapshot, if None the snapshot of the last read_inputs()
+        :return: time.monotonic() time of the inputs
+        """
+        if snapshot is None:
+            snapshot = self._own_snapshot
+        return snapshot.timestamp if snapshot is not None else time.monotonic()
 
-    def calculate(self) -> float:
-        values = self.expedition.get_exp_vars([input_var.expedition_var for input_var in self.config.inputs])
-        variables = dict(zip([input_var.local_var_name for input_var in self.config.inputs], values))
+    def calculate(self,
+                  snapshot: Optional[InputSnapshot] = None,
+                  outputs: Optional[OutputStage] = None,
+                  sample: bool = True) -> float:
+        values = self.read_inputs(snapshot)
+        variables = dict(zip([input_var.local_var_name for input_var in self.inputs], values))
         variables.update(self.variables)
-        return self.evaluate(variables)
+        self.filters.time = self.timestamp(snapshot)
+        result = self.evaluate(variables)
+        self.write_output(result, outputs)
+        return result
 
 
 class RollingMathChannelCalculator(MathChannelCalculator):
-    def __init__(self, config: MathChannelConfig, expedition: ExpeditionDLL, time_step: float = 0.1):
+    def __init__(self,
+                 config: MathChannelConfig,
+                 expedition: ExpeditionDLL,
+                 time_step: float = 0.1,
+                 history: Optional[InputHistory] = None):
+        """
+        :param history: history of the inputs shared with other channels, which the owner pushes every `time_step`.
+                        If None the channel keeps its own history and samples its inputs itself
+        """
         super().__init__(config, expedition)
         self.time_step = time_step
-        self.buffer_length = max(int(np.ceil(config.window_length_time_delta.total_seconds() / time_step)), 1)
+        self.shares_history = history is not None
+        self.window = RollingWindow({i.local_var_name: i.expedition_var for i in self.inputs},
+                                    config.window_length_time_delta.total_seconds(),
+                                    time_step,
+                                    history)
+        self.buffer_length = self.window.nominal_length
+
+        # spectra of windows that are not replaced by a sliding DFT below, e.g. dominant_period(heave - mean(heave))
+        self.functions.update({name: functools.partial(function, time_step=time_step)
+                               for name, function in WINDOW_FUNCTIONS.items()})
+
+        # replace reductions such as mean(bsp) with running accumulators
+        self.statistics: Optional[RollingStatistics] = None
+        if self.compiled_expression is not None:
+            statistics = RollingStatistics(self.compiled_expression.tree, self.window.names, self.buffer_length,
+                                           heading=self.output_is_heading, time_step=time_step)
+            if not statistics.is_empty:
+                statistics.initialise(self.window)
+                self.statistics = statistics
+                self.compiled_expression = compile_expression(statistics.expression)
+
+        # only hand the expression the windows it still uses directly
+        names = self.compiled_expression.names if self.compiled_expression is not None else self.window.names
+        self.windowed_names = [name for name in self.window.names if name in names]
 
-        self.buffers = {
-            i.local_var_name: np.zeros(self.buffer_length) * np.nan
-            for i in self.config.inputs
-        }
+    def sample(self, snapshot: Optional[InputSnapshot] = None):
+        if self.shares_history:
+            # the history has already been pushed with the latest input values
+            self.window.advance(self.statistics)
+            return
+        # add the latest input values to the window, which is ordered newest first
+        values = self.read_inputs(snapshot)
+        self.window.push(self.timestamp(snapshot),
+                         {i.local_var_name: float(value) for i, value in zip(self.inputs, values)},
+                         self.statistics)
 
-    def calculate(self) -> float:
-        # get the latest input values
-        for i in self.inputs:
-            latest_value = self.expedition.get_exp_var_value(i.expedition_var)
-            self.buffers[i.local_var_name] = np.roll(self.buffers[i.local_var_name], 1)
-            self.buffers[i.local_var_name][0] = latest_value
+    def calculate(self,
+                  snapshot: Optional[InputSnapshot] = None,
+                  outputs: Optional[OutputStage] = None,
+                  sample: bool = True) -> float:
+        if sample:
+            self.sample(snapshot)
 
-        variables = {**self.buffers}
+        variables = {name: self.window.view(name) for name in self.windowed_names}
+        if self.statistics is not None:
+            self.statistics.tick(self.window)
+            variables.update(self.statistics.values())
         variables.update(self.variables)
-        return self.evaluate(variables)
+        self.filters.time = self.timestamp(snapshot)
+        result = self.evaluate(variables)
+        self.write_output(result, outputs)
+        return result
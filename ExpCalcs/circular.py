@@ -0,0 +1,35 @@
+import numpy as np
+
+__all__ = ["circmean", "circstd", "wrap_heading"]
+
+
+def circmean(headings) -> float:
+    """
+    Circular mean of headings in degrees, e.g. the mean of 350 and 10 is 0
+    :param headings: headings in degrees
+    :return: mean heading in degrees, in the range [0, 360)
+    """
+    radians = np.radians(headings)
+    return wrap_heading(np.degrees(np.arctan2(np.sum(np.sin(radians)), np.sum(np.cos(radians)))))
+
+
+def circstd(headings) -> float:
+    """
+    Circular standard deviation of headings in degrees
+    :param headings: headings in degrees
+    :return: standard deviation in degrees
+    """
+    radians = np.radians(headings)
+    resultant_length = np.hypot(np.mean(np.sin(radians)), np.mean(np.cos(radians)))
+    return np.degrees(np.sqrt(-2.0 * np.log(np.minimum(resultant_length, 1.0))))
+
+
+def wrap_heading(heading):
+    """
+    Wrap a heading in degrees into the range [0, 360)
+    """
+    wrapped = np.mod(heading, 360.0)
+    # tiny negative headings wrap to exactly 360 in floating point
+    if np.ndim(wrapped) == 0:
+        return 0.0 if wrapped >= 360.0 else float(wrapped)
+    return np.where(wrapped >= 360.0, 0.0, wrapped)
@@ -0,0 +1,214 @@
+import ast
+import copy
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from Expedition import Var
+
+from .expression import CompiledExpression, compile_expression
+from .snapshot import InputSnapshot
+
+__all__ = ["SharedTerm", "SharedSubexpressions"]
+
+# expression nodes that are worth sharing between channels
+_SHARABLE_NODES = (ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.Call, ast.IfExp, ast.Subscript)
+
+# nodes that bind their own names, so can not be moved out of their expression
+_SCOPED_NODES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.NamedExpr)
+
+
+class SharedTerm:
+    """
+    A subexpression that appears in more than one math channel. Channels call it in place of the subexpression,
+    it is evaluated on the first call of each tick and the result is reused by the other calls.
+    """
+
+    def __init__(self,
+                 name: str,
+                 key: str,
+                 expression: CompiledExpression,
+                 variables: Dict[Var, str],
+                 owner: 'SharedSubexpressions'):
+        self.name = name
+        self.key = key
+        self.expression = expression
+        self.variables = variables  # Var -> name used in the expression
+        self.owner = owner
+        self._tick = -1
+        self._result: Any = None
+        self._error: Optional[Exception] = None
+
+    def __call__(self):
+        if self._tick != self.owner.tick:
+            self._tick = self.owner.tick
+            self._result = None
+            self._error = None
+            variables = {name: self.owner.snapshot[var] for var, name in self.variables.items()}
+            variables.update(self.owner.constants)
+            try:
+                self._result = self.expression.evaluate(variables, self.owner.functions)
+            except Exception as e:
+                self._error = e
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def __repr__(self):
+        return f"SharedTerm({self.name}: {self.expression.text})"
+
+
+class SharedSubexpressions:
+    """
+    Common subexpression elimination across math channels.
+
+    Every subexpression of the channel expressions is keyed by its structure, with the local input names replaced
+    by the Expedition vars they read, so `b * cos(radians(t))` in one channel and `bsp * cos(radians(twa))` in
+    another are the same term if both read Bsp and Twa. The largest subexpressions that appear more than once are
+    replaced by calls to a SharedTerm, which evaluates once per tick.
+    """
+
+    def __init__(self,
+                 snapshot: InputSnapshot,
+                 functions: Dict[str, Any],
+                 constants: Dict[str, Any]):
+        self.snapshot = snapshot
+        self.functions = dict(functions)
+        self.constants = dict(constants)
+        self.terms: Dict[str, SharedTerm] = {}
+        self._terms_by_key: Dict[str, SharedTerm] = {}
+        self.tick = 0
+
+    def new_tick(self):
+        """
+        Invalidate the results of the previous tick
+        """
+        self.tick += 1
+
+    def rewrite(self, channels: List[Dict[str, Any]]) -> List[Optional[ast.Expression]]:
+        """
+        Find the subexpressions shared between channels and rewrite the channel expressions to use them
+        :param channels: for each channel a dict with the expression `tree`, the `inputs` (local name -> Var) and
+                         optionally its `functions`, for functions that are not the same in every channel
+        :return: for each channel the rewritten expression tree, or None if the channel shares nothing
+        """
+        # stateful functions such as filters must be called by each channel, once per evaluation
+        shared_names = {name for name, f in self.functions.items() if not getattr(f, 'stateful', False)}
+        shared_names |= set(self.constants)
+        # functions of the same name that differ between channels, e.g. polar_bsp of different polars, are not shared
+        channel_names = [
+            shared_names - {name for name, f in channel.get('functions', {}).items()
+                            if name in self.functions and f != self.functions[name]}
+            for channel in channels
+        ]
+        occurrences: Dict[str, List[List[str]]] = defaultdict(list)
+        for channel, names in zip(channels, channel_names):
+            self._collect(channel['tree'], channel['inputs'], names, [], occurrences)
+
+        # decide the largest subexpressions first. Occurrences inside a shared subexpression are only
+        # evaluated once per tick, so they count once however many times that subexpression is used
+        shared_keys: Set[str] = set()
+        for key in sorted(occurrences, key=len, reverse=True):
+            evaluations = 0
+            shared_parents = set()
+            for ancestors in occurrences[key]:
+                parent = next((a for a in reversed(ancestors) if a in shared_keys), None)
+                if parent is None:
+                    evaluations += 1
+                else:
+                    shared_parents.add(parent)
+            if evaluations + len(shared_parents) > 1:
+                shared_keys.add(key)
+
+        if not shared_keys:
+            return [None] * len(channels)
+
+        rewritten = []
+        for channel, names in zip(channels, channel_names):
+            transformer = _SharedTermTransformer(self, channel['inputs'], names, shared_keys)
+            tree = transformer.visit(copy.deepcopy(channel['tree']))
+            rewritten.append(ast.fix_missing_locations(tree) if transformer.replaced else None)
+        return rewritten
+
+    @classmethod
+    def _collect(cls, node: ast.AST, inputs: Dict[str, Var], shared_names: Set[str], ancestors: List[str],
+                 occurrences: Dict[str, List[List[str]]]):
+        key = cls._key(node, inputs, shared_names)
+        if key is not None:
+            occurrences[key].append(list(ancestors))
+            ancestors.append(key)
+        for child in ast.iter_child_nodes(node):
+            cls._collect(child, inputs, shared_names, ancestors, occurrences)
+        if key is not None:
+            ancestors.pop()
+
+    @staticmethod
+    def _key(node: ast.AST, inputs: Dict[str, Var], shared_names: Set[str]) -> Optional[str]:
+        if not isinstance(node, _SHARABLE_NODES):
+            return None
+        uses_input = False
+        for child in ast.walk(node):
+            if isinstance(child, _SCOPED_NODES):
+                return None
+            if isinstance(child, ast.Name):
+                if child.id in inputs:
+                    uses_input = True
+                elif child.id not in shared_names:
+                    return None
+        if not uses_input:
+            return None
+        return ast.dump(_CanonicalNames(inputs).visit(copy.deepcopy(node)))
+
+    def _term(self, key: str, node: ast.AST, inputs: Dict[str, Var], shared_names: Set[str],
+              shared_keys: Set[str]) -> SharedTerm:
+        if key in self._terms_by_key:
+            return self._terms_by_key[key]
+
+        # shared subexpressions inside this one are shared terms too
+        transformer = _SharedTermTransformer(self, inputs, shared_names, shared_keys, root_key=key)
+        canonical = _CanonicalNames(inputs).visit(transformer.visit(copy.deepcopy(node)))
+        name = f"_shared_{len(self.terms)}"
+        variables = {var: var.name for var in sorted(set(inputs.values())) if var.name in _names(canonical)}
+        term = SharedTerm(name, key, compile_expression(ast.unparse(canonical)), variables, self)
+        self.terms[name] = term
+        self._terms_by_key[key] = term
+        self.functions[name] = term
+        return term
+
+
+class _SharedTermTransformer(ast.NodeTransformer):
+    def __init__(self, shared: SharedSubexpressions, inputs: Dict[str, Var], shared_names: Set[str],
+                 shared_keys: Set[str], root_key: Optional[str] = None):
+        self.shared = shared
+        self.inputs = inputs
+        self.shared_names = shared_names
+        self.shared_keys = shared_keys
+        self.root_key = root_key
+        self.replaced = False
+
+    def visit(self, node: ast.AST) -> ast.AST:
+        key = SharedSubexpressions._key(node, self.inputs, self.shared_names)
+        if key is not None and key in self.shared_keys and key != self.root_key:
+            term = self.shared._term(key, node, self.inputs, self.shared_names, self.shared_keys)
+            self.replaced = True
+            return ast.copy_location(ast.Call(func=ast.Name(id=term.name, ctx=ast.Load()), args=[], keywords=[]),
+                                     node)
+        return self.generic_visit(node)
+
+
+class _CanonicalNames(ast.NodeTransformer):
+    """
+    Replace local input names with the name of the Expedition var they read
+    """
+
+    def __init__(self, inputs: Dict[str, Var]):
+        self.inputs = inputs
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.inputs:
+            return ast.copy_location(ast.Name(id=self.inputs[node.id].name, ctx=node.ctx), node)
+        return node
+
+
+def _names(node: ast.AST) -> Set[str]:
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+
@@ -0,0 +1,326 @@
+import ast
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from Expedition import Var, ExpeditionDLL
+
+from .models import Config, MathChannelConfig
+from .calculator import Calculator, RollingMathChannelCalculator
+from .buffers import DecimatedHistory, InputHistory
+from .expression import compile_expression
+from .cse import SharedSubexpressions
+from .snapshot import InputSnapshot
+from .outputs import OutputStage
+from .graph import channel_dependencies, evaluation_order
+from .scheduler import RateSchedule
+from .profiling import EngineStats
+
+__all__ = ["Engine"]
+
+logger = logging.getLogger(__name__)
+
+
+class Engine:
+    """
+    Evaluates every math channel of a config once per tick.
+
+    The inputs of all the channels are read from Expedition into a single snapshot at the start of each tick,
+    so every var is read once per tick however many channels use it. The outputs are collected in an output stage
+    and the ones that have changed are written back in a single call at the end of the tick.
+
+    A channel can use another channel's output var as an input. The channels are evaluated in dependency order
+    and the result is passed on in memory within the same tick, rather than read back from Expedition a tick later.
+
+    Subexpressions that appear in more than one channel, e.g. `cos(radians(twa))`, are evaluated once per tick
+    and shared by the channels that use them.
+
+    Channels can set their own `update_rate`, and rolling channels their own `sample_rate`. The engine ticks at
+    the fastest rate of any channel, or every `time_step` if that is faster, and only the channels that are due
+    run on each tick. Rates are rounded to a whole number of ticks. Channels without an update rate run every
+    `time_step`. A channel that reads the output of a slower channel gets the last value that channel computed.
+
+    Channels with an invalid expression are disabled: they are left out of the engine, with the error in
+    `disabled`, and the other channels run as usual. The calculators and results are those of the enabled channels,
+    `math_channels`, whose index in the config is in `channel_indices`.
+
+    Rolling channels that sample at the same rate share an InputHistory, so the history of each input is stored
+    once, at the length of the longest window, and is appended to once per sample whatever the number of channels.
+
+    Rolling channels with a `resolution` use a window over block averages of their inputs, from a DecimatedHistory
+    with blocks of one of the `tiers` lengths, in seconds. The inputs of these channels are read every tick and the
+    tier is pushed at the end of each block. A channel with a resolution of e.g. "5s" gets the coarsest tier with
+    blocks of 5 s or less, one with a resolution of "auto" the coarsest tier that leaves at least
+    `min_tier_samples` blocks in its window. If no tier fits, the channel samples its inputs as usual.
+
+    When the config changes, the new engine can be built from the `previous` one, which must no longer be ticking.
+    The histories of the inputs at each sample rate and tier are carried over, so a channel that is added or
+    changed, e.g. one whose window length has changed, starts with the samples already taken of its inputs rather
+    than a window of NaN. Channels whose config has not changed keep their calculator, with the state of their
+    window statistics, filters and error breaker, and their latest result. Nothing is carried over from an engine
+    of another Expedition.
+    """
+
+    def __init__(self,
+                 config: Config,
+                 expedition: ExpeditionDLL,
+                 time_step: float = 0.1,
+                 tiers: Sequence[float] = (1.0, 10.0),
+                 min_tier_samples: int = 100,
+                 previous: Optional['Engine'] = None):
+        """
+        :param config: Config
+        :param expedition: ExpeditionDLL
+        :param time_step: the longest time between ticks, in seconds
+        :param tiers: block lengths of the decimated histories, in seconds
+        :param min_tier_samples: least number of blocks in the window of a channel with a resolution of "auto"
+        :param previous: the engine this one replaces, whose histories and unchanged channels are carried over
+        :raises ChannelGraphError: if the channels can not be evaluated in order, before `previous` is changed
+        """
+        # channels with an invalid expression would fail on every tick, so they are never built
+        self.disabled: Dict[int, str] = {}
+        for index, math_channel in enumerate(config.math_channels):
+            error = math_channel.expression_error()
+            if error is not None:
+                self.disabled[index] = error
+        self.channel_indices: List[int] = [index for index in range(len(config.math_channels))
+                                           if index not in self.disabled]
+        self.math_channels: List[MathChannelConfig] = [config.math_channels[index] for index in self.channel_indices]
+        math_channels = self.math_channels
+        self.evaluation_order: List[int] = evaluation_order(math_channels)
+        if previous is not None and previous.expedition is not expedition:
+            previous = None
+        self.config = config
+        self.expedition = expedition
+        self.min_tier_samples = min_tier_samples
+        self.time_step = min([time_step] + [step for math_channel in math_channels
+                                            for step in (math_channel.update_time_step(time_step),
+                                                         math_channel.sample_time_step(time_step))])
+
+        update_periods = [self._period(math_channel.update_time_step(time_step))
+                          for math_channel in math_channels]
+        self.tier_blocks = sorted({self._period(tier) for tier in tiers} - {1})
+        blocks = [self._tier_block(math_channel) for math_channel in math_channels]
+        # plain channels read their inputs when they are evaluated, channels on a tier when the tier is pushed
+        sample_periods = [self._period(math_channel.sample_time_step(time_step))
+                          if math_channel.window_length and block is None else None
+                          for math_channel, block in zip(math_channels, blocks)]
+
+        # rolling channels that sample at the same rate share the history of their inputs
+        self.histories: Dict[int, InputHistory] = {
+            sample_period: (self._previous_history(previous, sample_period)
+                            or InputHistory(sample_period * self.time_step))
+            for sample_period in sorted(set(sample_periods) - {None})
+        }
+        # and channels at the same resolution the block averages, circular ones for heading channels
+        self.tiers: Dict[Tuple[int, bool], DecimatedHistory] = {}
+        self.tier_calculators: Dict[Tuple[int, bool], List[Calculator]] = {}
+        self.calculators: List[Calculator] = []
+        reusable: List[Calculator] = list(previous.calculators) if previous is not None else []
+        for math_channel, sample_period, block in zip(math_channels, sample_periods, blocks):
+            if block is not None:
+                key = (block, bool(math_channel.output_is_heading))
+                if key not in self.tiers:
+                    self.tiers[key] = (self._previous_tier(previous, block, key[1])
+                                       or DecimatedHistory(block * self.time_step, block, circular=key[1]))
+                    self.tier_calculators[key] = []
+                calculator = self._calculator(math_channel, block * self.time_step, self.tiers[key], reusable)
+                self.tier_calculators[key].append(calculator)
+            elif sample_period is not None:
+                calculator = self._calculator(math_channel, sample_period * self.time_step,
+                                              self.histories[sample_period], reusable)
+            else:
+                calculator = self._calculator(math_channel, self.time_step, None, reusable)
+            self.calculators.append(calculator)
+
+        # the histories carried over can still hold inputs of channels that have been removed or changed
+        windows = [calculator.window for calculator in self.calculators
+                   if isinstance(calculator, RollingMathChannelCalculator)]
+        for history in list(self.histories.values()) + list(self.tiers.values()):
+            history.retain(key for window in windows if window.history is history for key in window.keys.values())
+
+        tier_inputs = list(dict.fromkeys(var for tier in self.tiers.values() for var in tier.buffers))
+        self.schedule = RateSchedule(self.evaluation_order,
+                                     update_periods,
+                                     sample_periods,
+                                     [self._weight(calculator) for calculator in self.calculators],
+                                     [calculator.input_vars if block is None else ()
+                                      for calculator, block in zip(self.calculators, blocks)],
+                                     tick_inputs=tier_inputs)
+        # carry on counting the ticks at the same time step, so the channels keep the phase of their rates
+        same_step = previous is not None and math.isclose(previous.time_step, self.time_step)
+        self.ticks = previous.ticks if same_step else 0
+        previous_results = dict(zip(previous.calculators, previous.results)) if previous is not None else {}
+        self.results: List[float] = [previous_results.get(calculator, np.nan) for calculator in self.calculators]
+
+        # output vars that other channels read are passed on in memory
+        self.produced_vars: Set[Var] = {
+            math_channels[producer].output_expedition_var
+            for producers in channel_dependencies(math_channels).values()
+            for producer in producers
+        }
+        self.snapshot = InputSnapshot((var for calculator in self.calculators for var in calculator.input_vars),
+                                      produced=self.produced_vars)
+        for calculator, result in zip(self.calculators, self.results):
+            if calculator.output_var in self.produced_vars:
+                self.snapshot.set(calculator.output_var, result)
+        self.shared: Optional[SharedSubexpressions] = self._share_subexpressions()
+        self.outputs = OutputStage(refresh_ticks=max(int(round(1.0 / self.time_step)), 1))
+        self.profile = previous.profile if same_step else EngineStats(self.time_step)
+
+        if previous is not None:
+            kept = len(previous.calculators) - len(reusable)
+            logger.info("Reconfigured math channels, kept %d and built %d", kept, len(self.calculators) - kept)
+
+    def _period(self, step: float) -> int:
+        # number of ticks between runs of a channel that runs every `step` seconds
+        return max(int(round(step / self.time_step)), 1)
+
+    def _previous_history(self, previous: Optional['Engine'], sample_period: int) -> Optional[InputHistory]:
+        # the previous engine's history at the same sample rate, if it had one
+        if previous is None:
+            return None
+        return next((history for history in previous.histories.values()
+                     if math.isclose(history.time_step, sample_period * self.time_step)), None)
+
+    def _previous_tier(self, previous: Optional['Engine'], block: int, circular: bool) -> Optional[DecimatedHistory]:
+        # the previous engine's tier with the same blocks, if it had one
+        if previous is None:
+            return None
+        return next((tier for tier in previous.tiers.values()
+                     if math.isclose(tier.time_step, block * self.time_step) and tier.block_length == block
+                     and tier.circular == circular), None)
+
+    def _calculator(self,
+                    math_channel: MathChannelConfig,
+                    time_step: float,
+                    history: Optional[InputHistory],
+                    reusable: List[Calculator]) -> Calculator:
+        # reuse the previous calculator of a channel that has not changed and still has the same history
+        for index, calculator in enumerate(reusable):
+            window_history = calculator.window.history if isinstance(calculator, RollingMathChannelCalculator) else None
+            if calculator.config == math_channel and window_history is history:
+                del reusable[index]
+                # its subexpressions are shared again with the new set of channels
+                calculator.restore_compiled_expression()
+                return calculator
+        return Calculator.from_config(math_channel, self.expedition, time_step, history)
+
+    def _tier_block(self, math_channel: MathChannelConfig) -> Optional[int]:
+        # number of ticks in the blocks of the tier the channel uses, None if it does not use one
+        if not math_channel.window_length or not math_channel.resolution:
+            return None
+        duration = math_channel.window_length_time_delta.total_seconds()
+        if math_channel.resolution == "auto":
+            blocks = [block for block in self.tier_blocks
+                      if duration / (block * self.time_step) >= self.min_tier_samples]
+        else:
+            resolution = math_channel.resolution_time_delta.total_seconds()
+            blocks = [block for block in self.tier_blocks if block * self.time_step <= resolution * (1 + 1e-9)]
+        return max(blocks) if blocks else None
+
+    @staticmethod
+    def _weight(calculator: Calculator) -> float:
+        # rough relative cost of an evaluation, rolling channels that use whole windows cost more the longer
+        # the window. About a hundred window samples cost as much as a plain expression
+        if isinstance(calculator, RollingMathChannelCalculator):
+            return 1.0 + len(calculator.windowed_names) * calculator.buffer_length / 100
+        return 1.0
+
+    def _share_subexpressions(self) -> Optional[SharedSubexpressions]:
+        # rolling channels evaluate over windows rather than the latest values, so only share between plain channels
+        calculators = [
+            calculator for calculator in self.calculators
+            if not isinstance(calculator, RollingMathChannelCalculator) and calculator.compiled_expression is not None
+        ]
+        if len(calculators) < 2:
+            return None
+
+        shared = SharedSubexpressions(self.snapshot, calculators[0].functions, calculators[0].variables)
+        rewritten = shared.rewrite([
+            {'tree': calculator.compiled_expression.tree,
+             'inputs': {i.local_var_name: i.expedition_var for i in calculator.inputs},
+             'functions': calculator.functions}
+            for calculator in calculators
+        ])
+        for calculator, tree in zip(calculators, rewritten):
+            if tree is not None:
+                calculator.use_compiled_expression(compile_expression(ast.unparse(tree)), shared.terms)
+        return shared if shared.terms else None
+
+    def tick(self, timestamp: Optional[float] = None) -> List[float]:
+        """
+        Read the inputs and evaluate the channels that are due
+        :param timestamp: time.monotonic() time of the tick, now if None
+        :return: the latest result of each enabled channel, in the same order as the calculators
+        """
+        started = time.perf_counter()
+        scheduled = self.schedule.due(self.ticks)
+        histories = [history for period, history in self.histories.items() if self.ticks % period == 0]
+        self.ticks += 1
+        self.snapshot.read(self.expedition, timestamp, scheduled.variables)
+        read = time.perf_counter()
+        self.profile.read.record(read - started)
+        for history in histories:
+            history.push(self.snapshot.timestamp, self.snapshot)
+        if self.shared is not None:
+            self.shared.new_tick()
+        for index, evaluate, sample in scheduled.channels:
+            calculator = self.calculators[index]
+            channel_started = time.perf_counter()
+            if not evaluate:
+                calculator.sample(self.snapshot)
+                calculator.stats.sample_time += time.perf_counter() - channel_started
+                continue
+            result = calculator.calculate(self.snapshot, self.outputs, sample)
+            if calculator.output_var in self.produced_vars:
+                self.snapshot.set(calculator.output_var, result)
+                self._update_histories(histories, calculator, result)
+            self.results[index] = result
+            calculator.stats.time.record(time.perf_counter() - channel_started)
+
+        # the tiers average the inputs at the end of the tick, once the outputs of the channels are known
+        for key, tier in self.tiers.items():
+            if tier.accumulate(self.snapshot.timestamp, self.snapshot):
+                for calculator in self.tier_calculators[key]:
+                    channel_started = time.perf_counter()
+                    calculator.sample(self.snapshot)
+                    calculator.stats.sample_time += time.perf_counter() - channel_started
+        flushed = time.perf_counter()
+        self.outputs.flush(self.expedition)
+        finished = time.perf_counter()
+        self.profile.write.record(finished - flushed)
+        self.profile.record_tick(finished - started)
+        return list(self.results)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        The profile of the ticks since the engine was built or its stats were reset. Durations are in seconds, the
+        shared subexpressions are timed as part of the first channel to use them in a tick.
+        :return: counts of ticks and overruns, summaries of the tick, read and write durations, and for each channel
+                 in the same order as the calculators its name, counts, error rate and evaluation durations
+        """
+        stats = self.profile.summary()
+        stats['channels'] = [dict(name=calculator.name, **calculator.stats.summary())
+                             for calculator in self.calculators]
+        return stats
+
+    def reset_stats(self):
+        """
+        Start the profile again
+        """
+        self.profile.reset()
+        for calculator in self.calculators:
+            calculator.stats.reset()
+
+    @staticmethod
+    def _update_histories(histories: List[InputHistory], calculator: Calculator, result: float):
+        # the histories were pushed before the channel was evaluated, so replace its output with the new result.
+        # A channel that windows its own output has already taken in the previous value, so leave that in place
+        if calculator.output_var in calculator.input_vars:
+            return
+        for history in histories:
+            if calculator.output_var in history.buffers:
+                history.set_newest(calculator.output_var, result)
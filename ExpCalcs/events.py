@@ -0,0 +1,24 @@
+from typing import Callable, List
+
+__all__ = ["Event"]
+
+
+class Event:
+    """
+    A minimal callback list with the same connect/emit interface as a Qt signal, so that the engine does not depend
+    on Qt. Callbacks are called synchronously in the thread that emits the event.
+    """
+
+    def __init__(self):
+        self._callbacks: List[Callable] = []
+
+    def connect(self, callback: Callable):
+        self._callbacks.append(callback)
+
+    def disconnect(self, callback: Callable):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def emit(self, *args):
+        for callback in self._callbacks:
+            callback(*args)
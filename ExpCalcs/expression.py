@@ -0,0 +1,62 @@
+import ast
+import functools
+from typing import Any, Dict, FrozenSet
+
+__all__ = ["ExpressionError", "CompiledExpression", "compile_expression", "clear_expression_cache"]
+
+
+class ExpressionError(ValueError):
+    """
+    Raised when a math channel expression cannot be parsed or compiled
+    """
+
+
+class CompiledExpression:
+    """
+    A math channel expression that has been parsed and compiled once, ready to be evaluated every tick.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            self.tree = ast.parse(text.strip(), mode='eval')
+            self.code = compile(self.tree, f"<expression: {text}>", 'eval')
+        except (SyntaxError, ValueError) as e:
+            raise ExpressionError(f"Invalid expression '{text}': {e}") from e
+
+        self.names: FrozenSet[str] = frozenset(
+            node.id for node in ast.walk(self.tree) if isinstance(node, ast.Name)
+        )
+
+    def evaluate(self, variables: Dict[str, Any], functions: Dict[str, Any]) -> Any:
+        """
+        Evaluate the compiled expression
+        :param variables: a dictionary of variable names and their values
+        :param functions: a dictionary of function names available to the expression
+        :return: the result of the expression
+        """
+        return eval(self.code, variables, functions)
+
+    def __repr__(self):
+        return f"CompiledExpression({self.text!r})"
+
+
+# Process wide cache so that channels sharing the same expression text only compile it once. It is bounded, as
+# every reconfiguration of the channels adds the texts of their rewritten expressions, e.g. by the statistics,
+# the filters and the shared subexpressions, and the ones that are no longer used are dropped first
+@functools.lru_cache(maxsize=1024)
+def compile_expression(text: str) -> CompiledExpression:
+    """
+    Compile an expression, reusing a previously compiled expression with the same text
+    :param text: the expression text
+    :return: CompiledExpression
+    :raises ExpressionError: if the expression is not valid
+    """
+    return CompiledExpression(text)
+
+
+def clear_expression_cache():
+    """
+    Remove all compiled expressions from the process wide cache
+    """
+    compile_expression.cache_clear()
@@ -0,0 +1,238 @@
+import ast
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, Optional, Type
+
+import numpy as np
+
+__all__ = ["Filter", "LowPass", "HighPass", "LowPass2", "HighPass2", "Derivative", "Delay", "FILTERS",
+           "StatefulFilters"]
+
+
+def _scalar(x: Any) -> float:
+    if np.ndim(x) == 0:
+        return float(x)
+    if np.size(x) == 1:
+        return float(np.asarray(x).item())
+    raise ValueError(f"filters take a single value, not an array of size {np.size(x)}")
+
+
+class Filter(ABC):
+    """
+    The state of one filter call in an expression, kept from one evaluation to the next.
+
+    Filters use the time of the evaluation, so they work at any update rate and with uneven ticks. A NaN input
+    gives a NaN result and leaves the state as it was. Evaluating again at the same time gives the same result.
+    """
+
+    stateful = True  # not to be shared between channels, or evaluated more than once per tick
+
+    def __init__(self, owner: 'StatefulFilters'):
+        self.owner = owner
+
+    @abstractmethod
+    def __call__(self, x: Any, *args: Any) -> float:
+        pass
+
+    def reset(self):
+        """
+        Forget the state, as if the filter had never been evaluated
+        """
+
+
+class LowPass(Filter):
+    """
+    First order low-pass filter, an exponential moving average with time constant `tau` seconds: `ema(x, tau)`
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self.reset()
+
+    def reset(self):
+        self._value: Optional[float] = None
+        self._time = 0.0
+
+    def __call__(self, x: Any, tau: float = 1.0) -> float:
+        x = _scalar(x)
+        if math.isnan(x):
+            return np.nan
+        now = self.owner.time
+        if self._value is None:
+            self._value = x
+        elif now > self._time:
+            alpha = 1.0 - math.exp(-(now - self._time) / tau) if tau > 0 else 1.0
+            self._value += alpha * (x - self._value)
+        self._time = now
+        return self._value
+
+
+class HighPass(Filter):
+    """
+    First order high-pass filter with time constant `tau` seconds, the input less its low-pass: `highpass(x, tau)`
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self._low_pass = LowPass(owner)
+
+    def reset(self):
+        self._low_pass.reset()
+
+    def __call__(self, x: Any, tau: float = 1.0) -> float:
+        x = _scalar(x)
+        return x - self._low_pass(x, tau)
+
+
+class LowPass2(Filter):
+    """
+    Second order, critically damped low-pass filter, two first order stages in series: `lowpass2(x, tau)`
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self._stages = (LowPass(owner), LowPass(owner))
+
+    def reset(self):
+        for stage in self._stages:
+            stage.reset()
+
+    def __call__(self, x: Any, tau: float = 1.0) -> float:
+        return self._stages[1](self._stages[0](x, tau), tau)
+
+
+class HighPass2(Filter):
+    """
+    Second order high-pass filter, two first order stages in series: `highpass2(x, tau)`
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self._stages = (HighPass(owner), HighPass(owner))
+
+    def reset(self):
+        for stage in self._stages:
+            stage.reset()
+
+    def __call__(self, x: Any, tau: float = 1.0) -> float:
+        return self._stages[1](self._stages[0](x, tau), tau)
+
+
+class Derivative(Filter):
+    """
+    Rate of change per second since the last valid input: `deriv(x)`. NaN until there are two inputs.
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self.reset()
+
+    def reset(self):
+        self._previous: Optional[float] = None
+        self._time = 0.0
+        self._rate = np.nan
+
+    def __call__(self, x: Any) -> float:
+        x = _scalar(x)
+        if math.isnan(x):
+            return np.nan
+        now = self.owner.time
+        if self._previous is not None and now > self._time:
+            self._rate = (x - self._previous) / (now - self._time)
+        if self._previous is None or now > self._time:
+            self._previous = x
+            self._time = now
+        return self._rate
+
+
+class Delay(Filter):
+    """
+    The input as it was `seconds` ago: `delay(x, seconds)`. NaN until the filter has run for that long.
+
+    Unlike the other filters it keeps every input that is less than `seconds` old, so its memory grows with the
+    delay, but each evaluation is still O(1).
+    """
+
+    def __init__(self, owner: 'StatefulFilters'):
+        super().__init__(owner)
+        self.reset()
+
+    def reset(self):
+        self._inputs = deque()  # (time, value), oldest first
+
+    def __call__(self, x: Any, seconds: float = 1.0) -> float:
+        x = _scalar(x)
+        now = self.owner.time
+        if self._inputs and self._inputs[-1][0] >= now:
+            self._inputs[-1] = (now, x)
+        else:
+            self._inputs.append((now, x))
+
+        cutoff = now - seconds
+        # drop the inputs that are older than the newest one at least `seconds` old
+        while len(self._inputs) > 1 and self._inputs[1][0] <= cutoff:
+            self._inputs.popleft()
+        time, value = self._inputs[0]
+        return value if time <= cutoff else np.nan
+
+
+# expression function name -> filter
+FILTERS: Dict[str, Type[Filter]] = {
+    'ema': LowPass,
+    'lowpass': LowPass,
+    'highpass': HighPass,
+    'lowpass2': LowPass2,
+    'highpass2': HighPass2,
+    'deriv': Derivative,
+    'delay': Delay,
+}
+
+
+class StatefulFilters:
+    """
+    The filters of a math channel's expression.
+
+    Every call to a filter function in the expression gets a filter of its own, so `ema(bsp, 5) - ema(bsp, 60)`
+    keeps two independent states. The calls are renamed, e.g. to `_ema_0(bsp, 5)`, and the filters are added to
+    the channel's functions under those names. Set `time` to the time of each evaluation before evaluating.
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self.filters: Dict[str, Filter] = {}
+
+    def rewrite(self, tree: ast.Expression) -> Optional[ast.Expression]:
+        """
+        Give every filter call in an expression its own filter
+        :param tree: the parsed expression
+        :return: the rewritten expression, or None if it has no filter calls
+        """
+        transformer = _FilterTransformer(self)
+        rewritten = transformer.visit(ast.parse(ast.unparse(tree), mode='eval'))
+        return ast.fix_missing_locations(rewritten) if transformer.replaced else None
+
+    def reset(self):
+        """
+        Reset the state of every filter
+        """
+        for f in self.filters.values():
+            f.reset()
+
+    def _add(self, function_name: str) -> str:
+        name = f"_{function_name}_{len(self.filters)}"
+        self.filters[name] = FILTERS[function_name](self)
+        return name
+
+
+class _FilterTransformer(ast.NodeTransformer):
+    def __init__(self, filters: StatefulFilters):
+        self.filters = filters
+        self.replaced = False
+
+    def visit_Call(self, node: ast.Call):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in FILTERS:
+            node.func = ast.copy_location(ast.Name(id=self.filters._add(node.func.id), ctx=ast.Load()), node.func)
+            self.replaced = True
+        return node
@@ -0,0 +1,83 @@
+from typing import Dict, List, Sequence, Set
+
+from Expedition import Var
+
+from .models import MathChannelConfig
+
+__all__ = ["ChannelGraphError", "channel_producers", "channel_dependencies", "evaluation_order"]
+
+
+class ChannelGraphError(ValueError):
+    """
+    Raised when the dependencies between math channels can not be resolved
+    """
+
+
+def channel_producers(math_channels: Sequence[MathChannelConfig]) -> Dict[Var, List[int]]:
+    """
+    Find which channels write to each Expedition var
+    :param math_channels: the math channels of a config
+    :return: output var -> indices of the channels that write to it
+    """
+    producers: Dict[Var, List[int]] = {}
+    for index, math_channel in enumerate(math_channels):
+        producers.setdefault(math_channel.output_expedition_var, []).append(index)
+    return producers
+
+
+def channel_dependencies(math_channels: Sequence[MathChannelConfig]) -> Dict[int, Set[int]]:
+    """
+    Find the channels each channel depends on. A channel depends on another channel if one of its inputs is the
+    other channel's output var. A channel that reads its own output var reads the previous tick's value, so this is
+    not a dependency.
+    :param math_channels: the math channels of a config
+    :return: channel index -> indices of the channels it depends on
+    :raises ChannelGraphError: if a channel reads a var that more than one channel writes to
+    """
+    producers = channel_producers(math_channels)
+    dependencies: Dict[int, Set[int]] = {}
+    for index, math_channel in enumerate(math_channels):
+        dependencies[index] = set()
+        for input_var in math_channel.inputs:
+            var_producers = [p for p in producers.get(input_var.expedition_var, []) if p != index]
+            if len(var_producers) > 1:
+                names = ", ".join(math_channels[p].name for p in var_producers)
+                raise ChannelGraphError(f"Channel '{math_channel.name}' reads {input_var.expedition_var.name}, "
+                                        f"which is written by more than one channel ({names})")
+            dependencies[index].update(var_producers)
+    return dependencies
+
+
+def evaluation_order(math_channels: Sequence[MathChannelConfig]) -> List[int]:
+    """
+    Order the channels so that every channel is evaluated after the channels it depends on, otherwise keeping
+    the order of the config.
+    :param math_channels: the math channels of a config
+    :return: channel indices in evaluation order
+    :raises ChannelGraphError: if the channel dependencies contain a cycle
+    """
+    dependencies = channel_dependencies(math_channels)
+    remaining = {index: set(depends_on) for index, depends_on in dependencies.items()}
+    order: List[int] = []
+    while remaining:
+        ready = [index for index, depends_on in remaining.items() if not depends_on]
+        if not ready:
+            cycle = _describe_cycle(remaining, math_channels)
+            raise ChannelGraphError(f"Math channels have a circular dependency: {cycle}")
+        for index in ready:
+            order.append(index)
+            del remaining[index]
+        for depends_on in remaining.values():
+            depends_on.difference_update(ready)
+    return order
+
+
+def _describe_cycle(remaining: Dict[int, Set[int]], math_channels: Sequence[MathChannelConfig]) -> str:
+    # walk the dependencies of the unresolved channels until a channel repeats
+    path = [next(iter(remaining))]
+    while True:
+        step = next(iter(remaining[path[-1]]))
+        if step in path:
+            cycle = path[path.index(step):] + [step]
+            return " -> ".join(math_channels[index].name for index in cycle)
+        path.append(step)
@@ -1,12 +1,14 @@
+import logging
 from enum import Enum
-from typing import List, Optional, Any
-from pydantic import BaseModel, field_validator
+from typing import List, Optional, Any, Tuple
+from pydantic import BaseModel, field_validator, model_validator
 from Expedition import Var
-import pandas as pd
 from datetime import timedelta
 
 __all = ["ExpeditionConfig", "GcpConfig", "ChannelConfig", "GroupConfig", "Config"]
 
+logger = logging.getLogger(__name__)
+
 
 class InputVar(BaseModel):
     expedition_var_enum_string: str
@@ -37,6 +39,11 @@ class MathChannelConfig(BaseModel):
     inputs: List[InputVar]
     output_is_heading: Optional[bool] = False
     window_length: Optional[str] = None # e.g. "1s", "5m", "1h"
+    output_deadband: Optional[float] = None  # changes smaller than this are not written to Expedition
+    update_rate: Optional[float] = None  # Hz, how often the channel is evaluated, the engine's tick rate if None
+    sample_rate: Optional[float] = None  # Hz, how often inputs are added to the window, the update rate if None
+    resolution: Optional[str] = None  # e.g. "1s" or "auto", window over block averages of the inputs if set
+    polar_file: Optional[str] = None  # polar for polar_bsp(), target_twa() and target_bsp()
 
     @field_validator('output_expedition_var_enum_string')
     @classmethod
@@ -45,6 +52,36 @@ class MathChannelConfig(BaseModel):
             raise ValueError(f"{v} is not a valid Var")
         return v
 
+    @field_validator('update_rate', 'sample_rate')
+    @classmethod
+    def rate_is_positive(cls, v: Optional[float]) -> Optional[float]:
+        if v is not None and not v > 0:
+            raise ValueError(f"{v} is not a valid rate, it must be greater than 0 Hz")
+        return v
+
+    @field_validator('resolution')
+    @classmethod
+    def resolution_is_valid(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and v != "auto":
+            import pandas as pd
+            try:
+                seconds = pd.to_timedelta(v).total_seconds()
+            except ValueError:
+                raise ValueError(f"{v} is not a valid resolution, e.g. 1s, 10s or auto")
+            if not seconds > 0:
+                raise ValueError(f"{v} is not a valid resolution, it must be longer than 0s")
+        return v
+
+    def expression_error(self) -> Optional[str]:
+        """
+        Check the expression without evaluating it, for unknown names, wrong numbers of arguments and windows that
+        are never reduced. A channel with an invalid expression is disabled rather than failing on every tick
+        :return: what is wrong with the expression, None if it is valid
+        """
+        from .validation import expression_error
+        return expression_error(self.expression, tuple(input_var.local_var_name for input_var in self.inputs),
+                                windowed=bool(self.window_length), polar=bool(self.polar_file))
+
     @property
     def output_expedition_var(self) -> Var:
         # convert the string to the enum
@@ -59,10 +96,55 @@ class MathChannelConfig(BaseModel):
         if self.window_length is None:
             return None
         else:
+            # pandas is slow to import and only needed here, so import it on first use
+            import pandas as pd
             return pd.to_timedelta(self.window_length)
 
+    @property
+    def resolution_time_delta(self) -> Optional[timedelta]:
+        if self.resolution is None or self.resolution == "auto":
+            return None
+        else:
+            import pandas as pd
+            return pd.to_timedelta(self.resolution)
+
+    def update_time_step(self, default: float) -> float:
+        """
+        :param default: the engine's tick time step
+        :return: time between evaluations of the channel, in seconds
+        """
+        return 1.0 / self.update_rate if self.update_rate else default
+
+    def sample_time_step(self, default: float) -> float:
+        """
+        :param default: the engine's tick time step
+        :return: time between samples added to the channel's window, in seconds
+        """
+        return 1.0 / self.sample_rate if self.sample_rate else self.update_time_step(default)
+
 class Config(BaseModel):
     expedition: ExpeditionConfig
     boat: Optional[int] = 0
     math_channels: List[MathChannelConfig]
 
+    @model_validator(mode='after')
+    def report_invalid_math_channels(self) -> 'Config':
+        # an invalid expression only disables its own channel, the other channels of the config still run
+        for math_channel, error in self.invalid_math_channels():
+            logger.warning("Math channel '%s' is disabled: %s", math_channel.name, error)
+        return self
+
+    def invalid_math_channels(self) -> List[Tuple[MathChannelConfig, str]]:
+        """
+        :return: the math channels whose expression is not valid, with what is wrong with it
+        """
+        errors = [(math_channel, math_channel.expression_error()) for math_channel in self.math_channels]
+        return [(math_channel, error) for math_channel, error in errors if error is not None]
+
+    @model_validator(mode='after')
+    def math_channel_dependencies_are_valid(self) -> 'Config':
+        # channels can read each other's output vars, check that they can be evaluated in order
+        from .graph import evaluation_order
+        evaluation_order(self.math_channels)
+        return self
+
@@ -0,0 +1,64 @@
+import math
+from typing import Dict, Tuple
+
+from Expedition import Var, ExpeditionDLL
+
+__all__ = ["OutputStage"]
+
+
+class OutputStage:
+    """
+    Collects the channel outputs of a tick and writes them to Expedition in a single batched call.
+
+    An output is only written if it has changed by more than its deadband since it was last written, or if it
+    has not been written for `refresh_ticks` ticks, so that Expedition still picks up slow moving channels.
+    """
+
+    def __init__(self, refresh_ticks: int = 10):
+        self.refresh_ticks = refresh_ticks
+        self._pending: Dict[Var, Tuple[float, float, bool]] = {}
+        self._written: Dict[Var, float] = {}
+        self._ticks_since_written: Dict[Var, int] = {}
+
+    def set(self, var: Var, value: float, deadband: float = 0.0, heading: bool = False):
+        """
+        Stage an output value to be written at the end of the tick
+        :param var: the output var
+        :param value: the output value
+        :param deadband: changes smaller than or equal to this are not written
+        :param heading: if True the change is measured the short way around the compass
+        """
+        self._pending[var] = (value, deadband, heading)
+
+    def _has_changed(self, var: Var, value: float, deadband: float, heading: bool) -> bool:
+        if var not in self._written:
+            return True
+        last_value = self._written[var]
+        if math.isnan(value) or math.isnan(last_value):
+            return math.isnan(value) != math.isnan(last_value)
+        change = abs(value - last_value)
+        if heading:
+            change = min(change % 360.0, 360.0 - change % 360.0)
+        return change > deadband
+
+    def flush(self, expedition: ExpeditionDLL) -> int:
+        """
+        Write the staged outputs that need writing to Expedition
+        :param expedition: ExpeditionDLL
+        :return: the number of vars written
+        """
+        variables = []
+        values = []
+        for var, (value, deadband, heading) in self._pending.items():
+            ticks_since_written = self._ticks_since_written.get(var, 0) + 1
+            if ticks_since_written >= self.refresh_ticks or self._has_changed(var, value, deadband, heading):
+                variables.append(var)
+                values.append(value)
+                self._written[var] = value
+                ticks_since_written = 0
+            self._ticks_since_written[var] = ticks_since_written
+        self._pending.clear()
+
+        if variables:
+            expedition.set_exp_vars(variables, values)
+        return len(variables)
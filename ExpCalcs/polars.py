@@ -0,0 +1,235 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ["PolarError", "Polar", "load_polar", "clear_polar_cache"]
+
+logger = logging.getLogger(__name__)
+
+
+class PolarError(ValueError):
+    """
+    Raised when a polar file cannot be read
+    """
+
+
+class Polar:
+    """
+    A boat's polar, resampled onto a regular grid of TWS and TWA so that every lookup is an O(1) bilinear
+    interpolation. The lookups take scalars or numpy arrays, e.g. the windows of a rolling channel.
+
+    Below the lowest TWA of each TWS the speed falls linearly to 0 at 0 TWA, above the highest TWA it stays the
+    same. Below the lowest TWS it falls linearly to 0 at 0 TWS, above the highest TWS it stays the same. TWA can be
+    signed or in the range [0, 360), only the angle off the wind is used.
+
+    The upwind and downwind targets, the TWA with the best VMG towards and away from the wind, are found for every
+    TWS of the grid when the polar is loaded. They are only looked for between the lowest and highest TWA of the
+    polar, a side with no angles of the polar has NaN targets.
+    """
+
+    def __init__(self, rows: Sequence[Tuple[float, Sequence[float], Sequence[float]]],
+                 tws_step: float = 0.5, twa_step: float = 0.5):
+        """
+        :param rows: for each TWS, (tws, twa of each point, boat speed of each point)
+        :param tws_step: TWS spacing of the grid, in knots
+        :param twa_step: TWA spacing of the grid, in degrees
+        """
+        rows = sorted((float(tws), np.asarray(twa, dtype=float), np.asarray(bsp, dtype=float))
+                      for tws, twa, bsp in rows if len(twa))
+        if not rows:
+            raise PolarError("The polar has no boat speeds")
+        self.tws_step = tws_step
+        self.twa_step = twa_step
+        self.tws = np.arange(0.0, rows[-1][0] + tws_step / 2, tws_step)
+        self.twa = np.arange(0.0, 180.0 + twa_step / 2, twa_step)
+
+        # resample each row over TWA, then each TWA over TWS
+        row_tws = [0.0]
+        row_bsp = [np.zeros(self.twa.size)]
+        row_min_twa = [rows[0][1].min()]
+        row_max_twa = [rows[0][1].max()]
+        for tws, twa, bsp in rows:
+            order = np.argsort(twa)
+            row_tws.append(tws)
+            row_min_twa.append(twa.min())
+            row_max_twa.append(twa.max())
+            row_bsp.append(np.interp(self.twa, np.concatenate(([0.0], twa[order])), np.concatenate(([0.0], bsp[order]))))
+        row_bsp = np.array(row_bsp)
+        self.grid = np.array([np.interp(self.tws, row_tws, row_bsp[:, j]) for j in range(self.twa.size)]).T
+
+        # the targets are only looked for among the angles of the polar, not the speeds made up below and above them
+        vmg = self.grid * np.cos(np.radians(self.twa))
+        upwind = (self.twa < 90.0) & (self.twa >= np.interp(self.tws, row_tws, row_min_twa)[:, np.newaxis])
+        downwind = (self.twa >= 90.0) & (self.twa <= np.interp(self.tws, row_tws, row_max_twa)[:, np.newaxis])
+        upwind_index = np.argmax(np.where(upwind, vmg, -np.inf), axis=1)
+        downwind_index = np.argmin(np.where(downwind, vmg, np.inf), axis=1)
+        found = np.stack((downwind.any(axis=1), upwind.any(axis=1)))
+        self._target_twa = np.where(found, np.stack((self.twa[downwind_index], self.twa[upwind_index])), np.nan)
+        self._target_bsp = np.where(found, np.stack((self.grid[np.arange(self.tws.size), downwind_index],
+                                                     self.grid[np.arange(self.tws.size), upwind_index])), np.nan)
+
+    def _position(self, values, step: float, size: int):
+        # index of the grid cell and how far along it each value is, NaN values are looked up as 0 and masked later
+        position = np.clip(np.nan_to_num(np.asarray(values, dtype=float)) / step, 0.0, size - 1)
+        index = np.minimum(position.astype(int), max(size - 2, 0))
+        return index, position - index
+
+    @staticmethod
+    def _result(values: np.ndarray, *inputs):
+        invalid = np.zeros(np.shape(values), dtype=bool)
+        for x in inputs:
+            invalid = invalid | np.isnan(np.asarray(x, dtype=float))
+        values = np.where(invalid, np.nan, values)
+        return float(values) if np.ndim(values) == 0 else values
+
+    def bsp(self, tws, twa):
+        """
+        Polar boat speed
+        :param tws: true wind speed in knots
+        :param twa: true wind angle in degrees
+        :return: boat speed in knots
+        """
+        angle = np.abs(np.mod(np.asarray(twa, dtype=float) + 180.0, 360.0) - 180.0)
+        i, fi = self._position(tws, self.tws_step, self.tws.size)
+        j, fj = self._position(angle, self.twa_step, self.twa.size)
+        grid = self.grid
+        if grid.shape[0] == 1:
+            i, fi = np.zeros_like(i), np.zeros_like(fi)
+            grid = np.vstack((grid, grid))
+        values = ((grid[i, j] * (1 - fj) + grid[i, j + 1] * fj) * (1 - fi)
+                  + (grid[i + 1, j] * (1 - fj) + grid[i + 1, j + 1] * fj) * fi)
+        return self._result(values, tws, twa)
+
+    def _target(self, table: np.ndarray, tws, upwind):
+        i, fi = self._position(tws, self.tws_step, self.tws.size)
+        side = np.asarray(upwind, dtype=bool).astype(int)
+        if self.tws.size == 1:
+            values = table[side, 0] + 0 * fi
+        else:
+            values = table[side, i] * (1 - fi) + table[side, i + 1] * fi
+        return self._result(values, tws)
+
+    def target_twa(self, tws, upwind=True):
+        """
+        TWA with the best VMG
+        :param tws: true wind speed in knots
+        :param upwind: the upwind target if true, otherwise the downwind one
+        :return: target TWA in degrees, in the range [0, 180]
+        """
+        return self._target(self._target_twa, tws, upwind)
+
+    def target_bsp(self, tws, upwind=True):
+        """
+        Boat speed at the target TWA
+        :param tws: true wind speed in knots
+        :param upwind: the upwind target if true, otherwise the downwind one
+        :return: target boat speed in knots
+        """
+        return self._target(self._target_bsp, tws, upwind)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'Polar':
+        """
+        Read a polar file. Two layouts are understood, separated by tabs, spaces, commas or semicolons, with
+        comment lines starting with ! or #:
+
+        - a table with a header row of TWS and a row for each TWA, e.g. `twa/tws 6 8 10` then `52 5.6 6.4 6.9`
+        - the Expedition layout, a line for each TWS followed by TWA and boat speed pairs, e.g. `6 45 5.2 60 5.9`
+
+        :param path: path of the file
+        :return: Polar
+        :raises PolarError: if the file cannot be read
+        """
+        try:
+            with open(path) as f:
+                lines = [re.split(r"[\s,;]+", line.strip()) for line in f]
+        except OSError as e:
+            raise PolarError(f"Error reading polar file '{path}': {e}") from e
+        lines = [line for line in lines if line and line[0] and not line[0].startswith(('!', '#'))]
+        if not lines:
+            raise PolarError(f"Polar file '{path}' is empty")
+
+        try:
+            if _is_number(lines[0][0]):
+                rows = _read_lines(lines)
+            else:
+                rows = _read_table(lines)
+            return cls(rows, **kwargs)
+        except (ValueError, IndexError) as e:
+            raise PolarError(f"Error reading polar file '{path}': {e}") from e
+
+
+def _is_number(text: str) -> bool:
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _speed(text: str) -> float:
+    # empty cells and speeds of 0 are points missing from the polar
+    value = float(text) if text else np.nan
+    return value if value > 0 else np.nan
+
+
+def _read_table(lines: List[List[str]]) -> List[Tuple[float, List[float], List[float]]]:
+    tws = [float(text) for text in lines[0][1:]]
+    points: Dict[int, Tuple[List[float], List[float]]] = {column: ([], []) for column in range(len(tws))}
+    for line in lines[1:]:
+        twa = float(line[0])
+        for column, text in enumerate(line[1:len(tws) + 1]):
+            bsp = _speed(text)
+            if not np.isnan(bsp):
+                points[column][0].append(twa)
+                points[column][1].append(bsp)
+    return [(tws[column], twa, bsp) for column, (twa, bsp) in points.items()]
+
+
+def _read_lines(lines: List[List[str]]) -> List[Tuple[float, List[float], List[float]]]:
+    rows = []
+    for line in lines:
+        values = [float(text) for text in line]
+        pairs = [(twa, bsp) for twa, bsp in zip(values[1::2], values[2::2]) if bsp > 0]
+        rows.append((values[0], [twa for twa, _ in pairs], [bsp for _, bsp in pairs]))
+    return rows
+
+
+# Process wide cache so that channels referencing the same polar file only load it once. Each file keeps a single
+# entry, with the modification time it was loaded at, which is replaced when the file changes
+_polar_cache: Dict[str, Tuple[float, Polar]] = {}
+_polar_cache_lock = threading.Lock()
+
+
+def load_polar(path: str) -> Polar:
+    """
+    Load a polar file, reusing the polar already loaded from the same file unless the file has changed since
+    :param path: path of the file
+    :return: Polar
+    :raises PolarError: if the file cannot be read
+    """
+    path = os.path.abspath(path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError as e:
+        raise PolarError(f"Error reading polar file '{path}': {e}") from e
+    with _polar_cache_lock:
+        cached = _polar_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        polar = Polar.from_file(path)
+        logger.info("Loaded polar %s, TWS up to %s kn", path, polar.tws[-1])
+        _polar_cache[path] = (mtime, polar)
+    return polar
+
+
+def clear_polar_cache():
+    """
+    Remove all loaded polars from the process wide cache
+    """
+    with _polar_cache_lock:
+        _polar_cache.clear()
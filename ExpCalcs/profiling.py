@@ -0,0 +1,153 @@
+import bisect
+from typing import Any, Dict, List
+
+import numpy as np
+
+__all__ = ["LatencyHistogram", "ChannelStats", "EngineStats"]
+
+
+class LatencyHistogram:
+    """
+    Counts of durations in logarithmic buckets, `buckets_per_decade` to a decade from `minimum` to `maximum`
+    seconds. Recording a duration is a binary search of the bucket edges, so it is cheap enough to do for every
+    channel on every tick. Percentiles are the upper edge of their bucket, so with 10 buckets to a decade they are at
+    most 26% high.
+
+    The histogram is recorded by the engine's worker thread and can be read from any other thread. A reader can see
+    a duration counted in the total but not yet in its bucket, which only matters to the last digit of a statistic.
+    """
+
+    def __init__(self, minimum: float = 1e-6, maximum: float = 10.0, buckets_per_decade: int = 10):
+        decades = int(round(np.log10(maximum / minimum)))
+        # python floats rather than numpy ones, which are several times slower to compare
+        self.edges: List[float] = (minimum * 10 ** (np.arange(decades * buckets_per_decade + 1)
+                                                    / buckets_per_decade)).tolist()
+        self.counts: List[int] = [0] * (len(self.edges) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """
+        Count a duration
+        :param seconds: duration in seconds
+        """
+        self.counts[bisect.bisect_left(self.edges, seconds)] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def reset(self):
+        """
+        Forget every duration recorded so far
+        """
+        self.counts = [0] * len(self.counts)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, q: float) -> float:
+        """
+        :param q: percentile, between 0 and 100
+        :return: the duration that q percent of the durations are shorter than, in seconds, NaN if there are none
+        """
+        counts = np.cumsum(self.counts)
+        if not counts[-1]:
+            return np.nan
+        index = int(np.searchsorted(counts, q / 100 * counts[-1]))
+        if index >= len(self.edges):
+            return self.max
+        return min(self.edges[index], self.max)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: count, total, mean, percentiles and maximum duration, in seconds, and the count of every bucket
+                 that has any, keyed by the upper edge of the bucket
+        """
+        counts = list(self.counts)
+        count = sum(counts)
+        return {
+            'count': count,
+            'total': self.total,
+            'mean': self.total / count if count else np.nan,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'buckets': {(self.edges[i] if i < len(self.edges) else np.inf): count
+                        for i, count in enumerate(counts) if count},
+        }
+
+
+class ChannelStats:
+    """
+    Counts of a math channel's evaluations, errors and evaluations skipped by its error breaker, kept by its
+    calculator, and the durations of its evaluations, recorded by the engine. Sampling the inputs into the window
+    on ticks the channel is not evaluated is not an evaluation, its time is added to `sample_time`.
+    """
+
+    def __init__(self):
+        self.evaluations = 0
+        self.errors = 0
+        self.skipped = 0
+        self.time = LatencyHistogram()
+        self.sample_time = 0.0
+
+    def reset(self):
+        self.evaluations = 0
+        self.errors = 0
+        self.skipped = 0
+        self.time.reset()
+        self.sample_time = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: counts, error rate, the summary of the evaluation durations and the sampling time, in seconds
+        """
+        return {
+            'evaluations': self.evaluations,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'error_rate': self.errors / self.evaluations if self.evaluations else 0.0,
+            'time': self.time.summary(),
+            'sample_time': self.sample_time,
+        }
+
+
+class EngineStats:
+    """
+    Durations of the engine's ticks and of the DLL calls that read its inputs and write its outputs. A tick that
+    takes longer than the engine's time step is an overrun.
+    """
+
+    def __init__(self, time_step: float):
+        self.time_step = time_step
+        self.tick = LatencyHistogram()
+        self.read = LatencyHistogram()
+        self.write = LatencyHistogram()
+        self.overruns = 0
+
+    def record_tick(self, seconds: float):
+        self.tick.record(seconds)
+        if seconds > self.time_step:
+            self.overruns += 1
+
+    def reset(self):
+        self.tick.reset()
+        self.read.reset()
+        self.write.reset()
+        self.overruns = 0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: counts of ticks and overruns and the summaries of the tick, read and write durations, in seconds
+        """
+        return {
+            'ticks': self.tick.count,
+            'overruns': self.overruns,
+            'tick': self.tick.summary(),
+            'read': self.read.summary(),
+            'write': self.write.summary(),
+        }
@@ -0,0 +1,685 @@
+import ast
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from Expedition import Var
+
+from .models import Config
+from .calculator import Calculator, RollingMathChannelCalculator
+from .buffers import DecimatedHistory
+from .circular import wrap_heading
+from .engine import Engine
+from .rolling import (RollingCircularMoments, RollingMax, RollingMin, RollingMoments, RollingQuantile,
+                      RollingStatistics, SlidingDFT)
+from .snapshot import InputSnapshot
+from .spectral import band_power, dominant_period
+from .outputs import OutputStage
+
+__all__ = ["LogExpedition", "ReplayState", "Replay", "iter_log", "read_log", "replay_log", "replay_log_to_csv",
+           "replay_logs"]
+
+logger = logging.getLogger(__name__)
+
+
+class LogExpedition:
+    """
+    Stand-in for ExpeditionDLL that serves the values of a log, one row at a time, e.g. to run an Engine on logged
+    data. Vars that are not in the log are not valid. Written values are kept in `written` and, as with the DLL,
+    read back in place of the log from then on, e.g. by a channel that reads its own output.
+    """
+
+    def __init__(self, columns: Mapping[Var, np.ndarray]):
+        """
+        :param columns: the logged values of each var, all of the same length
+        """
+        self.columns = dict(columns)
+        self.row = 0
+        self.written: Dict[Var, float] = {}
+
+    def get_exp_var_value(self, var: Var) -> Optional[float]:
+        if var in self.written:
+            return float(self.written[var])
+        column = self.columns.get(var)
+        return None if column is None else float(column[self.row])
+
+    def get_exp_vars(self, variables: Sequence[Var]) -> Optional[List[float]]:
+        values = [self.get_exp_var_value(var) for var in variables]
+        if any(value is None for value in values):
+            # as with the DLL, one invalid var fails the whole batch
+            return None
+        return values
+
+    def set_exp_var_value(self, var: Var, value: float):
+        self.written[var] = value
+
+    def set_exp_vars(self, variables: Sequence[Var], values: Sequence[float]):
+        self.written.update(zip(variables, values))
+
+    def set_exp_user_var_name(self, var: Var, name: str):
+        pass
+
+
+def _log_columns(log, time_column: str, time_scale: float) -> Tuple[np.ndarray, Dict[Var, np.ndarray]]:
+    import pandas as pd
+    times = log[time_column].to_numpy(dtype=float) * time_scale
+    columns = {
+        Var[column]: pd.to_numeric(log[column], errors='coerce').to_numpy(dtype=float)
+        for column in log.columns if column != time_column and column in Var.__members__
+    }
+    return times, columns
+
+
+def iter_log(path: str, chunk_size: int = 100_000, time_column: str = "Utc",
+             time_scale: float = 86400.0) -> Iterator[Tuple[np.ndarray, Dict[Var, np.ndarray]]]:
+    """
+    Read a CSV log of Expedition vars in chunks of rows, so that it never has to fit in memory, see read_log().
+    Rows that are older than a row of an earlier chunk are dropped.
+    :param path: path of the log
+    :param chunk_size: number of rows in each chunk
+    :return: for each chunk, (time of each row in seconds, values of each var)
+    """
+    import pandas as pd
+    last_row = None
+    for log in pd.read_csv(path, chunksize=chunk_size):
+        log.columns = [str(column).strip().lstrip('!') for column in log.columns]
+        log = log.dropna(subset=[time_column]).sort_values(time_column, kind='stable')
+        if last_row is not None:
+            log = log[log[time_column] >= last_row[time_column].iloc[0]]
+            # empty cells at the start of the chunk take the values of the last row of the chunk before
+            log = pd.concat((last_row, log)).ffill().iloc[1:]
+        else:
+            log = log.ffill()
+        if log.empty:
+            continue
+        last_row = log.iloc[-1:]
+        yield _log_columns(log, time_column, time_scale)
+
+
+def read_log(path: str, time_column: str = "Utc", time_scale: float = 86400.0) -> Tuple[np.ndarray, Dict[Var, np.ndarray]]:
+    """
+    Read a CSV log of Expedition vars, with a column for each var named after it, e.g. Bsp or Twa.
+    Empty cells take the value of the row before, as the DLL returns the latest value of a var.
+    :param path: path of the log
+    :param time_column: name of the column with the time of each row
+    :param time_scale: seconds per unit of the time column, Expedition logs the time in days
+    :return: (time of each row in seconds, values of each var)
+    """
+    import pandas as pd
+    log = pd.read_csv(path)
+    log.columns = [str(column).strip().lstrip('!') for column in log.columns]
+    log = log.dropna(subset=[time_column]).sort_values(time_column, kind='stable').ffill()
+    return _log_columns(log, time_column, time_scale)
+
+
+def _circular_mean_rows(headings: np.ndarray, keepdims: bool = False) -> np.ndarray:
+    radians = np.radians(headings)
+    return wrap_heading(np.degrees(np.arctan2(np.sum(np.sin(radians), axis=-1, keepdims=keepdims),
+                                              np.sum(np.cos(radians), axis=-1, keepdims=keepdims))))
+
+
+def _circular_std_rows(headings: np.ndarray, keepdims: bool = False) -> np.ndarray:
+    radians = np.radians(headings)
+    resultant_length = np.hypot(np.mean(np.sin(radians), axis=-1, keepdims=keepdims),
+                                np.mean(np.cos(radians), axis=-1, keepdims=keepdims))
+    return np.degrees(np.sqrt(-2.0 * np.log(np.minimum(resultant_length, 1.0))))
+
+
+def _dominant_period_rows(windows: np.ndarray, accumulator: SlidingDFT) -> np.ndarray:
+    return dominant_period(windows, accumulator.time_step)
+
+
+def _band_power_rows(windows: np.ndarray, accumulator: SlidingDFT) -> np.ndarray:
+    return band_power(windows, accumulator.low, accumulator.high, accumulator.time_step)
+
+
+# (accumulator type, accessor) -> the same statistic of each row of a 2d array of windows, oldest first.
+# A NaN in a window makes its statistic NaN, as it does for the accumulators
+_ROW_STATISTICS: Dict[Tuple[type, Callable], Callable[[np.ndarray, Any], np.ndarray]] = {
+    (RollingMoments, RollingMoments.mean): lambda windows, accumulator: np.mean(windows, axis=-1),
+    (RollingMoments, RollingMoments.sum): lambda windows, accumulator: np.sum(windows, axis=-1),
+    (RollingMoments, RollingMoments.var): lambda windows, accumulator: np.var(windows, axis=-1),
+    (RollingMoments, RollingMoments.std): lambda windows, accumulator: np.std(windows, axis=-1),
+    (RollingCircularMoments, RollingCircularMoments.mean): lambda windows, accumulator: _circular_mean_rows(windows),
+    (RollingCircularMoments, RollingCircularMoments.std): lambda windows, accumulator: _circular_std_rows(windows),
+    (RollingMin, RollingMin.value): lambda windows, accumulator: np.min(windows, axis=-1),
+    (RollingMax, RollingMax.value): lambda windows, accumulator: np.max(windows, axis=-1),
+    (RollingQuantile, RollingQuantile.median): lambda windows, accumulator: np.median(windows, axis=-1),
+    (RollingQuantile, RollingQuantile.value): lambda windows, accumulator: np.quantile(windows, accumulator.q, axis=-1),
+    (SlidingDFT, SlidingDFT.dominant_period): _dominant_period_rows,
+    (SlidingDFT, SlidingDFT.band_power): _band_power_rows,
+}
+
+
+def _reduce_rows(function: Callable) -> Callable[[np.ndarray], np.ndarray]:
+    return lambda x: function(x, axis=-1, keepdims=True)
+
+
+# expression function -> (number of arguments, version that works along the rows of 2d windows, newest first,
+# keeping the reduced axis so that the results broadcast against the windows)
+_ROW_FUNCTIONS: Dict[str, Tuple[int, Callable]] = {
+    'mean': (1, _reduce_rows(np.mean)),
+    'average': (1, _reduce_rows(np.average)),
+    'median': (1, _reduce_rows(np.median)),
+    'rolling_median': (1, _reduce_rows(np.median)),
+    'rolling_quantile': (2, lambda x, q: np.quantile(x, q, axis=-1, keepdims=True)),
+    'min': (1, _reduce_rows(np.min)),
+    'max': (1, _reduce_rows(np.max)),
+    'std': (1, _reduce_rows(np.std)),
+    'var': (1, _reduce_rows(np.var)),
+    'sum': (1, _reduce_rows(np.sum)),
+    'prod': (1, _reduce_rows(np.prod)),
+    'circmean': (1, lambda x: _circular_mean_rows(x, keepdims=True)),
+    'circstd': (1, lambda x: _circular_std_rows(x, keepdims=True)),
+    'cumsum': (1, lambda x: np.cumsum(x, axis=-1)),
+    'cumprod': (1, lambda x: np.cumprod(x, axis=-1)),
+    'diff': (1, lambda x: np.diff(x, axis=-1)),
+    'gradient': (1, lambda x: np.gradient(x, axis=-1)),
+    'unwrap': (1, lambda x: np.unwrap(x, axis=-1)),
+}
+
+def _spectral_row_functions(time_step: float) -> Dict[str, Tuple[int, Callable]]:
+    # the spectral functions of a rolling channel along the rows of 2d windows, as for _ROW_FUNCTIONS
+    return {
+        'dominant_period': (1, lambda x: dominant_period(x, time_step)[..., np.newaxis]),
+        'band_power': (3, lambda x, low, high: np.asarray(band_power(x, low, high, time_step))[..., np.newaxis]),
+    }
+
+
+# functions that are not ufuncs but work element by element
+_ELEMENTWISE = {'clip', 'round', 'fix', 'wrap_heading', 'polar_bsp', 'target_twa', 'target_bsp'}
+
+_VECTORIZABLE_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Constant,
+                       ast.expr_context, ast.operator, ast.unaryop, ast.cmpop)
+
+
+def _is_vectorizable(tree: ast.AST, functions: Mapping[str, Any],
+                     row_functions: Optional[Mapping[str, Tuple[int, Callable]]] = None) -> bool:
+    # whether the expression gives the same result on whole columns, or with row functions on the rows of
+    # windows, as on each sample
+    for node in ast.walk(tree):
+        if not isinstance(node, _VECTORIZABLE_NODES):
+            return False
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                return False
+            name = node.func.id
+            function = functions.get(name)
+            if row_functions is not None and name in row_functions:
+                if len(node.args) != row_functions[name][0]:
+                    return False
+            elif isinstance(function, np.ufunc):
+                if len(node.args) != function.nin:
+                    return False
+            elif name not in _ELEMENTWISE:
+                return False
+    return True
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+def _hold(rows: np.ndarray, values: np.ndarray, length: int, initial: float = np.nan) -> np.ndarray:
+    # the latest result on every tick, from the results on the ticks the channel was evaluated
+    if not rows.size:
+        return np.full(length, initial)
+    latest = np.full(length, -1)
+    latest[rows] = np.arange(rows.size)
+    latest = np.maximum.accumulate(latest)
+    return np.where(latest >= 0, values[np.maximum(latest, 0)], initial)
+
+
+class _ChannelState:
+    # the state of a channel that is carried from one chunk of a log to the next
+    def __init__(self, calculator: Calculator, tier: Optional[DecimatedHistory]):
+        self.calculator = calculator
+        self.tier = tier  # for channels run one tick at a time
+        self.snapshot = InputSnapshot(calculator.input_vars)
+        self.result = np.nan
+        # what a channel run one tick at a time has written, which it reads back if it reads its own output
+        self.outputs = OutputStage()
+        self.expedition = LogExpedition({})
+        # the newest `capacity` samples of a rolling channel's history, including any padding, oldest first
+        self.sample_times: Optional[np.ndarray] = None
+        self.samples: Dict[str, np.ndarray] = {}
+        # the inputs of the ticks of a tier's incomplete block
+        self.pending: Dict[str, np.ndarray] = {}
+
+
+class ReplayState:
+    """
+    How far a replay has got through a log, and the state of its channels, carried from one chunk of the log to
+    the next so that a log replayed in chunks gives the same results as a log replayed at once.
+    Its size depends on the channels and their windows, not on the length of the log.
+    """
+
+    def __init__(self, channels: List[_ChannelState]):
+        self.channels = channels
+        self.start: Optional[float] = None  # time of the first tick
+        self.ticks = 0  # number of ticks replayed so far
+        self.last_time: Optional[float] = None  # time of the latest row of the log
+        self.last_values: Dict[Var, float] = {}  # and its values
+
+
+class Replay:
+    """
+    Runs the math channels of a config over logged data, as the Engine would have run them live, but on whole
+    columns of the log at once rather than tick by tick.
+
+    The log is resampled onto the ticks of the engine, each tick taking the latest logged value of every var.
+    Plain channels are evaluated on whole columns. Rolling channels are evaluated on strided views of their
+    windows, with the reductions that the live channels keep in running accumulators computed along each window.
+    Update and sample rates, resolutions and channels that read other channels' outputs behave as they do live.
+
+    Expressions that cannot be evaluated on whole columns, e.g. `x if x > 0 else 0`, are evaluated one tick at a
+    time over the same windows. Channels with filters, and channels that read their own output, depend on their
+    previous results and are run through their calculator one tick at a time.
+
+    Logs that are too large to load at once can be replayed in consecutive chunks with process(), which carries
+    the windows and the state of the channels over from one chunk to the next in a ReplayState.
+
+    The results are the same as those of the live engine up to floating point rounding, as the running
+    accumulators add and remove samples in a different order.
+    """
+
+    def __init__(self,
+                 config: Config,
+                 time_step: float = 0.1,
+                 tiers: Sequence[float] = (1.0, 10.0),
+                 min_tier_samples: int = 100,
+                 block_size: int = 4_000_000):
+        """
+        :param config: the config of the channels
+        :param time_step: time between runs of channels without an update rate, as for the Engine
+        :param tiers: block lengths of the decimated histories, as for the Engine
+        :param min_tier_samples: as for the Engine
+        :param block_size: largest number of window samples evaluated at once, to bound memory
+        """
+        self.config = config
+        self.tiers = tiers
+        self.expedition = LogExpedition({})
+        self.engine = Engine(config, self.expedition, time_step, tiers, min_tier_samples)
+        self.time_step = self.engine.time_step
+        self.block_size = block_size
+        # channels with an invalid expression are disabled, as they are live, and their results are NaN
+        self.math_channels = self.engine.math_channels
+        self.blocks = [self.engine._tier_block(math_channel) for math_channel in self.math_channels]
+
+    def start(self) -> ReplayState:
+        """
+        :return: the state of a replay of a new log, for process()
+        """
+        return ReplayState([_ChannelState(*self._calculator(index)) for index in range(len(self.math_channels))])
+
+    def run(self, times: np.ndarray, columns: Mapping[Var, np.ndarray],
+            vectorized: bool = True) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Run every channel over a log
+        :param times: time of each row of the log, in seconds, increasing
+        :param columns: logged values of each var
+        :param vectorized: if False run a live Engine tick by tick instead, e.g. to check the results
+        :return: (time of each tick, the latest result of each channel on each tick, in the order of the config)
+        """
+        if not vectorized:
+            return self._run_engine(np.asarray(times, dtype=float), columns)
+        return self.process(self.start(), times, columns)
+
+    def process(self, state: ReplayState, times: np.ndarray,
+                columns: Mapping[Var, np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Run every channel over the next chunk of a log
+        :param state: the state of the replay of the log, from start(), updated for the next chunk
+        :param times: time of each row of the chunk, in seconds, increasing and after the rows of earlier chunks
+        :param columns: logged values of each var
+        :return: (time of each tick up to the end of the chunk, the latest result of each channel on each tick)
+        """
+        times = np.asarray(times, dtype=float)
+        columns = {var: np.asarray(column, dtype=float) for var, column in columns.items()}
+        if not times.size:
+            return np.zeros(0), [np.zeros(0) for _ in self.config.math_channels]
+        if state.last_time is not None:
+            # the ticks before the first row of the chunk take the latest row of the chunk before
+            times = np.concatenate(([state.last_time], times))
+            columns = {var: np.concatenate(([state.last_values.get(var, np.nan)], column))
+                       for var, column in columns.items()}
+        if state.start is None:
+            state.start = times[0]
+
+        first_tick = state.ticks
+        ticks = int(np.floor((times[-1] - state.start) / self.time_step + 1e-9)) + 1
+        tick_times = state.start + np.arange(first_tick, ticks) * self.time_step
+        state.ticks = max(ticks, first_tick)
+        state.last_time = times[-1]
+        state.last_values = {var: column[-1] for var, column in columns.items()}
+
+        rows = np.searchsorted(times, tick_times, side='right') - 1
+        produced = self.engine.produced_vars
+        # vars written by a channel are not read from the log, their values come from the channel
+        columns = {var: column[np.maximum(rows, 0)] for var, column in columns.items() if var not in produced}
+        results = [np.full(tick_times.size, np.nan) for _ in self.config.math_channels]
+        for index in self.engine.evaluation_order:
+            result = self._run_channel(index, state.channels[index], first_tick, tick_times, columns)
+            results[self.engine.channel_indices[index]] = result
+            if result.size:
+                state.channels[index].result = result[-1]
+            output_var = self.math_channels[index].output_expedition_var
+            if output_var in produced:
+                columns[output_var] = result
+        return tick_times, results
+
+    def _run_engine(self, times: np.ndarray, columns: Mapping[Var, np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        ticks = int(np.floor((times[-1] - times[0]) / self.time_step + 1e-9)) + 1
+        tick_times = times[0] + np.arange(ticks) * self.time_step
+        rows = np.searchsorted(times, tick_times, side='right') - 1
+        expedition = LogExpedition({var: np.asarray(column, dtype=float)[rows] for var, column in columns.items()})
+        engine = Engine(self.config, expedition, self.time_step, self.tiers, self.engine.min_tier_samples)
+        for calculator in engine.calculators:
+            calculator.breaker.max_skipped = 0
+        results = np.full((len(self.config.math_channels), tick_times.size), np.nan)
+        for row, timestamp in enumerate(tick_times):
+            expedition.row = row
+            results[engine.channel_indices, row] = engine.tick(float(timestamp))
+        return tick_times, list(results)
+
+    def _calculator(self, index: int) -> Tuple[Calculator, Optional[DecimatedHistory]]:
+        # a calculator of the channel's own, with its own history or tier
+        math_channel = self.math_channels[index]
+        block = self.blocks[index]
+        sample_period = self.engine.schedule.sample_periods[index]
+        tier = None
+        if block is not None:
+            tier = DecimatedHistory(block * self.time_step, block, circular=bool(math_channel.output_is_heading))
+            calculator = Calculator.from_config(math_channel, self.expedition, block * self.time_step, tier)
+        elif sample_period is not None:
+            calculator = Calculator.from_config(math_channel, self.expedition, sample_period * self.time_step)
+        else:
+            calculator = Calculator.from_config(math_channel, self.expedition, self.time_step)
+        # a replay gives the result of every tick, failing channels are not skipped, only their logs are limited
+        calculator.breaker.max_skipped = 0
+        return calculator, tier
+
+    def _run_channel(self, index: int, channel: _ChannelState, first_tick: int, tick_times: np.ndarray,
+                     columns: Mapping[Var, np.ndarray]) -> np.ndarray:
+        calculator = channel.calculator
+        if calculator.filters.filters or calculator.output_var in calculator.input_vars:
+            return self._run_sequential(index, channel, first_tick, tick_times, columns)
+
+        schedule = self.engine.schedule
+        period = schedule.update_periods[index]
+        rows = np.arange((schedule.phases[index] - first_tick) % period, tick_times.size, period)
+        inputs = {i.local_var_name: columns.get(i.expedition_var, np.full(tick_times.size, np.nan))
+                  for i in calculator.inputs}
+        if isinstance(calculator, RollingMathChannelCalculator):
+            values = self._run_rolling(index, channel, first_tick, tick_times, inputs, rows)
+        else:
+            values = self._run_plain(calculator, inputs, rows)
+        return _hold(rows, values, tick_times.size, channel.result)
+
+    def _run_sequential(self, index: int, channel: _ChannelState, first_tick: int, tick_times: np.ndarray,
+                        columns: Mapping[Var, np.ndarray]) -> np.ndarray:
+        schedule = self.engine.schedule
+        update_period, phase = schedule.update_periods[index], schedule.phases[index]
+        sample_period = schedule.sample_periods[index]
+        calculator, tier, snapshot = channel.calculator, channel.tier, channel.snapshot
+        output_var = calculator.output_var
+        # as live, a channel that reads its own output reads the value it last wrote to Expedition, or the logged
+        # value until it has written one, unless other channels read it too, in which case it is passed on in memory
+        in_memory = output_var in self.engine.produced_vars
+        channel.outputs.refresh_ticks = self.engine.outputs.refresh_ticks
+        results = np.full(tick_times.size, np.nan)
+        result = channel.result
+        for row, timestamp in enumerate(tick_times):
+            tick = first_tick + row
+            snapshot.timestamp = float(timestamp)
+            for var in calculator.input_vars:
+                column = columns.get(var)
+                if var == output_var and in_memory:
+                    snapshot.values[var] = result
+                elif var in channel.expedition.written:
+                    snapshot.values[var] = channel.expedition.written[var]
+                else:
+                    snapshot.values[var] = np.nan if column is None else float(column[row])
+            sample = sample_period is not None and tick % sample_period == 0
+            if (tick - phase) % update_period == 0:
+                result = calculator.calculate(snapshot, channel.outputs, sample)
+                channel.outputs.flush(channel.expedition)
+            elif sample:
+                calculator.sample(snapshot)
+            if tier is not None and tier.accumulate(snapshot.timestamp, snapshot):
+                calculator.sample(snapshot)
+            results[row] = result
+        return results
+
+    def _run_plain(self, calculator: Calculator, inputs: Mapping[str, np.ndarray], rows: np.ndarray) -> np.ndarray:
+        expression = calculator.compiled_expression
+        if expression is None:
+            return np.full(rows.size, np.nan)
+        if _is_vectorizable(expression.tree, calculator.functions):
+            try:
+                variables = {name: column[rows] for name, column in inputs.items()}
+                variables.update(calculator.variables)
+                with np.errstate(all='ignore'):
+                    value = expression.evaluate(variables, calculator.functions)
+                return self._column(calculator, value, rows.size, rows=False)
+            except Exception:
+                pass
+        return np.array([
+            calculator.evaluate({**{name: float(column[row]) for name, column in inputs.items()},
+                                 **calculator.variables})
+            for row in rows
+        ], dtype=float)
+
+    def _samples(self, index: int, channel: _ChannelState, first_tick: int, tick_times: np.ndarray,
+                 inputs: Mapping[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray], int, np.ndarray]:
+        # the samples added to a rolling channel's history over the ticks: their times and values, the number of
+        # samples before them, and the number of the latest sample on each tick
+        ticks = first_tick + np.arange(tick_times.size)
+        block = self.blocks[index]
+        if block is None:
+            sample_period = self.engine.schedule.sample_periods[index]
+            first = (-first_tick) % sample_period
+            return (tick_times[first::sample_period],
+                    {name: column[first::sample_period] for name, column in inputs.items()},
+                    (first_tick + first) // sample_period,
+                    ticks // sample_period)
+
+        # block averages of the inputs, pushed at the end of the last tick of each block
+        pending = first_tick % block
+        blocks = (pending + tick_times.size) // block
+        values = {}
+        for name, column in inputs.items():
+            column = np.concatenate((channel.pending.get(name, np.zeros(0)), column))
+            channel.pending[name] = column[blocks * block:]
+            samples = column[:blocks * block].reshape(blocks, block)
+            valid = ~np.isnan(samples)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if channel.calculator.output_is_heading:
+                    radians = np.radians(np.where(valid, samples, 0.0))
+                    averages = np.mod(np.degrees(np.arctan2(np.sum(np.where(valid, np.sin(radians), 0.0), axis=1),
+                                                            np.sum(np.where(valid, np.cos(radians), 0.0), axis=1))),
+                                      360.0)
+                else:
+                    averages = np.sum(np.where(valid, samples, 0.0), axis=1) / np.sum(valid, axis=1)
+            values[name] = np.where(np.any(valid, axis=1), averages, np.nan)
+        return (tick_times[block - 1 - pending:blocks * block - pending:block], values,
+                (first_tick - pending) // block, ticks // block - 1)
+
+    def _run_rolling(self, index: int, channel: _ChannelState, first_tick: int, tick_times: np.ndarray,
+                     inputs: Mapping[str, np.ndarray], rows: np.ndarray) -> np.ndarray:
+        calculator = channel.calculator
+        window = calculator.window
+        capacity = window.capacity
+        sample_times, samples, first_sample, latest_samples = self._samples(index, channel, first_tick, tick_times,
+                                                                            inputs)
+        if channel.sample_times is None:
+            # until it has been running for its duration the window is padded with NaN samples, as old as the
+            # sample before the first one
+            padding_time = sample_times[0] - window.time_step if sample_times.size else np.nan
+            times = np.concatenate((np.full(capacity, padding_time), sample_times))
+            samples = {name: np.concatenate((np.full(capacity, np.nan), values)) for name, values in samples.items()}
+        else:
+            times = np.concatenate((channel.sample_times, sample_times))
+            samples = {name: np.concatenate((channel.samples[name], values)) for name, values in samples.items()}
+        if sample_times.size or channel.sample_times is not None:
+            channel.sample_times = times[-capacity:]
+            channel.samples = {name: values[-capacity:] for name, values in samples.items()}
+
+        # the samples in the window on each tick, by their position in the arrays
+        latest = latest_samples[rows]
+        newest = latest - first_sample + capacity
+        oldest = np.maximum(np.searchsorted(times, times[np.maximum(newest, 0)] - window.duration, side='right'),
+                            newest - capacity + 1)
+        # before the first sample the window is all padding
+        oldest = np.where(latest < 0, 0, oldest)
+        newest = np.where(latest < 0, capacity - 1, newest)
+        lengths = newest - oldest + 1
+
+        values = np.full(rows.size, np.nan)
+        for length in np.unique(lengths):
+            selected = np.flatnonzero(lengths == length)
+            step = max(self.block_size // int(length), 1)
+            for start in range(0, selected.size, step):
+                chunk = selected[start:start + step]
+                windows = {name: sliding_window_view(column, int(length))[oldest[chunk]]
+                           for name, column in samples.items()}
+                values[chunk] = self._evaluate_windows(calculator, windows)
+        return values
+
+    def _evaluate_windows(self, calculator: RollingMathChannelCalculator, windows: Dict[str, np.ndarray]) -> np.ndarray:
+        # evaluate a rolling channel on windows that are all the same length, one row per tick, oldest first
+        expression = calculator.compiled_expression
+        count = next(iter(windows.values())).shape[0] if windows else 0
+        if expression is None or not count:
+            return np.full(count, np.nan)
+
+        statistics: Dict[str, np.ndarray] = {}
+        if calculator.statistics is not None:
+            with np.errstate(all='ignore'):
+                statistics = {
+                    name: _ROW_STATISTICS[type(accumulator), accessor](
+                        windows[self._statistic_input(calculator.statistics, accumulator)], accumulator)
+                    for name, (accumulator, accessor) in calculator.statistics.reductions.items()
+                }
+        newest_first = {name: windows[name][:, ::-1] for name in calculator.windowed_names}
+
+        row_functions = dict(_ROW_FUNCTIONS)
+        row_functions.update(_spectral_row_functions(calculator.time_step))
+        if _is_vectorizable(expression.tree, calculator.functions, row_functions):
+            try:
+                functions = dict(calculator.functions)
+                functions.update({name: function for name, (_, function) in row_functions.items()})
+                variables: Dict[str, Any] = dict(newest_first)
+                variables.update({name: values[:, np.newaxis] for name, values in statistics.items()})
+                variables.update(calculator.variables)
+                with np.errstate(all='ignore'):
+                    value = expression.evaluate(variables, functions)
+                return self._column(calculator, value, count, rows=True)
+            except Exception:
+                pass
+
+        results = np.full(count, np.nan)
+        for row in range(count):
+            variables = {name: values[row] for name, values in newest_first.items()}
+            variables.update({name: float(values[row]) for name, values in statistics.items()})
+            variables.update(calculator.variables)
+            results[row] = calculator.evaluate(variables)
+        return results
+
+    @staticmethod
+    def _statistic_input(statistics: RollingStatistics, accumulator: Any) -> str:
+        return next(name for name, accumulators in statistics.accumulators.items()
+                    if any(a is accumulator for a in accumulators))
+
+    @staticmethod
+    def _column(calculator: Calculator, value: Any, count: int, rows: bool) -> np.ndarray:
+        # the result of each tick from the result of a vectorized evaluation, as Calculator.evaluate would give it
+        if calculator.output_is_heading:
+            value = wrap_heading(value)
+        if np.ndim(value) == 0:
+            if isinstance(value, float):
+                return np.full(count, float(value))
+            raise _NotVectorizable()
+        value = np.asarray(value)
+        if not np.issubdtype(value.dtype, np.floating):
+            raise _NotVectorizable()
+        if not rows and value.shape == (count,):
+            return value.astype(float)
+        if rows and value.ndim == 2 and value.shape[0] == count:
+            # a result that is still an array on a tick is an error, which gives NaN
+            return value[:, 0].astype(float) if value.shape[1] == 1 else np.full(count, np.nan)
+        raise _NotVectorizable()
+
+
+def _results_frame(config: Config, tick_times: np.ndarray, results: List[np.ndarray]):
+    import pandas as pd
+    return pd.DataFrame({math_channel.name: values for math_channel, values in zip(config.math_channels, results)},
+                        index=pd.Index(tick_times, name="time"))
+
+
+def replay_log(config: Config, path: str, time_step: float = 0.1, chunk_size: int = 100_000, **kwargs):
+    """
+    Run the math channels of a config over a CSV log, reading it in chunks
+    :param config: the config of the channels
+    :param path: path of the log, see read_log()
+    :param time_step: time between runs of channels without an update rate
+    :param chunk_size: number of rows of the log read at a time
+    :param kwargs: passed on to iter_log()
+    :return: pandas DataFrame of the result of each channel on each tick, indexed by the time of the tick in seconds
+    """
+    import pandas as pd
+    replay = Replay(config, time_step)
+    state = replay.start()
+    frames = [_results_frame(config, np.zeros(0), [np.zeros(0)] * len(config.math_channels))]
+    frames.extend(_results_frame(config, *replay.process(state, times, columns))
+                  for times, columns in iter_log(path, chunk_size, **kwargs))
+    return pd.concat(frames)
+
+
+def replay_log_to_csv(config: Config, path: str, output: str, time_step: float = 0.1, chunk_size: int = 100_000,
+                      **kwargs) -> int:
+    """
+    Run the math channels of a config over a CSV log and write the results to a CSV file, a chunk at a time, so
+    that memory depends on the chunk size rather than the length of the log
+    :param config: the config of the channels
+    :param path: path of the log, see read_log()
+    :param output: path of the CSV file of the results
+    :param time_step: time between runs of channels without an update rate
+    :param chunk_size: number of rows of the log read at a time
+    :param kwargs: passed on to iter_log()
+    :return: number of ticks written
+    """
+    replay = Replay(config, time_step)
+    state = replay.start()
+    ticks = 0
+    _results_frame(config, np.zeros(0), [np.zeros(0)] * len(config.math_channels)).to_csv(output)
+    for times, columns in iter_log(path, chunk_size, **kwargs):
+        tick_times, results = replay.process(state, times, columns)
+        _results_frame(config, tick_times, results).to_csv(output, mode='a', header=False)
+        ticks += tick_times.size
+    logger.info("Replayed %s, %d ticks written to %s", path, ticks, output)
+    return ticks
+
+
+def replay_logs(config: Config, paths: Sequence[str], outputs: Sequence[str], processes: Optional[int] = None,
+                **kwargs) -> List[int]:
+    """
+    Replay several logs, e.g. the logs of each day, in parallel in a pool of processes. Each log is replayed on
+    its own, as if the engine had been restarted at its start.
+    :param config: the config of the channels
+    :param paths: paths of the logs
+    :param outputs: path of the CSV file of the results of each log
+    :param processes: number of processes, the number of CPUs if None
+    :param kwargs: passed on to replay_log_to_csv()
+    :return: number of ticks written for each log
+    """
+    if len(paths) != len(outputs):
+        raise ValueError(f"{len(paths)} logs but {len(outputs)} outputs")
+    if len(paths) == 1 or processes == 1:
+        return [replay_log_to_csv(config, path, output, **kwargs) for path, output in zip(paths, outputs)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(replay_log_to_csv, config, path, output, **kwargs)
+                   for path, output in zip(paths, outputs)]
+        return [future.result() for future in futures]
@@ -0,0 +1,619 @@
+import ast
+import heapq
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type
+
+import numpy as np
+
+from .buffers import RollingWindow
+from .circular import wrap_heading
+from .spectral import band_bins, bin_power, peak_period
+
+__all__ = ["RollingAccumulator", "RollingMoments", "RollingCircularMoments", "RollingMin", "RollingMax",
+           "RollingQuantile", "SlidingDFT", "RollingStatistics"]
+
+
+class RollingAccumulator(ABC):
+    """
+    Running summary of a first-in first-out window of samples, updated in O(1) per sample.
+
+    NaN samples are counted rather than accumulated. As with the numpy reductions they replace,
+    any NaN in the window makes the result NaN.
+    """
+
+    def __init__(self):
+        self.nan_count = 0
+
+    @abstractmethod
+    def add(self, value: float):
+        """
+        Add a new sample to the window
+        """
+
+    @abstractmethod
+    def remove(self, value: float):
+        """
+        Remove the oldest sample from the window
+        """
+
+    def resync(self, window: np.ndarray):
+        """
+        Recompute the accumulator from the samples in the window to remove any floating point drift
+        :param window: the samples currently in the window
+        """
+        pass
+
+    @property
+    def stale(self) -> bool:
+        """
+        Whether the accumulator has to be recomputed from the window before its result can be read
+        """
+        return False
+
+
+class RollingMoments(RollingAccumulator):
+    """
+    Welford style running mean and sum of squared deviations, for mean/var/std/sum reductions.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        if math.isnan(value):
+            self.nan_count += 1
+            return
+        self.n += 1
+        delta = value - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (value - self._mean)
+
+    def remove(self, value: float):
+        if math.isnan(value):
+            self.nan_count -= 1
+            return
+        self.n -= 1
+        if self.n == 0:
+            self._mean = 0.0
+            self._m2 = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / self.n
+        self._m2 -= delta * (value - self._mean)
+
+    def resync(self, window: np.ndarray):
+        finite = window[~np.isnan(window)]
+        self.nan_count = window.size - finite.size
+        self.n = finite.size
+        self._mean = float(np.mean(finite)) if self.n else 0.0
+        self._m2 = float(np.sum(np.square(finite - self._mean))) if self.n else 0.0
+
+    def mean(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        return self._mean
+
+    def sum(self) -> float:
+        if self.nan_count:
+            return np.nan
+        return self._mean * self.n
+
+    def var(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        return max(self._m2, 0.0) / self.n
+
+    def std(self) -> float:
+        return math.sqrt(self.var())
+
+
+class RollingCircularMoments(RollingAccumulator):
+    """
+    Running sums of the sine and cosine of headings in degrees, for circular mean and std reductions.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.n = 0
+        self._sin_sum = 0.0
+        self._cos_sum = 0.0
+
+    def add(self, value: float):
+        if math.isnan(value):
+            self.nan_count += 1
+            return
+        self.n += 1
+        radians = math.radians(value)
+        self._sin_sum += math.sin(radians)
+        self._cos_sum += math.cos(radians)
+
+    def remove(self, value: float):
+        if math.isnan(value):
+            self.nan_count -= 1
+            return
+        self.n -= 1
+        if self.n == 0:
+            self._sin_sum = 0.0
+            self._cos_sum = 0.0
+            return
+        radians = math.radians(value)
+        self._sin_sum -= math.sin(radians)
+        self._cos_sum -= math.cos(radians)
+
+    def resync(self, window: np.ndarray):
+        finite = np.radians(window[~np.isnan(window)])
+        self.nan_count = window.size - finite.size
+        self.n = finite.size
+        self._sin_sum = float(np.sum(np.sin(finite)))
+        self._cos_sum = float(np.sum(np.cos(finite)))
+
+    def mean(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        return wrap_heading(math.degrees(math.atan2(self._sin_sum, self._cos_sum)))
+
+    def std(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        resultant_length = min(math.hypot(self._sin_sum, self._cos_sum) / self.n, 1.0)
+        if resultant_length == 0.0:
+            return np.inf
+        return math.degrees(math.sqrt(-2.0 * math.log(resultant_length)))
+
+
+class _RollingExtreme(RollingAccumulator):
+    """
+    Monotonic deque of (sequence number, value) pairs, the front of the deque is the extreme of the window
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._deque = deque()
+        self._added = 0
+        self._removed = 0
+
+    @staticmethod
+    @abstractmethod
+    def _dominates(a: float, b: float) -> bool:
+        pass
+
+    def add(self, value: float):
+        seq = self._added
+        self._added += 1
+        if math.isnan(value):
+            self.nan_count += 1
+            return
+        while self._deque and not self._dominates(self._deque[-1][1], value):
+            self._deque.pop()
+        self._deque.append((seq, value))
+
+    def remove(self, value: float):
+        seq = self._removed
+        self._removed += 1
+        if math.isnan(value):
+            self.nan_count -= 1
+            return
+        if self._deque and self._deque[0][0] == seq:
+            self._deque.popleft()
+
+    def value(self) -> float:
+        if self.nan_count or not self._deque:
+            return np.nan
+        return self._deque[0][1]
+
+
+class RollingMin(_RollingExtreme):
+    @staticmethod
+    def _dominates(a: float, b: float) -> bool:
+        return a < b
+
+
+class RollingMax(_RollingExtreme):
+    @staticmethod
+    def _dominates(a: float, b: float) -> bool:
+        return a > b
+
+
+class RollingQuantile(RollingAccumulator):
+    """
+    Running quantile of the window, kept as two heaps in O(log N) per sample.
+
+    The low heap holds the smallest floor(q * (n - 1)) + 1 samples and the high heap the rest, so the two samples
+    either side of the quantile are at the tops of the heaps. Removed samples are deleted lazily when they reach the
+    top of a heap, and the heaps are rebuilt from the window on resync, which also drops any that never did.
+    The result is interpolated linearly between the two samples, as np.quantile does.
+    """
+
+    def __init__(self, q: float):
+        super().__init__()
+        self.q = q
+        self.n = 0
+        self._low: List[float] = []  # max heap, stored negated
+        self._high: List[float] = []  # min heap
+        self._low_size = 0
+        self._high_size = 0
+        # samples removed from the window but still in each heap
+        self._low_deleted: Dict[float, int] = {}
+        self._high_deleted: Dict[float, int] = {}
+
+    def add(self, value: float):
+        if math.isnan(value):
+            self.nan_count += 1
+            return
+        if self._low_size and value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        self.n += 1
+        self._rebalance()
+
+    def remove(self, value: float):
+        if math.isnan(value):
+            self.nan_count -= 1
+            return
+        # every sample in the low heap is <= every sample in the high heap, so the value is in the low heap if it
+        # is not above its top
+        if self._low_size and value <= -self._low[0]:
+            self._low_deleted[value] = self._low_deleted.get(value, 0) + 1
+            self._low_size -= 1
+            self._prune(self._low, self._low_deleted, -1.0)
+        else:
+            self._high_deleted[value] = self._high_deleted.get(value, 0) + 1
+            self._high_size -= 1
+            self._prune(self._high, self._high_deleted, 1.0)
+        self.n -= 1
+        self._rebalance()
+
+    @staticmethod
+    def _prune(heap: List[float], deleted: Dict[float, int], sign: float):
+        while heap:
+            value = sign * heap[0]
+            count = deleted.get(value, 0)
+            if not count:
+                return
+            heapq.heappop(heap)
+            if count == 1:
+                del deleted[value]
+            else:
+                deleted[value] = count - 1
+
+    def _rebalance(self):
+        low_size = math.floor(self.q * (self.n - 1)) + 1 if self.n else 0
+        while self._low_size > low_size:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, self._low_deleted, -1.0)
+        while self._low_size < low_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, self._high_deleted, 1.0)
+
+    def resync(self, window: np.ndarray):
+        finite = np.sort(window[~np.isnan(window)])
+        self.nan_count = window.size - finite.size
+        self.n = finite.size
+        self._low_size = math.floor(self.q * (self.n - 1)) + 1 if self.n else 0
+        self._high_size = self.n - self._low_size
+        self._low = (-finite[:self._low_size][::-1]).tolist()  # sorted descending is a valid max heap
+        self._high = finite[self._low_size:].tolist()  # sorted ascending is a valid min heap
+        self._low_deleted.clear()
+        self._high_deleted.clear()
+
+    def _neighbours(self) -> Tuple[float, float, float]:
+        # the samples either side of the quantile and how far it is between them
+        position = self.q * (self.n - 1)
+        fraction = position - math.floor(position)
+        below = -self._low[0]
+        above = self._high[0] if self._high_size else below
+        return below, above, fraction
+
+    def value(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        below, above, fraction = self._neighbours()
+        if fraction == 0.0:
+            return below
+        # the same interpolation as np.quantile, to give the same result
+        if fraction >= 0.5:
+            return above - (above - below) * (1.0 - fraction)
+        return below + (above - below) * fraction
+
+    def median(self) -> float:
+        if self.nan_count or self.n == 0:
+            return np.nan
+        below, above, fraction = self._neighbours()
+        if fraction == 0.0:
+            return below
+        # np.median averages the two middle samples
+        return (below + above) / 2.0
+
+
+class SlidingDFT(RollingAccumulator):
+    """
+    Sliding DFT of the window over the frequency bins between `low` and `high` Hz, updated in O(bins) per sample.
+
+    The spectrum is that of the samples actually in the window, as power_spectrum() would give it: bin k is the
+    frequency k / (count * time_step) Hz for a window of `count` samples every `time_step` seconds. Each sample is
+    added with the phase of its position in the stream of samples rather than in the window, so adding or removing
+    a sample only changes its own term. The magnitudes are those of the DFT of the window.
+
+    A time based window does not always hold the same number of samples, e.g. at startup or when ticks jitter, and
+    the bins depend on the number of samples. The accumulator is stale when the window holds a different number of
+    samples than its spectrum was computed for, and is then recomputed from the window by resync().
+    """
+
+    def __init__(self, time_step: float, low: float = 0.0, high: float = math.inf):
+        super().__init__()
+        self.time_step = time_step
+        self.low = low
+        self.high = high
+        self.length = 0
+        self.bins = band_bins(0, time_step, low, high)
+        self._step = np.ones(0, dtype=complex)
+        self._spectrum = np.zeros(0, dtype=complex)
+        self._add_phase = np.ones(0, dtype=complex)
+        self._remove_phase = np.ones(0, dtype=complex)
+        self._added = 0
+        self._removed = 0
+
+    def add(self, value: float):
+        self._added += 1
+        if math.isnan(value):
+            self.nan_count += 1
+        else:
+            self._spectrum += value * self._add_phase
+        self._add_phase *= self._step
+
+    def remove(self, value: float):
+        self._removed += 1
+        if math.isnan(value):
+            self.nan_count -= 1
+        else:
+            self._spectrum -= value * self._remove_phase
+        self._remove_phase *= self._step
+
+    @property
+    def stale(self) -> bool:
+        # the number of samples in the window has changed since the spectrum's bins were chosen
+        return self._added - self._removed != self.length
+
+    def _phases(self, position: int) -> np.ndarray:
+        return np.exp(-2j * np.pi * self.bins * (position % self.length) / self.length)
+
+    def resync(self, window: np.ndarray):
+        self.length = window.size
+        self._removed = self._added - window.size
+        self.bins = band_bins(self.length, self.time_step, self.low, self.high)
+        samples = window[::-1]
+        finite = ~np.isnan(samples)
+        self.nan_count = int(samples.size - np.count_nonzero(finite))
+        if not self.length:
+            self._step = self._spectrum = self._add_phase = self._remove_phase = np.zeros(0, dtype=complex)
+            return
+        self._step = np.exp(-2j * np.pi * self.bins / self.length)
+        # the DFT of the window, shifted to the phases of the positions of its samples in the stream
+        self._remove_phase = self._phases(self._removed)
+        self._add_phase = self._phases(self._added)
+        self._spectrum = np.fft.rfft(np.where(finite, samples, 0.0))[self.bins] * self._remove_phase
+
+    def power(self) -> np.ndarray:
+        """
+        :return: the power of each bin, in the units of the samples squared
+        """
+        return bin_power(self._spectrum, self.bins, self.length)
+
+    def dominant_period(self) -> float:
+        if self.nan_count or not self.bins.size:
+            return np.nan
+        return float(peak_period(self.power(), self.bins, self.length, self.time_step))
+
+    def band_power(self) -> float:
+        if self.nan_count or not self.bins.size:
+            return np.nan
+        return float(np.sum(self.power()))
+
+
+# reduction function name -> (accumulator type, accessor for the result)
+REDUCTIONS: Dict[str, Tuple[Type[RollingAccumulator], Callable[[RollingAccumulator], float]]] = {
+    'mean': (RollingMoments, RollingMoments.mean),
+    'average': (RollingMoments, RollingMoments.mean),
+    'sum': (RollingMoments, RollingMoments.sum),
+    'var': (RollingMoments, RollingMoments.var),
+    'std': (RollingMoments, RollingMoments.std),
+    'min': (RollingMin, RollingMin.value),
+    'max': (RollingMax, RollingMax.value),
+    'circmean': (RollingCircularMoments, RollingCircularMoments.mean),
+    'circstd': (RollingCircularMoments, RollingCircularMoments.std),
+}
+
+class ParametricReduction(NamedTuple):
+    accumulator_type: Type[RollingAccumulator]
+    arguments: int  # number of constant arguments after the input, e.g. 1 for rolling_quantile(tws, 0.9)
+    # accumulator parameters for the window and the arguments, None if the arguments are not valid
+    parameters: Callable[['RollingStatistics', Tuple[float, ...]], Optional[tuple]]
+    accessor: Callable[[RollingAccumulator], float]
+
+
+def _median_parameters(statistics: 'RollingStatistics', arguments: Tuple[float, ...]) -> Optional[tuple]:
+    return (0.5,)
+
+
+def _quantile_parameters(statistics: 'RollingStatistics', arguments: Tuple[float, ...]) -> Optional[tuple]:
+    q, = arguments
+    return (q,) if 0.0 <= q <= 1.0 else None
+
+
+def _spectrum_parameters(statistics: 'RollingStatistics', arguments: Tuple[float, ...]) -> Optional[tuple]:
+    return (statistics.time_step,)
+
+
+def _band_parameters(statistics: 'RollingStatistics', arguments: Tuple[float, ...]) -> Optional[tuple]:
+    low, high = arguments
+    if not 0.0 <= low <= high:
+        return None
+    return statistics.time_step, low, high
+
+
+# reductions with parameters: median and quantiles, O(log N) per sample, and spectra, O(bins) per sample
+PARAMETRIC_REDUCTIONS: Dict[str, ParametricReduction] = {
+    'median': ParametricReduction(RollingQuantile, 0, _median_parameters, RollingQuantile.median),
+    'rolling_median': ParametricReduction(RollingQuantile, 0, _median_parameters, RollingQuantile.median),
+    'rolling_quantile': ParametricReduction(RollingQuantile, 1, _quantile_parameters, RollingQuantile.value),
+    'dominant_period': ParametricReduction(SlidingDFT, 0, _spectrum_parameters, SlidingDFT.dominant_period),
+    'band_power': ParametricReduction(SlidingDFT, 2, _band_parameters, SlidingDFT.band_power),
+}
+
+# for channels whose output is a heading, these reductions are replaced by their circular versions
+HEADING_REDUCTIONS = {
+    'mean': 'circmean',
+    'average': 'circmean',
+    'std': 'circstd',
+}
+
+
+class RollingStatistics:
+    """
+    Finds reductions of a single windowed input in an expression, e.g. `mean(bsp)` or `std(awa)`,
+    and replaces them with running accumulators so that they cost O(1) per tick whatever the window length.
+    Medians and quantiles with a constant q, e.g. `rolling_quantile(tws, 0.9)`, cost O(log N), and spectral
+    reductions such as `dominant_period(pitch)` or `band_power(heave, 0.05, 0.2)` O(bins).
+
+    The accumulators are recomputed from the window every `resync_interval` samples to limit floating point drift.
+    If `heading` is set, mean and std reductions are computed as circular statistics. Spectral reductions are
+    those of the samples in the window, taken every `time_step` seconds.
+    """
+
+    def __init__(self, tree: ast.Expression, input_names: Iterable[str], resync_interval: int,
+                 heading: bool = False, time_step: float = 1.0):
+        self.input_names = set(input_names)
+        self.resync_interval = max(resync_interval, 1)
+        self.heading = heading
+        self.time_step = time_step
+        self.accumulators: Dict[str, List[RollingAccumulator]] = {}
+        self.reductions: Dict[str, Tuple[RollingAccumulator, Callable[[RollingAccumulator], float]]] = {}
+        self._shared_accumulators: Dict[Tuple[str, type, tuple], RollingAccumulator] = {}
+        self._samples_since_resync = 0
+
+        self.tree = ast.fix_missing_locations(_ReductionTransformer(self).visit(_copy_tree(tree)))
+        self.expression = ast.unparse(self.tree)
+
+    def _bind(self, function_name: str, input_name: str, arguments: Tuple[float, ...] = ()) -> Optional[str]:
+        if self.heading:
+            function_name = HEADING_REDUCTIONS.get(function_name, function_name)
+        variable_name = f"_{function_name}_{input_name}"
+        if function_name in PARAMETRIC_REDUCTIONS:
+            reduction = PARAMETRIC_REDUCTIONS[function_name]
+            parameters = reduction.parameters(self, arguments)
+            if parameters is None:
+                return None
+            accumulator_type, accessor = reduction.accumulator_type, reduction.accessor
+            for argument in arguments:
+                variable_name += "_" + re.sub(r"\W", "_", f"{argument:g}")
+        else:
+            accumulator_type, accessor = REDUCTIONS[function_name]
+            parameters = ()
+        if variable_name not in self.reductions:
+            # reductions of an input that need the same accumulator share it, e.g. mean(bsp) and std(bsp)
+            key = (input_name, accumulator_type, parameters)
+            if key not in self._shared_accumulators:
+                accumulator = accumulator_type(*parameters)
+                self._shared_accumulators[key] = accumulator
+                self.accumulators.setdefault(input_name, []).append(accumulator)
+            self.reductions[variable_name] = (self._shared_accumulators[key], accessor)
+        return variable_name
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.reductions
+
+    def initialise(self, window: RollingWindow):
+        """
+        Load the accumulators with the initial contents of the window
+        :param window: the window of the inputs
+        """
+        for name, accumulators in self.accumulators.items():
+            for accumulator in accumulators:
+                # add the oldest sample first, the window is ordered newest first
+                for value in window.view(name)[::-1]:
+                    accumulator.add(float(value))
+
+    def add(self, name: str, value: float):
+        """
+        Update the accumulators of an input with a sample that has been added to the window
+        """
+        for accumulator in self.accumulators.get(name, ()):
+            accumulator.add(value)
+
+    def remove(self, name: str, value: float):
+        """
+        Update the accumulators of an input with the oldest sample, which has dropped out of the window
+        """
+        for accumulator in self.accumulators.get(name, ()):
+            accumulator.remove(value)
+
+    def tick(self, window: RollingWindow):
+        """
+        Called once all the inputs have been updated, periodically re-summing the accumulators, and re-summing the
+        ones that are stale before their results are read
+        :param window: the window of the inputs
+        """
+        self._samples_since_resync += 1
+        resync = self._samples_since_resync >= self.resync_interval
+        if resync:
+            self._samples_since_resync = 0
+        for name, accumulators in self.accumulators.items():
+            for accumulator in accumulators:
+                if resync or accumulator.stale:
+                    accumulator.resync(window.view(name))
+
+    def values(self) -> Dict[str, float]:
+        """
+        :return: the current value of every reduction, keyed by the variable name used in the rewritten expression
+        """
+        return {name: accessor(accumulator) for name, (accumulator, accessor) in self.reductions.items()}
+
+
+class _ReductionTransformer(ast.NodeTransformer):
+    def __init__(self, statistics: RollingStatistics):
+        self.statistics = statistics
+
+    def visit_Call(self, node: ast.Call):
+        if (isinstance(node.func, ast.Name)
+                and (node.func.id in REDUCTIONS or node.func.id in PARAMETRIC_REDUCTIONS)
+                and node.args
+                and not node.keywords
+                and isinstance(node.args[0], ast.Name)
+                and node.args[0].id in self.statistics.input_names):
+            arguments = _constant_arguments(node.args[1:])
+            reduction = PARAMETRIC_REDUCTIONS.get(node.func.id)
+            expected = reduction.arguments if reduction is not None else 0
+            if arguments is not None and len(arguments) == expected:
+                variable_name = self.statistics._bind(node.func.id, node.args[0].id, arguments)
+                if variable_name is not None:
+                    return ast.copy_location(ast.Name(id=variable_name, ctx=ast.Load()), node)
+        return self.generic_visit(node)
+
+
+def _constant_arguments(args: List[ast.expr]) -> Optional[Tuple[float, ...]]:
+    # the values of arguments that are all plain numbers, e.g. the 0.9 of rolling_quantile(tws, 0.9)
+    values = []
+    for arg in args:
+        if (not isinstance(arg, ast.Constant) or isinstance(arg.value, bool)
+                or not isinstance(arg.value, (int, float))):
+            return None
+        values.append(float(arg.value))
+    return tuple(values)
+
+
+def _copy_tree(tree: ast.AST) -> ast.AST:
+    return ast.parse(ast.unparse(tree), mode='eval')
@@ -0,0 +1,102 @@
+import logging
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from .engine import Engine
+from .scheduler import TickScheduler
+
+__all__ = ["TickResults", "EngineRunner"]
+
+logger = logging.getLogger(__name__)
+
+
+class TickResults(NamedTuple):
+    """
+    The results of one tick, published by the runner for observers such as the GUI
+    """
+    tick: int
+    timestamp: float  # time.monotonic() at the start of the tick
+    overruns: int  # number of ticks so far that ran past the deadline of the next tick
+    values: Tuple[float, ...]  # in the same order as the engine's calculators
+
+
+class EngineRunner:
+    """
+    Runs the tick loop of an engine at a fixed time step, the engine's own by default, without needing a GUI
+    event loop.
+
+    The loop can run in the calling thread with run(), or in a dedicated worker thread with start(). After every
+    tick the results are published in `latest`. It is replaced rather than updated, so other threads can poll it
+    at their own rate without any locking.
+
+    Ticks are timed by a TickScheduler. Overruns are logged at most once every `overrun_log_interval` seconds,
+    with the number of overruns since the last report.
+    """
+
+    def __init__(self, engine: Engine, time_step: Optional[float] = None, overrun_log_interval: float = 60.0):
+        self.engine = engine
+        self.time_step = engine.time_step if time_step is None else time_step
+        self.overrun_log_interval = overrun_log_interval
+        self.scheduler = TickScheduler(self.time_step)
+        self.latest: Optional[TickResults] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reported_overruns = 0
+        self._last_overrun_report = 0.0
+
+    def run(self, max_ticks: Optional[int] = None):
+        """
+        Tick the engine until stop() is called
+        :param max_ticks: stop after this many ticks, if set
+        """
+        ticks = 0
+        timestamp = self.scheduler.start()
+        while timestamp is not None and (max_ticks is None or ticks < max_ticks):
+            try:
+                results = self.engine.tick(timestamp)
+                self.latest = TickResults(ticks, timestamp, self.scheduler.overruns, tuple(results))
+            except Exception:
+                logger.exception("Error running tick %d", ticks)
+            ticks += 1
+
+            self._report_overruns(timestamp)
+            timestamp = self.scheduler.wait(self._stop)
+
+    def _report_overruns(self, now: float):
+        overruns = self.scheduler.overruns - self._reported_overruns
+        if overruns and now - self._last_overrun_report >= self.overrun_log_interval:
+            logger.warning("%d ticks overran the %ss time step (%d ticks missed so far, longest tick %.3fs)",
+                           overruns, self.time_step, self.scheduler.missed_ticks, self.scheduler.max_tick_duration)
+            self._reported_overruns = self.scheduler.overruns
+            self._last_overrun_report = now
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        :return: the engine's profile, see Engine.stats(), with the scheduler's tick counters and timings
+        """
+        stats = self.engine.stats()
+        stats['scheduler'] = self.scheduler.stats()
+        return stats
+
+    def start(self):
+        """
+        Run the tick loop in a worker thread
+        """
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="ExpCalcsEngine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stop the tick loop, waiting for the worker thread to finish if there is one
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
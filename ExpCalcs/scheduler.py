@@ -0,0 +1,176 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ["TickScheduler", "ScheduledTick", "RateSchedule"]
+
+
+class TickScheduler:
+    """
+    Schedules ticks on a fixed grid of monotonic deadlines, `start + n * time_step`.
+
+    Deadlines are never computed from the time a tick finished, so timer jitter and slow ticks do not accumulate
+    into drift. A tick that is still running at the next deadline is an overrun. Deadlines that have already
+    passed when the tick finishes are skipped rather than run back to back, and are counted as missed.
+    """
+
+    def __init__(self, time_step: float, clock: Callable[[], float] = time.monotonic):
+        self.time_step = time_step
+        self.clock = clock
+        self.ticks = 0
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.last_tick_duration = 0.0
+        self.max_tick_duration = 0.0
+        self.max_lateness = 0.0
+        self._next_deadline: Optional[float] = None
+        self._tick_started = 0.0
+
+    def start(self) -> float:
+        """
+        Start the first tick now
+        :return: the timestamp of the first tick
+        """
+        self._next_deadline = self.clock()
+        return self.begin_tick()
+
+    def begin_tick(self) -> float:
+        """
+        Mark the start of a tick
+        :return: the timestamp of the tick, the actual time it started
+        """
+        self._tick_started = self.clock()
+        self.max_lateness = max(self.max_lateness, self._tick_started - self._next_deadline)
+        self._next_deadline += self.time_step
+        self.ticks += 1
+        return self._tick_started
+
+    def wait(self, stop: threading.Event) -> Optional[float]:
+        """
+        Mark the end of the current tick and wait for the deadline of the next one
+        :param stop: event that interrupts the wait
+        :return: the timestamp of the next tick, or None if stopped
+        """
+        now = self.clock()
+        self.last_tick_duration = now - self._tick_started
+        self.max_tick_duration = max(self.max_tick_duration, self.last_tick_duration)
+
+        if now > self._next_deadline:
+            self.overruns += 1
+            missed = int((now - self._next_deadline) // self.time_step)
+            if missed:
+                # skip the deadlines that have already passed, staying on the same grid
+                self.missed_ticks += missed
+                self._next_deadline += missed * self.time_step
+
+        if stop.wait(max(self._next_deadline - self.clock(), 0.0)):
+            return None
+        return self.begin_tick()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: tick counters and timings, in seconds
+        """
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'missed_ticks': self.missed_ticks,
+            'last_tick_duration': self.last_tick_duration,
+            'max_tick_duration': self.max_tick_duration,
+            'max_lateness': self.max_lateness,
+        }
+
+
+class ScheduledTick(NamedTuple):
+    """
+    The channels that are due on a tick and the inputs that need to be read for them
+    """
+    channels: Tuple[Tuple[int, bool, bool], ...]  # (index, evaluate, sample), in evaluation order
+    variables: Tuple[Hashable, ...]
+
+
+class RateSchedule:
+    """
+    Spreads channels that run at different rates over the ticks of the engine.
+
+    Each channel is evaluated every `update_period` ticks. Channels with a period of more than one tick are given
+    a phase, so that e.g. ten 1 Hz channels on a 10 Hz engine run one per tick rather than all on the same tick.
+    The phases are chosen greedily, heaviest channels first, to keep the load of the busiest tick as low as
+    possible.
+
+    Channels with a window sample their inputs every `sample_period` ticks, starting from tick 0 whatever their
+    phase, so that channels sampling at the same rate sample on the same ticks and can share their history.
+    Other channels read their inputs when they are evaluated.
+
+    The schedule repeats every `cycle` ticks, the least common multiple of the periods. What is due on each tick
+    of the cycle is worked out on first use and cached, unless the cycle is longer than `max_cycle` ticks.
+    """
+
+    def __init__(self,
+                 order: Sequence[int],
+                 update_periods: Sequence[int],
+                 sample_periods: Sequence[Optional[int]],
+                 weights: Sequence[float],
+                 inputs: Sequence[Sequence[Hashable]],
+                 tick_inputs: Sequence[Hashable] = (),
+                 max_cycle: int = 3600):
+        """
+        :param order: channel indices in evaluation order
+        :param update_periods: ticks between evaluations of each channel
+        :param sample_periods: ticks between the input samples of each channel, None if it has no window
+        :param weights: relative cost of evaluating each channel
+        :param inputs: the vars each channel reads when it samples
+        :param tick_inputs: vars that are read on every tick
+        :param max_cycle: longest cycle that is cached
+        """
+        self.order = list(order)
+        self.update_periods = [max(int(p), 1) for p in update_periods]
+        self.sample_periods = [None if p is None else max(int(p), 1) for p in sample_periods]
+        self.inputs = [tuple(i) for i in inputs]
+        self.tick_inputs = tuple(tick_inputs)
+        self.cycle = math.lcm(1, *self.update_periods, *(p for p in self.sample_periods if p is not None))
+        self.max_cycle = max_cycle
+        self.phases = self._assign_phases(weights)
+        self._cache: Dict[int, ScheduledTick] = {}
+
+    def _assign_phases(self, weights: Sequence[float]) -> List[int]:
+        phases = [0] * len(self.update_periods)
+        # the load over one cycle, or over max_cycle ticks if that is shorter, but always over at least one period
+        # of every channel, so each of its phases has a tick to place it on
+        load = np.zeros(min(self.cycle, max([self.max_cycle, *self.update_periods])))
+        # channels that run every tick load every tick equally, so only the slower ones need placing
+        slow = [index for index in self.order if self.update_periods[index] > 1]
+        for index in sorted(slow, key=lambda i: (-weights[i], -self.update_periods[i])):
+            period = self.update_periods[index]
+            phase = min(range(period), key=lambda p: (load[p::period].max(), load[p::period].sum()))
+            load[phase::period] += weights[index]
+            phases[index] = phase
+        return phases
+
+    def due(self, tick: int) -> ScheduledTick:
+        """
+        :param tick: number of the tick, counting from 0
+        :return: the channels that are due on the tick
+        """
+        cacheable = self.cycle <= self.max_cycle
+        slot = tick % self.cycle
+        if cacheable and slot in self._cache:
+            return self._cache[slot]
+
+        channels = []
+        variables = dict.fromkeys(self.tick_inputs)
+        for index in self.order:
+            evaluate = (slot - self.phases[index]) % self.update_periods[index] == 0
+            sample_period = self.sample_periods[index]
+            sample = sample_period is not None and slot % sample_period == 0
+            if evaluate or sample:
+                channels.append((index, evaluate, sample))
+            if sample or (evaluate and sample_period is None):
+                variables.update(dict.fromkeys(self.inputs[index]))
+        scheduled = ScheduledTick(tuple(channels), tuple(variables))
+        if cacheable:
+            self._cache[slot] = scheduled
+        return scheduled
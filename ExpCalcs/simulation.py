@@ -0,0 +1,258 @@
+import math
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from Expedition import Var
+
+__all__ = ["SIMULATED_VARS", "SimulatedClock", "SimulatedExpeditionDLL"]
+
+# Expedition vars that the simulation generates, other vars read as 0 until they are written
+SIMULATED_VARS = (
+    Var.Utc, Var.Bsp, Var.Awa, Var.Aws, Var.Twa, Var.Tws, Var.Twd, Var.Hdg, Var.Course, Var.Lwy, Var.Set,
+    Var.Drift, Var.Roll, Var.Pitch, Var.Rudder, Var.Vmg, Var.ROT, Var.Lat, Var.Lon, Var.Cog, Var.Sog, Var.Depth,
+    Var.AirTemp, Var.SeaTemp, Var.Baro,
+)
+
+# days from the OLE epoch, 1899-12-30, to 2024-01-01, the start of the simulated Utc
+_UTC_START = 45292.0
+
+
+class SimulatedClock:
+    """
+    A clock that only moves when it is told to, so a simulation can run faster than real time
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def advance(self, seconds: float) -> float:
+        self.time += seconds
+        return self.time
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class SimulatedExpeditionDLL:
+    """
+    Stand-in for the Expedition DLL that generates the instruments of a boat sailing upwind, for benchmarks and
+    for running without Expedition.
+
+    The true wind direction oscillates around a slowly wandering mean, with a persistent shift added every few
+    minutes, and the true wind speed gusts around its mean. The boat sails at its target angle on either tack and
+    tacks when it is headed, losing speed through the tack. The other instruments follow from these, with noise
+    on every reading.
+
+    The simulation is stepped every `step` seconds up to the time of `clock` when vars are read, so with a
+    SimulatedClock it runs as fast as it is read. Every DLL call can be made to take `latency` seconds, plus
+    `latency_per_var` seconds for each var of a batched call. The delays spin rather than sleep, so that sub
+    millisecond latencies are accurate. The calls are counted in `calls`, and the vars read and written in
+    `vars_read` and `vars_written`.
+
+    Vars in `invalid_vars` behave like vars Expedition has no value for: reading them alone returns None, and so
+    does a batched read that includes them.
+    """
+
+    def __init__(self,
+                 expedition_location: Optional[str] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 latency: float = 0.0,
+                 latency_per_var: float = 0.0,
+                 step: float = 0.1,
+                 seed: Optional[int] = 0,
+                 tws: float = 12.0,
+                 twd: float = 270.0,
+                 invalid_vars: Iterable[Var] = ()):
+        """
+        :param expedition_location: ignored, for the same signature as ExpeditionDLL
+        :param clock: time in seconds
+        :param latency: time every DLL call takes, in seconds
+        :param latency_per_var: extra time per var of a batched call, in seconds
+        :param step: time between steps of the simulation, in seconds
+        :param seed: seed of the random numbers, None for a different simulation every time
+        :param tws: mean true wind speed, in knots
+        :param twd: mean true wind direction, in degrees
+        :param invalid_vars: vars that have no value
+        """
+        self.clock = clock
+        self.latency = latency
+        self.latency_per_var = latency_per_var
+        self.step = step
+        self.invalid_vars = set(invalid_vars)
+        self.calls: Counter = Counter()
+        self.vars_read = 0
+        self.vars_written = 0
+        self.user_var_names: Dict[Var, str] = {}
+        self.tacks = 0
+
+        self._random = np.random.default_rng(seed)
+        self._start = clock()
+        self._time = 0.0
+        self._mean_tws = tws
+        self._mean_twd = twd
+        self._shift = 0.0  # persistent shift of the wind direction
+        self._next_shift = self._random.exponential(300.0)
+        self._wander = 0.0  # slow random walk of the wind direction
+        self._oscillation_period = self._random.uniform(360.0, 600.0)
+        self._gust = 0.0
+        self._tack = 1.0  # 1 on starboard, -1 on port
+        self._tacking = 0.0  # seconds left of the current tack
+        self._last_tack = 0.0
+        self._speed_loss = 0.0
+        self._twd, self._tws, self._twa, self._bsp = twd, tws, 42.0, 6.0
+        self._hdg = (twd - 42.0) % 360.0
+        self._rot = 0.0
+        self._rudder = 0.0
+        self._lat = 50.8
+        self._lon = -1.3
+        self._values: Dict[Var, float] = {}
+        self._written: Dict[Var, float] = {}
+        self._update_values(0.0)
+
+    def _wait(self, seconds: float):
+        if seconds > 0:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+
+    def update(self):
+        """
+        Step the simulation up to the time of the clock. Reads do this themselves, call it before them to keep the
+        cost of the simulation out of their timings
+        """
+        now = self.clock() - self._start
+        while self._time + self.step <= now:
+            self._time += self.step
+            self._simulate(self.step)
+
+    def _simulate(self, dt: float):
+        random = self._random
+
+        # wind: oscillating shifts around a wandering mean, a persistent shift every few minutes, and gusts
+        self._wander += random.normal(0.0, 0.05 * math.sqrt(dt))
+        if self._time >= self._next_shift:
+            self._shift += random.normal(0.0, 8.0)
+            self._next_shift = self._time + random.exponential(300.0)
+        self._gust += -self._gust * dt / 30.0 + random.normal(0.0, 0.4 * math.sqrt(dt))
+        mean_twd = self._mean_twd + self._shift + self._wander
+        twd = mean_twd + 7.0 * math.sin(2 * math.pi * self._time / self._oscillation_period)
+        tws = max(self._mean_tws + self._gust, 0.5)
+
+        # the boat tacks on a header of more than 5 degrees, at most once a minute
+        header = self._tack * (mean_twd - twd)
+        if not self._tacking and header > 5.0 and self._time - self._last_tack > 60.0:
+            self._tack = -self._tack
+            self._tacking = 8.0
+            self._last_tack = self._time
+            self.tacks += 1
+
+        target_twa = 38.0 + 0.3 * tws
+        target_hdg = twd - self._tack * target_twa
+        error = (target_hdg - self._hdg + 180.0) % 360.0 - 180.0
+        if self._tacking:
+            # turn through the wind at a steady rate, the boat slows down through the tack
+            turn = math.copysign(min(abs(error), 2 * target_twa / 8.0 * dt), error)
+            self._tacking = max(self._tacking - dt, 0.0)
+            self._speed_loss = min(self._speed_loss + 0.05 * dt, 0.4)
+        else:
+            turn = 0.5 * error * dt + random.normal(0.0, 0.3)
+            self._speed_loss *= math.exp(-dt / 20.0)
+        self._rot = turn / dt
+        self._rudder = -0.8 * turn / dt + random.normal(0.0, 0.5)
+        self._hdg = (self._hdg + turn) % 360.0
+
+        twa = (twd - self._hdg + 180.0) % 360.0 - 180.0
+        bsp = 7.5 * (1 - math.exp(-tws / 7.0)) * math.sin(math.radians(min(abs(twa), 90.0))) ** 0.3
+        bsp *= 1 - self._speed_loss
+        self._twd, self._tws, self._twa, self._bsp = twd % 360.0, tws, twa, bsp
+        self._update_values(dt)
+
+    def _update_values(self, dt: float):
+        random = self._random
+        twd, tws, twa, bsp = self._twd, self._tws, self._twa, self._bsp
+
+        # apparent wind from the true wind and the boat's speed
+        twa_rad = math.radians(twa)
+        aws = math.hypot(tws * math.sin(twa_rad), tws * math.cos(twa_rad) + bsp)
+        awa = math.degrees(math.atan2(tws * math.sin(twa_rad), tws * math.cos(twa_rad) + bsp))
+
+        # a steady tide of 0.5 knots setting south
+        leeway = 3.0 * math.copysign(1.0, twa) * min(6.0 / max(bsp, 1.0), 1.5)
+        course = (self._hdg - leeway) % 360.0
+        east = bsp * math.sin(math.radians(course))
+        north = bsp * math.cos(math.radians(course)) - 0.5
+        sog = math.hypot(east, north)
+        cog = math.degrees(math.atan2(east, north)) % 360.0
+        self._lat += north * dt / 3600.0 / 60.0
+        self._lon += east * dt / 3600.0 / 60.0 / math.cos(math.radians(self._lat))
+
+        noise = random.normal(0.0, 1.0, 10)
+        self._values.update({
+            Var.Utc: _UTC_START + self._time / 86400.0,
+            Var.Bsp: max(bsp + 0.05 * noise[0], 0.0),
+            Var.Awa: awa + 1.5 * noise[1],
+            Var.Aws: max(aws + 0.3 * noise[2], 0.0),
+            Var.Twa: twa + 2.0 * noise[3],
+            Var.Tws: max(tws + 0.4 * noise[4], 0.0),
+            Var.Twd: (twd + 2.0 * noise[5]) % 360.0,
+            Var.Hdg: (self._hdg + 0.5 * noise[6]) % 360.0,
+            Var.Course: course,
+            Var.Lwy: leeway,
+            Var.Set: 180.0,
+            Var.Drift: 0.5,
+            Var.Roll: math.copysign(min(1.6 * tws, 28.0), twa) + noise[7],
+            Var.Pitch: -0.5 + 0.2 * noise[8],
+            Var.Rudder: self._rudder,
+            Var.Vmg: bsp * math.cos(twa_rad),
+            Var.ROT: self._rot,
+            Var.Lat: self._lat,
+            Var.Lon: self._lon,
+            Var.Cog: (cog + 0.5 * noise[9]) % 360.0,
+            Var.Sog: sog,
+            Var.Depth: 25.0 + 2.0 * math.sin(self._time / 900.0),
+            Var.AirTemp: 18.0,
+            Var.SeaTemp: 15.0,
+            Var.Baro: 1013.0 - self._time / 3600.0,
+        })
+
+    def _value(self, var: Var) -> float:
+        if var in self._written:
+            return self._written[var]
+        return self._values.get(var, 0.0)
+
+    def get_exp_var_value(self, var: Var, boat: int = 0) -> Optional[float]:
+        self.calls['get_exp_var_value'] += 1
+        self.vars_read += 1
+        self._wait(self.latency + self.latency_per_var)
+        self.update()
+        if var in self.invalid_vars:
+            return None
+        return self._value(var)
+
+    def get_exp_vars(self, var_list: List[Var], boat: int = 0) -> Optional[List[float]]:
+        self.calls['get_exp_vars'] += 1
+        self.vars_read += len(var_list)
+        self._wait(self.latency + self.latency_per_var * len(var_list))
+        self.update()
+        if not self.invalid_vars.isdisjoint(var_list):
+            return None
+        return [self._value(var) for var in var_list]
+
+    def set_exp_var_value(self, var: Var, value: float, boat: int = 0):
+        self.calls['set_exp_var_value'] += 1
+        self.vars_written += 1
+        self._wait(self.latency + self.latency_per_var)
+        self._written[var] = value
+
+    def set_exp_vars(self, var_list: List[Var], value_list: List[float], boat: int = 0):
+        self.calls['set_exp_vars'] += 1
+        self.vars_written += len(var_list)
+        self._wait(self.latency + self.latency_per_var * len(var_list))
+        self._written.update(zip(var_list, value_list))
+
+    def set_exp_user_var_name(self, var: Var, name: str):
+        self.calls['set_exp_user_var_name'] += 1
+        self._wait(self.latency)
+        self.user_var_names[var] = name
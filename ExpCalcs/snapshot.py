@@ -0,0 +1,78 @@
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from Expedition import Var, ExpeditionDLL
+
+__all__ = ["InputSnapshot"]
+
+logger = logging.getLogger(__name__)
+
+
+class InputSnapshot:
+    """
+    The values of every Expedition var used by the math channels, read once per tick and shared by all calculators.
+
+    The vars are read with a single batched DLL call. Expedition rejects the whole batch if any var in it is not
+    valid, so when a batch fails the vars are read one at a time for that tick and the invalid ones are read
+    individually from then on, until they become valid again.
+
+    Vars that are written by a math channel earlier in the same tick are not read from Expedition, the channel
+    sets its result in the snapshot instead.
+    """
+
+    def __init__(self, variables: Iterable[Var], produced: Iterable[Var] = ()):
+        self.produced: Set[Var] = set(produced)
+        self.variables: List[Var] = [var for var in dict.fromkeys(variables) if var not in self.produced]
+        self.values: Dict[Var, float] = {var: np.nan for var in self.variables}
+        self.timestamp = time.monotonic()
+        self._invalid: Set[Var] = set()
+
+    def read(self, expedition: ExpeditionDLL, timestamp: Optional[float] = None,
+             variables: Optional[Sequence[Var]] = None):
+        """
+        Read the latest value of every var from Expedition
+        :param expedition: ExpeditionDLL
+        :param timestamp: time.monotonic() time of the tick, now if None
+        :param variables: only read these vars, the others keep their previous values. All the vars if None
+        """
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        if variables is None:
+            variables = self.variables
+        else:
+            variables = [var for var in variables if var not in self.produced]
+        invalid = [var for var in variables if var in self._invalid]
+        batch = [var for var in variables if var not in self._invalid]
+        values = expedition.get_exp_vars(batch) if batch else []
+        if values is None:
+            # find out which vars are not valid
+            values = []
+            for var in batch:
+                value = expedition.get_exp_var_value(var)
+                if value is None:
+                    logger.info("%s is not valid, reading it outside of the batch", var.name)
+                    self._invalid.add(var)
+                    value = np.nan
+                values.append(value)
+        self.values.update(zip(batch, values))
+
+        for var in invalid:
+            value = expedition.get_exp_var_value(var)
+            if value is None:
+                self.values[var] = np.nan
+            else:
+                self._invalid.discard(var)
+                self.values[var] = value
+
+    def set(self, var: Var, value: float):
+        """
+        Set the value of a var produced by a math channel during the tick
+        """
+        self.values[var] = value
+
+    def __getitem__(self, var: Var) -> float:
+        return self.values.get(var, np.nan)
+
+    def __contains__(self, var: Var) -> bool:
+        return var in self.values
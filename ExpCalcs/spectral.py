@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+
+__all__ = ["band_bins", "bin_power", "peak_period", "power_spectrum", "dominant_period", "band_power"]
+
+
+def band_bins(length: int, time_step: float, low: float = 0.0, high: float = math.inf) -> np.ndarray:
+    """
+    DFT bins of a window of samples between two frequencies, without the DC bin
+    :param length: number of samples in the window
+    :param time_step: time between samples in seconds
+    :param low: lowest frequency in Hz
+    :param high: highest frequency in Hz
+    :return: the bins, bin k is the frequency k / (length * time_step) Hz
+    """
+    duration = length * time_step
+    first_bin = max(math.ceil(low * duration - 1e-9), 1)
+    last_bin = length // 2 if math.isinf(high) else min(math.floor(high * duration + 1e-9), length // 2)
+    return np.arange(first_bin, last_bin + 1)
+
+
+def bin_power(spectrum: np.ndarray, bins: np.ndarray, length: int) -> np.ndarray:
+    """
+    One sided power of DFT bins, the Nyquist bin of an even length has no negative frequency twin
+    :param spectrum: DFT of the bins, along the last axis
+    :param bins: the bins
+    :param length: number of samples in the window
+    :return: power of each bin in the units of the samples squared
+    """
+    scale = np.where(2 * bins == length, 1.0, 2.0) / max(length, 1) ** 2
+    return scale * np.abs(spectrum) ** 2
+
+
+def peak_period(power: np.ndarray, bins: np.ndarray, length: int, time_step: float) -> np.ndarray:
+    """
+    Period of the strongest bin, refined by a parabola through the peak and its neighbours for a finer estimate
+    than the bin spacing
+    :param power: power of the bins, along the last axis
+    :param bins: the bins
+    :param length: number of samples in the window
+    :param time_step: time between samples in seconds
+    :return: period in seconds, NaN if there is no signal or any power is NaN
+    """
+    power = np.asarray(power, dtype=float)
+    if not bins.size:
+        return np.full(power.shape[:-1], np.nan)
+    peak = np.argmax(power, axis=-1)[..., np.newaxis]
+    highest = np.take_along_axis(power, peak, axis=-1)[..., 0]
+    below = np.take_along_axis(power, np.maximum(peak - 1, 0), axis=-1)[..., 0]
+    above = np.take_along_axis(power, np.minimum(peak + 1, bins.size - 1), axis=-1)[..., 0]
+    peak = peak[..., 0]
+    curvature = below - 2.0 * highest + above
+    refined = (peak > 0) & (peak < bins.size - 1) & (curvature < 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offset = np.where(refined, 0.5 * (below - above) / np.where(refined, curvature, 1.0), 0.0)
+        periods = length * time_step / (bins[peak] + offset)
+    invalid = np.isnan(power).any(axis=-1) | ~(highest > 0.0)
+    return np.where(invalid, np.nan, periods)
+
+
+def power_spectrum(samples, time_step: float = 1.0):
+    """
+    One sided power spectrum of evenly spaced samples, without the DC bin
+    :param samples: the samples, in either order, along the last axis
+    :param time_step: time between samples in seconds
+    :return: (frequencies in Hz, power of each frequency in the units of the samples squared)
+    """
+    samples = np.asarray(samples, dtype=float)
+    length = samples.shape[-1]
+    bins = band_bins(length, time_step)
+    spectrum = np.fft.rfft(samples, axis=-1)[..., bins]
+    return bins / (length * time_step), bin_power(spectrum, bins, length)
+
+
+def dominant_period(samples, time_step: float = 1.0):
+    """
+    Period of the strongest frequency in the samples, e.g. the pitch or heave period, refined between bins
+    :param samples: the samples, in either order, along the last axis
+    :param time_step: time between samples in seconds
+    :return: period in seconds, NaN if there is no signal or any sample is NaN
+    """
+    samples = np.asarray(samples, dtype=float)
+    length = samples.shape[-1]
+    _, power = power_spectrum(samples, time_step)
+    period = peak_period(power, band_bins(length, time_step), length, time_step)
+    return float(period) if period.ndim == 0 else period
+
+
+def band_power(samples, low: float, high: float, time_step: float = 1.0):
+    """
+    Power of the samples between two frequencies, the part of their variance in that band
+    :param samples: the samples, in either order, along the last axis
+    :param low: lowest frequency in Hz
+    :param high: highest frequency in Hz
+    :param time_step: time between samples in seconds
+    :return: power in the units of the samples squared, NaN if the band has no frequencies or any sample is NaN
+    """
+    samples = np.asarray(samples, dtype=float)
+    length = samples.shape[-1]
+    bins = band_bins(length, time_step, low, high)
+    if not bins.size:
+        return np.nan if samples.ndim == 1 else np.full(samples.shape[:-1], np.nan)
+    power = np.sum(bin_power(np.fft.rfft(samples, axis=-1)[..., bins], bins, length), axis=-1)
+    return float(power) if power.ndim == 0 else power
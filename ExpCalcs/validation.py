@@ -0,0 +1,314 @@
+import ast
+import functools
+import sys
+from enum import Enum
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from .expression import ExpressionError, compile_expression
+from .filters import FILTERS
+from .calculator import DEFAULT_FUNCTIONS, POLAR_FUNCTIONS, WINDOW_FUNCTIONS
+
+__all__ = ["Shape", "FunctionSignature", "SIGNATURES", "FUNCTIONS", "CONSTANTS", "check_expression",
+           "expression_error"]
+
+
+class Shape(Enum):
+    """
+    What an expression or a part of it gives when it is evaluated
+    """
+    SCALAR = "a single value"
+    WINDOW = "a window of values"
+    UNKNOWN = "unknown"
+
+
+class FunctionSignature(NamedTuple):
+    """
+    How a function of the expressions is called and what it gives
+    """
+    min_arguments: int
+    max_arguments: int
+    kind: str  # 'elementwise', 'reduction', 'array', 'filter' or 'unknown'
+    keywords: bool = True  # whether it takes keyword arguments, e.g. numpy's axis or ddof
+    windowed: bool = False  # only available to channels with a window
+    polar: bool = False  # only available to channels with a polar file
+    hint: str = ""  # added to the error of a call with the wrong number of arguments
+
+
+def _signatures(names: str, *args, **kwargs) -> Dict[str, FunctionSignature]:
+    return {name: FunctionSignature(*args, **kwargs) for name in names.split()}
+
+
+# the number of arguments of the functions and the shape of what they give. Which functions there are and which
+# channels can use them comes from the calculator, see DEFAULT_FUNCTIONS, WINDOW_FUNCTIONS, POLAR_FUNCTIONS and
+# FILTERS. A function that is not described here takes any arguments and gives a shape only known at run time
+SIGNATURES: Dict[str, FunctionSignature] = {
+    **_signatures("sin cos tan arcsin arccos arctan sinh cosh tanh arcsinh arccosh arctanh degrees radians abs sqrt "
+                  "exp log log2 log10 ceil floor trunc rint fix expm1 log1p sign square cbrt reciprocal negative "
+                  "positive signbit wrap_heading", 1, 1, 'elementwise'),
+    **_signatures("hypot arctan2 heaviside power copysign", 2, 2, 'elementwise'),
+    'clip': FunctionSignature(3, 3, 'elementwise'),
+    'round': FunctionSignature(1, 2, 'elementwise'),
+    **_signatures("mean median sum prod std var rolling_median", 1, 2, 'reduction'),
+    # numpy's min and max, whose second argument is the axis, not a value to compare with as in Python
+    **_signatures("min max", 1, 1, 'reduction', hint="use clip(x, low, high) to limit a value"),
+    'average': FunctionSignature(1, 3, 'reduction'),
+    'trapz': FunctionSignature(1, 3, 'reduction'),
+    'rolling_quantile': FunctionSignature(2, 3, 'reduction'),
+    **_signatures("circmean circstd", 1, 1, 'reduction', keywords=False),
+    **_signatures("unwrap cumsum cumprod gradient", 1, 2, 'array'),
+    'diff': FunctionSignature(1, 3, 'array'),
+    'cross': FunctionSignature(2, 2, 'array'),
+    'dominant_period': FunctionSignature(1, 1, 'reduction', keywords=False),
+    'band_power': FunctionSignature(3, 3, 'reduction', keywords=False),
+    **_signatures("ema lowpass highpass lowpass2 highpass2 delay", 1, 2, 'filter', keywords=False),
+    'deriv': FunctionSignature(1, 1, 'filter', keywords=False),
+    'polar_bsp': FunctionSignature(2, 2, 'elementwise', keywords=False),
+    **_signatures("target_twa target_bsp", 1, 2, 'elementwise', keywords=False),
+}
+
+_UNKNOWN_SIGNATURE = FunctionSignature(0, sys.maxsize, 'unknown')
+
+
+def _functions() -> Dict[str, FunctionSignature]:
+    def signature(name: str, **kwargs) -> FunctionSignature:
+        return SIGNATURES.get(name, _UNKNOWN_SIGNATURE)._replace(**kwargs)
+
+    functions = {name: signature(name) for name in DEFAULT_FUNCTIONS}
+    # filters keep a state of their own for each call, see StatefulFilters
+    functions.update({name: signature(name, kind='filter', keywords=False) for name in FILTERS})
+    functions.update({name: signature(name, windowed=True) for name in WINDOW_FUNCTIONS})
+    functions.update({name: signature(name, polar=True) for name in POLAR_FUNCTIONS})
+    return functions
+
+
+# the functions of the expressions and the channels they are available to
+FUNCTIONS: Dict[str, FunctionSignature] = _functions()
+
+# the variables Calculator makes available to expressions, see add_default_variables
+CONSTANTS: Set[str] = {'pi', 'e'}
+
+_BOUND_NAME_NODES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def check_expression(expression: str,
+                     input_names: Iterable[str],
+                     windowed: bool = False,
+                     polar: bool = False) -> Shape:
+    """
+    Check a math channel expression without evaluating it: that it parses, that every name is an input, a
+    constant or a function available to the channel, that functions get the number of arguments they take, and
+    that the expression gives a single value. The inputs of a channel with a window are windows, which have to be
+    reduced, e.g. by mean() or max(), or indexed, e.g. `bsp[0]` for the newest sample.
+    :param expression: the expression
+    :param input_names: the local names of the channel's inputs
+    :param windowed: if the channel has a window
+    :param polar: if the channel has a polar file
+    :return: the shape of the result, SCALAR, or UNKNOWN if it depends on values only known at run time
+    :raises ExpressionError: if the expression is not valid
+    """
+    tree = compile_expression(expression).tree
+    input_names = list(input_names)
+    functions = {name: signature for name, signature in FUNCTIONS.items()
+                 if (windowed or not signature.windowed) and (polar or not signature.polar)}
+    for name in input_names:
+        if not name.isidentifier():
+            raise ExpressionError(f"Input name '{name}' is not a valid name")
+        if name in FUNCTIONS or name in CONSTANTS:
+            raise ExpressionError(f"Input name '{name}' is already the name of a function or constant")
+
+    shape = _ShapeChecker(expression, set(input_names), functions, windowed).check(tree.body)
+    if shape is Shape.WINDOW:
+        if windowed:
+            raise ExpressionError(f"Expression '{expression}' gives a window rather than a single value, reduce "
+                                  f"its inputs with e.g. mean() or max(), or remove the window length")
+        raise ExpressionError(f"Expression '{expression}' gives an array rather than a single value")
+    return shape
+
+
+@functools.lru_cache(maxsize=1024)
+def expression_error(expression: str,
+                     input_names: Tuple[str, ...],
+                     windowed: bool = False,
+                     polar: bool = False) -> Optional[str]:
+    """
+    Check a math channel expression, see check_expression(). The result is cached, so that the config, the GUI
+    and the engine can all ask for the errors of the channels without checking each expression again.
+    :param expression: the expression
+    :param input_names: the local names of the channel's inputs
+    :param windowed: if the channel has a window
+    :param polar: if the channel has a polar file
+    :return: what is wrong with the expression, None if it is valid
+    """
+    try:
+        check_expression(expression, input_names, windowed, polar)
+    except ExpressionError as e:
+        return str(e)
+    return None
+
+
+class _ShapeChecker:
+    def __init__(self, expression: str, input_names: Set[str], functions: Dict[str, FunctionSignature],
+                 windowed: bool):
+        self.expression = expression
+        self.input_names = input_names
+        self.functions = functions
+        self.windowed = windowed
+        self.bound: Set[str] = set()  # names bound inside the expression, e.g. by a lambda or comprehension
+
+    def error(self, message: str) -> ExpressionError:
+        return ExpressionError(f"Invalid expression '{self.expression}': {message}")
+
+    def check(self, node: ast.AST) -> Shape:
+        method = getattr(self, f"check_{type(node).__name__}", None)
+        if method is not None:
+            return method(node)
+        if isinstance(node, _BOUND_NAME_NODES):
+            return self.check_scope(node)
+        # anything else is checked for its names and gives a shape only known at run time
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.expr):
+                self.check(child)
+        return Shape.UNKNOWN
+
+    @staticmethod
+    def combine(*shapes: Shape) -> Shape:
+        if Shape.WINDOW in shapes:
+            return Shape.WINDOW
+        if Shape.UNKNOWN in shapes:
+            return Shape.UNKNOWN
+        return Shape.SCALAR
+
+    def check_Constant(self, node: ast.Constant) -> Shape:
+        return Shape.SCALAR
+
+    def check_Name(self, node: ast.Name) -> Shape:
+        if node.id in self.bound:
+            return Shape.UNKNOWN
+        if node.id in self.input_names:
+            return Shape.WINDOW if self.windowed else Shape.SCALAR
+        if node.id in CONSTANTS:
+            return Shape.SCALAR
+        if node.id in self.functions:
+            raise self.error(f"'{node.id}' is a function, call it with its arguments, e.g. {node.id}(x)")
+        if node.id in FUNCTIONS:
+            raise self.error(f"'{node.id}' is only available to {self.availability(FUNCTIONS[node.id])}")
+        raise self.error(f"unknown name '{node.id}', it is not an input, constant or function")
+
+    @staticmethod
+    def availability(signature: FunctionSignature) -> str:
+        return "channels with a window length" if signature.windowed else "channels with a polar file"
+
+    def check_BinOp(self, node: ast.BinOp) -> Shape:
+        return self.combine(self.check(node.left), self.check(node.right))
+
+    def check_UnaryOp(self, node: ast.UnaryOp) -> Shape:
+        return self.check(node.operand)
+
+    def check_Compare(self, node: ast.Compare) -> Shape:
+        return self.combine(*[self.check(child) for child in [node.left] + node.comparators])
+
+    def check_BoolOp(self, node: ast.BoolOp) -> Shape:
+        shapes = []
+        for value in node.values:
+            shape = self.check(value)
+            if shape is Shape.WINDOW:
+                raise self.error(f"'{ast.unparse(value)}' is a window, which can not be used with 'and', 'or' or "
+                                 f"'if', reduce it first")
+            shapes.append(shape)
+        return self.combine(*shapes)
+
+    def check_IfExp(self, node: ast.IfExp) -> Shape:
+        if self.check(node.test) is Shape.WINDOW:
+            raise self.error(f"'{ast.unparse(node.test)}' is a window, which can not be used with 'and', 'or' or "
+                             f"'if', reduce it first")
+        return self.combine(self.check(node.body), self.check(node.orelse))
+
+    def check_Subscript(self, node: ast.Subscript) -> Shape:
+        value = self.check(node.value)
+        index = self.check(node.slice)
+        if value is Shape.SCALAR:
+            raise self.error(f"'{ast.unparse(node.value)}' is a single value, which can not be indexed")
+        if isinstance(node.slice, ast.Slice) or index is not Shape.SCALAR:
+            return value
+        return Shape.SCALAR if value is Shape.WINDOW else Shape.UNKNOWN
+
+    def check_Slice(self, node: ast.Slice) -> Shape:
+        for child in (node.lower, node.upper, node.step):
+            if child is not None:
+                self.check(child)
+        return Shape.SCALAR
+
+    def check_List(self, node: ast.List) -> Shape:
+        for child in node.elts:
+            self.check(child)
+        return Shape.WINDOW
+
+    check_Tuple = check_List
+    check_Set = check_List
+
+    def check_Call(self, node: ast.Call) -> Shape:
+        arguments = [self.check(arg) for arg in node.args]
+        for keyword in node.keywords:
+            self.check(keyword.value)
+        if not isinstance(node.func, ast.Name) or node.func.id in self.bound:
+            # e.g. a method of a window, bsp.mean()
+            self.check(node.func)
+            return Shape.UNKNOWN
+
+        name = node.func.id
+        if name in self.input_names or name in CONSTANTS:
+            raise self.error(f"'{name}' is not a function")
+        if name not in self.functions:
+            if name in FUNCTIONS:
+                raise self.error(f"{name}() is only available to {self.availability(FUNCTIONS[name])}")
+            raise self.error(f"unknown function '{name}'")
+        signature = self.functions[name]
+
+        if not any(isinstance(arg, ast.Starred) for arg in node.args):
+            count = len(node.args)
+            if not signature.min_arguments <= count <= signature.max_arguments:
+                expected = (f"{signature.min_arguments}" if signature.min_arguments == signature.max_arguments
+                            else f"{signature.min_arguments} to {signature.max_arguments}")
+                plural = "" if expected == "1" else "s"
+                hint = f", {signature.hint}" if signature.hint else ""
+                raise self.error(f"{name}() takes {expected} argument{plural}, not {count}{hint}")
+        if node.keywords and not signature.keywords:
+            raise self.error(f"{name}() does not take keyword arguments")
+
+        if signature.kind == 'unknown':
+            return Shape.UNKNOWN
+        if signature.kind == 'reduction':
+            return Shape.SCALAR if not node.keywords else Shape.UNKNOWN
+        if signature.kind == 'filter':
+            if Shape.WINDOW in arguments:
+                raise self.error(f"{name}() filters a single value over time, not a window, reduce it first or "
+                                 f"remove the window length")
+            return Shape.SCALAR
+        return self.combine(*arguments)
+
+    def check_Starred(self, node: ast.Starred) -> Shape:
+        self.check(node.value)
+        return Shape.UNKNOWN
+
+    def check_scope(self, node: ast.AST) -> Shape:
+        # names bound by a lambda or comprehension are known inside it, with a shape only known at run time
+        bound = self.bound
+        self.bound = bound | {child.id for child in ast.walk(node)
+                              if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store)}
+        if isinstance(node, ast.Lambda):
+            self.bound |= {arg.arg for arg in node.args.args + node.args.kwonlyargs}
+        try:
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.expr):
+                    self.check(child)
+                elif isinstance(child, ast.comprehension):
+                    for part in [child.iter] + child.ifs:
+                        self.check(part)
+        finally:
+            self.bound = bound
+        return Shape.WINDOW if isinstance(node, (ast.ListComp, ast.SetComp)) else Shape.UNKNOWN
+
+    def check_NamedExpr(self, node: ast.NamedExpr) -> Shape:
+        shape = self.check(node.value)
+        self.bound.add(node.target.id)
+        return shape
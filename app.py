@@ -13,6 +13,7 @@ else:
 import ExpCalcs
 from ui.dialogs import MathChannelConfigDialog
 from ui.debug import DebugDialog
+from ui.performance import PerformanceDialog
 from ui.about import AboutDialog
 
 from typing import Optional, Dict, List
@@ -51,8 +52,14 @@ class ExpCalcsWidget(QtWidgets.QWidget):
         super().__init__()
         self.config = None
         self.expedition = None
+        self.expedition_path: Optional[str] = None
+        self.engine: Optional[ExpCalcs.Engine] = None
+        self.runner: Optional[ExpCalcs.EngineRunner] = None
         self.calculators: List[ExpCalcs.MathChannelCalculator] = []
         self.timer_step = 0.1
+        self.display_step = 0.2
+        self.displayed_tick: Optional[int] = None
+        self.performance_dialog: Optional[PerformanceDialog] = None
 
         self.layout = QtWidgets.QVBoxLayout(self)
         self.config_tree = QtWidgets.QTreeWidget()
@@ -95,10 +102,11 @@ class ExpCalcsWidget(QtWidgets.QWidget):
         self.delete_button.clicked.connect(self.on_delete_math_channel)
         self.debug_info_button.clicked.connect(self.on_debug_info)
 
-        self.calc_timer = QtCore.QTimer()
-        self.calc_timer.timeout.connect(self.update_10hz)
-        timer_interval = int(self.timer_step * 1000)  # convert to milliseconds
-        self.calc_timer.start(timer_interval)
+        # the channels are calculated in the runner's worker thread, the GUI polls the latest results
+        self.display_timer = QtCore.QTimer()
+        self.display_timer.timeout.connect(self.update_values)
+        timer_interval = int(self.display_step * 1000)  # convert to milliseconds
+        self.display_timer.start(timer_interval)
 
     @QtCore.Slot()
     def on_load_default_config(self):
@@ -111,7 +119,13 @@ class ExpCalcsWidget(QtWidgets.QWidget):
             try:
                 with open(file_path) as f:
                     config = ExpCalcs.Config.model_validate_json(f.read())
-                    return config
+                # channels with an invalid expression are disabled, the others still run
+                invalid = config.invalid_math_channels()
+                if invalid:
+                    errors = "\n".join(f"{math_channel.name}: {error}" for math_channel, error in invalid)
+                    QtWidgets.QMessageBox.warning(self, "Warning",
+                                                  f"These math channels are disabled until they are fixed:\n{errors}")
+                return config
             except ValidationError as e:
                 print(f"Error loading config from file: {e}")
                 # show error message in a qt popup
@@ -127,24 +141,47 @@ class ExpCalcsWidget(QtWidgets.QWidget):
 
     def apply_config(self):
         if self.config is not None:
+            self.stop_engine()
+            # the DLL is only loaded again if the install path has changed, so the new engine can carry over the
+            # histories and the channels that have not changed from the previous one
+            if self.expedition is None or self.expedition_path != self.config.expedition.install_path:
+                try:
+                    self.expedition = ExpeditionDLL(self.config.expedition.install_path)
+                except Exception as e:
+                    self.expedition = None
+                    QtWidgets.QMessageBox.critical(self, "Error", f"Error loading expedition: {e}")
+                    return
+                self.expedition_path = self.config.expedition.install_path
+
+            self.update_channel_tree()
             try:
-                self.expedition = ExpeditionDLL(self.config.expedition.install_path)
-            except Exception as e:
-                QtWidgets.QMessageBox.critical(self, "Error", f"Error loading expedition: {e}")
+                self.engine = ExpCalcs.Engine(self.config, self.expedition, time_step=self.timer_step,
+                                              previous=self.engine)
+            except ExpCalcs.ChannelGraphError as e:
+                self.engine = None
+                self.calculators = []
+                QtWidgets.QMessageBox.critical(self, "Error", f"Error building math channels: {e}")
                 return
-
-            self.config_tree.clear()
-            self.channel_items = {}
-            self.calculators = []
-
-            for math_channel in self.config.math_channels:
-                self.add_chanel_tree_item(math_channel, self.config_tree)
-                calculator = ExpCalcs.Calculator.from_config(math_channel, self.expedition, time_step=0.1)
-                self.calculators.append(calculator)
+            self.calculators = self.engine.calculators
+            self.runner = ExpCalcs.EngineRunner(self.engine)
+            self.runner.start()
 
         else:
             QtWidgets.QMessageBox.critical(self, "Error", "No config loaded")
 
+    def update_channel_tree(self):
+        # only make new items for the channels that have changed, the others keep their item and last value
+        unchanged = [self.config_tree.takeTopLevelItem(0) for _ in range(self.config_tree.topLevelItemCount())]
+        self.channel_items = {}
+        for math_channel in self.config.math_channels:
+            channel_item = next((item for item in unchanged if item.data(0, QtCore.Qt.UserRole) == math_channel), None)
+            if channel_item is None:
+                self.add_chanel_tree_item(math_channel, self.config_tree)
+                continue
+            unchanged.remove(channel_item)
+            self.config_tree.addTopLevelItem(channel_item)
+            self.channel_items[math_channel.name] = channel_item
+
     def add_chanel_tree_item(self, channel, parent):
         channel_item = QtWidgets.QTreeWidgetItem(parent, [channel.name])
 
@@ -161,11 +198,21 @@ class ExpCalcsWidget(QtWidgets.QWidget):
             channel_item.setText(Column.OutputLabel, channel.output_expedition_user_name)
         self.channel_items[channel.name] = channel_item
 
+    def stop_engine(self):
+        if self.runner is not None:
+            self.runner.stop()
+            self.runner = None
+        self.displayed_tick = None
+
     @QtCore.Slot()
-    def update_10hz(self):
-        for calculator in self.calculators:
+    def update_values(self):
+        latest = self.runner.latest if self.runner is not None else None
+        if latest is None or latest.tick == self.displayed_tick:
+            return
+
+        self.displayed_tick = latest.tick
+        for calculator, result in zip(self.calculators, latest.values):
             name = calculator.config.name
-            result = calculator.calculate()
 
             channel_item = self.channel_items.get(name, None)
             if channel_item:
@@ -180,10 +227,21 @@ class ExpCalcsWidget(QtWidgets.QWidget):
             except ValidationError as e:
                 QtWidgets.QMessageBox.critical(self, "Error", f"Error creating config: {e}")
                 return
+            if not self.check_math_channels(self.config.math_channels + [new_config]):
+                return
             self.config.math_channels.append(new_config)
             self.save()
             self.apply_config()
 
+    def check_math_channels(self, math_channels: List[ExpCalcs.MathChannelConfig]) -> bool:
+        # channels can depend on each other, so check that the changed channels can still be evaluated in order
+        try:
+            ExpCalcs.evaluation_order(math_channels)
+        except ExpCalcs.ChannelGraphError as e:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Error updating math channels: {e}")
+            return False
+        return True
+
     def on_delete_math_channel(self):
         selected_items = self.config_tree.selectedItems()
         if selected_items:
@@ -208,9 +266,17 @@ class ExpCalcsWidget(QtWidgets.QWidget):
             if channel_config:
                 dialog = MathChannelConfigDialog(self, channel_config)
                 if dialog.exec() == QtWidgets.QDialog.Accepted:
-                    updated_config = dialog.get_config()
+                    try:
+                        updated_config = dialog.get_config()
+                    except ValidationError as e:
+                        QtWidgets.QMessageBox.critical(self, "Error", f"Error updating config: {e}")
+                        return
                     # Update the config in the list
                     index = self.config.math_channels.index(channel_config)
+                    math_channels = list(self.config.math_channels)
+                    math_channels[index] = updated_config
+                    if not self.check_math_channels(math_channels):
+                        return
                     self.config.math_channels[index] = updated_config
                     self.save()
                     self.apply_config()
@@ -222,11 +288,32 @@ class ExpCalcsWidget(QtWidgets.QWidget):
             # get the channel from the selected item data
             channel_config = selected_item.data(0, QtCore.Qt.UserRole)
             if channel_config:
-                index = self.config.math_channels.index(channel_config) # calculators are in the same order as the config
-                calculator = self.calculators[index]
+                # channels with an invalid expression are disabled and have no calculator
+                calculator = next((calculator for calculator in self.calculators
+                                   if calculator.config == channel_config), None)
+                if calculator is None:
+                    QtWidgets.QMessageBox.warning(self, "Warning",
+                                                  f"{channel_config.name} is disabled: "
+                                                  f"{channel_config.expression_error()}")
+                    return
                 debug_dialog = DebugDialog(calculator, self)
                 debug_dialog.exec()
 
+    def on_performance(self):
+        # the dialog is not modal, so the channels can be edited while it is open, and it follows the current engine
+        if self.performance_dialog is None:
+            self.performance_dialog = PerformanceDialog(self.engine_stats, self.reset_engine_stats, self)
+        self.performance_dialog.show()
+        self.performance_dialog.raise_()
+        self.performance_dialog.refresh_timer.start(1000)
+
+    def engine_stats(self) -> Optional[Dict]:
+        return self.runner.stats() if self.runner is not None else None
+
+    def reset_engine_stats(self):
+        if self.engine is not None:
+            self.engine.reset_stats()
+
     def save(self):
         # save the config to file
         if self.config:
@@ -254,11 +341,20 @@ class MainWindow(QtWidgets.QMainWindow):
         self.add_channel_action = QtGui.QAction("Add Channel", self)
         self.add_channel_action.triggered.connect(self.exp_calcs.on_add_math_channel)
 
+        self.view_menu = self.menu_bar.addMenu("View")
+        self.performance_action = QtGui.QAction("Performance", self)
+        self.performance_action.triggered.connect(self.exp_calcs.on_performance)
+        self.view_menu.addAction(self.performance_action)
+
         self.help_menu = self.menu_bar.addMenu("Help")
         self.about_action = QtGui.QAction("About", self)
         self.about_action.triggered.connect(self.show_about_dialog)
         self.help_menu.addAction(self.about_action)
 
+    def closeEvent(self, event):
+        self.exp_calcs.stop_engine()
+        super().closeEvent(event)
+
     def show_about_dialog(self):
         about_dialog = AboutDialog(self)
         about_dialog.exec()
@@ -20,6 +20,12 @@ class DummyExpeditionDLL:
         """
         pass
 
+    def set_exp_vars(self, vars, values):
+        """
+        Simulate setting multiple variables in the Expedition DLL.
+        """
+        pass
+
     def get_exp_vars(self, vars):
         """
         Simulate getting multiple variables from the Expedition DLL.
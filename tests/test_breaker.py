@@ -0,0 +1,73 @@
+import math
+import unittest
+
+from ExpCalcs.breaker import ErrorBreaker
+
+
+class _Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class ErrorBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.breaker = ErrorBreaker("Channel", max_skipped=16, log_interval=60.0, clock=self.clock)
+        self.variables = {'bsp': 6.0}
+
+    def skipped_before_retry(self) -> int:
+        skipped = 0
+        while not self.breaker.allow(self.variables):
+            skipped += 1
+        return skipped
+
+    def test_opens_and_backs_off(self):
+        with self.assertLogs("ExpCalcs.breaker"):
+            self.breaker.failure("division by zero", self.variables)
+            self.assertTrue(self.breaker.is_open)
+            skips = []
+            for _ in range(8):
+                skips.append(self.skipped_before_retry())
+                self.breaker.failure("division by zero", self.variables)
+        self.assertEqual(skips, [0, 1, 3, 7, 15, 16, 16, 16])
+
+    def test_retries_when_an_input_changes(self):
+        with self.assertLogs("ExpCalcs.breaker"):
+            for _ in range(4):
+                self.breaker.failure("division by zero", self.variables)
+        self.assertFalse(self.breaker.allow(self.variables))
+        self.assertTrue(self.breaker.allow({'bsp': math.nan}))
+
+    def test_backoff_is_capped(self):
+        with self.assertLogs("ExpCalcs.breaker"):
+            for _ in range(10_000):
+                self.breaker.failure("division by zero", self.variables)
+        self.assertEqual(self.skipped_before_retry(), 16)
+
+    def test_logs_each_run_of_failures(self):
+        with self.assertLogs("ExpCalcs.breaker", level="INFO") as logs:
+            self.breaker.failure("division by zero", self.variables)
+            self.clock.time = 10.0
+            self.breaker.failure("division by zero", self.variables)
+            self.breaker.success()
+            # a failure after a quiet period, and within log_interval of the last log, is the first of a new run
+            self.clock.time = 1000.0
+            self.breaker.failure("name 'x' is not defined", self.variables)
+            self.clock.time = 1070.0
+            self.breaker.failure("name 'x' is not defined", self.variables)
+            self.breaker.success()
+        self.assertEqual([record.getMessage() for record in logs.records], [
+            "Error evaluating channel 'Channel': division by zero",
+            "Channel 'Channel' recovered after 2 failures in 10s, 0 evaluations skipped",
+            "Error evaluating channel 'Channel': name 'x' is not defined",
+            "Channel 'Channel' failed 1 times in 70s, 0 evaluations skipped, last error: name 'x' is not defined",
+            "Channel 'Channel' recovered after 2 failures in 70s, 0 evaluations skipped",
+        ])
+        self.assertFalse(self.breaker.is_open)
+
+
+if __name__ == "__main__":
+    unittest.main()
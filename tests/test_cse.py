@@ -0,0 +1,75 @@
+import logging
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.replay import LogExpedition
+
+
+def _channel(index: int, expression: str, inputs, **kwargs) -> MathChannelConfig:
+    return MathChannelConfig(name=f"Channel{index}", output_expedition_var_enum_string=f"User{index}",
+                             expression=expression,
+                             inputs=[InputVar(expedition_var_enum_string=var, local_var_name=local)
+                                     for var, local in inputs],
+                             **kwargs)
+
+
+class SharedSubexpressionsTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        rng = np.random.default_rng(7)
+        rows = 200
+        self.times = 100.0 + np.arange(rows) * 0.1
+        bsp = 6.0 + rng.normal(0.0, 1.0, rows)
+        # the boat stops now and then, so the shared division gives inf
+        bsp[::17] = 0.0
+        bsp[50:53] = np.nan
+        self.columns = {Var.Bsp: bsp, Var.Twa: rng.uniform(-180.0, 180.0, rows), Var.Tws: rng.uniform(5, 25, rows)}
+        self.math_channels = [
+            # the same terms under different local names
+            _channel(0, "bsp * cos(radians(twa)) + 1", [("Bsp", "bsp"), ("Twa", "twa")]),
+            _channel(1, "2 * b * cos(radians(t))", [("Bsp", "b"), ("Twa", "t")]),
+            _channel(2, "tws * cos(radians(twa)) / bsp", [("Tws", "tws"), ("Twa", "twa"), ("Bsp", "bsp")]),
+            _channel(3, "tws * cos(radians(twa)) / bsp - 1", [("Tws", "tws"), ("Twa", "twa"), ("Bsp", "bsp")]),
+            _channel(4, "wrap_heading(twa + 180 * sin(radians(twa)))", [("Twa", "twa")], output_is_heading=True),
+            # a channel that reads another's output, and filters that must not be shared
+            _channel(5, "user0 * cos(radians(twa)) + ema(bsp, 2)", [("User0", "user0"), ("Twa", "twa"),
+                                                                    ("Bsp", "bsp")]),
+            _channel(6, "ema(bsp, 2) - user0 * cos(radians(twa))", [("User0", "user0"), ("Twa", "twa"),
+                                                                    ("Bsp", "bsp")]),
+        ]
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_shared_and_unshared_results_are_the_same(self):
+        config = Config(expedition=ExpeditionConfig(install_path=""), math_channels=self.math_channels)
+        expedition = LogExpedition(self.columns)
+        shared = Engine(config, expedition)
+        self.assertIsNotNone(shared.shared)
+        self.assertTrue(shared.shared.terms)
+
+        # every channel on an engine of its own shares nothing, the output of the first channel is read from the log
+        columns = dict(self.columns)
+        columns[Var.User0] = columns[Var.Bsp] * np.cos(np.radians(columns[Var.Twa])) + 1
+        alone = [Engine(Config(expedition=ExpeditionConfig(install_path=""), math_channels=[math_channel]),
+                        LogExpedition(columns))
+                 for math_channel in self.math_channels]
+
+        for row, timestamp in enumerate(self.times):
+            expedition.row = row
+            with np.errstate(divide='ignore'):
+                results = shared.tick(float(timestamp))
+            for math_channel, engine, result in zip(self.math_channels, alone, results):
+                engine.expedition.row = row
+                with np.errstate(divide='ignore'):
+                    expected, = engine.tick(float(timestamp))
+                self.assertIsNone(engine.shared)
+                with self.subTest(channel=math_channel.name, row=row):
+                    np.testing.assert_allclose(result, expected, rtol=1e-12, equal_nan=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import logging
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.replay import LogExpedition
+
+
+def _channel(name: str, output: str, expression: str, var: str, **kwargs) -> MathChannelConfig:
+    return MathChannelConfig(name=name, output_expedition_var_enum_string=output, expression=expression,
+                             inputs=[InputVar(expedition_var_enum_string=var, local_var_name=var.lower())],
+                             **kwargs)
+
+
+class ReconfigurationTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        rng = np.random.default_rng(13)
+        rows = 600
+        self.times = 100.0 + np.arange(rows) * 0.1
+        self.columns = {Var.Bsp: 6.0 + rng.normal(0.0, 1.0, rows), Var.Tws: 12.0 + rng.normal(0.0, 2.0, rows)}
+        self.math_channels = [
+            _channel("Rolling", "User0", "mean(bsp)", "Bsp", window_length="10s"),
+            _channel("Filtered", "User1", "ema(tws, 5)", "Tws"),
+            _channel("Edited rolling", "User2", "std(bsp)", "Bsp", window_length="10s"),
+            _channel("Edited filter", "User3", "ema(tws, 5)", "Tws"),
+        ]
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    @staticmethod
+    def config(math_channels) -> Config:
+        return Config(expedition=ExpeditionConfig(install_path=""), math_channels=math_channels)
+
+    def test_unchanged_channels_keep_their_state(self):
+        expedition = LogExpedition(self.columns)
+        engine = Engine(self.config(self.math_channels), expedition)
+        # the same channels run throughout, for reference
+        reference_expedition = LogExpedition(self.columns)
+        reference = Engine(self.config(self.math_channels), reference_expedition)
+
+        def tick(row: int):
+            expedition.row = reference_expedition.row = row
+            return engine.tick(float(self.times[row])), reference.tick(float(self.times[row]))
+
+        for row in range(300):
+            tick(row)
+
+        edited = list(self.math_channels)
+        edited[2] = _channel("Edited rolling", "User2", "std(bsp)", "Bsp", window_length="20s")
+        edited[3] = _channel("Edited filter", "User3", "ema(tws, 10)", "Tws")
+        previous = engine
+        engine = Engine(self.config(edited), expedition, previous=engine)
+        self.assertIs(engine.calculators[0], previous.calculators[0])
+        self.assertIs(engine.calculators[1], previous.calculators[1])
+        self.assertIsNot(engine.calculators[2], previous.calculators[2])
+        self.assertIsNot(engine.calculators[3], previous.calculators[3])
+
+        results, expected = tick(300)
+        # the unchanged channels carry on as if nothing had changed
+        self.assertEqual(results[:2], expected[:2])
+        # the edited filter starts again from the input
+        self.assertEqual(results[3], self.columns[Var.Tws][300])
+        # the edited window starts with the samples already taken of its input, rather than NaN
+        window = engine.calculators[2].window
+        samples = window.view("bsp")
+        taken = samples[~np.isnan(samples)]
+        self.assertGreaterEqual(taken.size, 100)
+        np.testing.assert_array_equal(taken, self.columns[Var.Bsp][300:300 - taken.size:-1])
+        self.assertTrue(np.isnan(results[2]))
+        for row in range(301, 400):
+            results, expected = tick(row)
+            self.assertEqual(results[:2], expected[:2])
+        samples = window.view("bsp")
+        self.assertFalse(np.isnan(samples).any())
+        self.assertAlmostEqual(results[2], np.std(samples), places=9)
+        np.testing.assert_array_equal(samples[:200], self.columns[Var.Bsp][399:199:-1])
+
+    def test_nothing_is_kept_from_another_expedition(self):
+        expedition = LogExpedition(self.columns)
+        engine = Engine(self.config(self.math_channels), expedition)
+        for row in range(300):
+            expedition.row = row
+            engine.tick(float(self.times[row]))
+        other = Engine(self.config(self.math_channels), LogExpedition(self.columns), previous=engine)
+        self.assertFalse(set(other.calculators) & set(engine.calculators))
+        self.assertTrue(np.all(np.isnan(other.results)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from ExpCalcs.expression import ExpressionError, clear_expression_cache, compile_expression
+
+
+class ExpressionCacheTest(unittest.TestCase):
+    def setUp(self):
+        clear_expression_cache()
+        self.addCleanup(clear_expression_cache)
+
+    def test_same_text_is_compiled_once(self):
+        self.assertIs(compile_expression("bsp * 2"), compile_expression("bsp * 2"))
+        self.assertIsNot(compile_expression("bsp * 2"), compile_expression("bsp * 3"))
+
+    def test_cache_is_bounded(self):
+        maxsize = compile_expression.cache_info().maxsize
+        for k in range(maxsize + 100):
+            compile_expression(f"bsp * {k}")
+        self.assertEqual(compile_expression.cache_info().currsize, maxsize)
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(ExpressionError):
+                compile_expression("bsp *")
+        self.assertEqual(compile_expression.cache_info().currsize, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
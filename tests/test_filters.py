@@ -0,0 +1,97 @@
+import logging
+import math
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.filters import FILTERS, StatefulFilters
+from ExpCalcs.replay import LogExpedition
+
+
+def _step_response(name: str, times, *args) -> np.ndarray:
+    # the filter's output for an input that steps from 0 to 1 just after the first time
+    owner = StatefulFilters()
+    f = FILTERS[name](owner)
+    outputs = []
+    for index, time in enumerate(times):
+        owner.time = time
+        outputs.append(f(0.0 if index == 0 else 1.0, *args))
+    return np.array(outputs)
+
+
+class FilterStepResponseTest(unittest.TestCase):
+    def setUp(self):
+        # uneven ticks, as the filters use the time of each evaluation
+        rng = np.random.default_rng(11)
+        self.times = np.concatenate(([0.0], np.cumsum(rng.uniform(0.005, 0.015, 2000))))
+
+    def test_lowpass(self):
+        # a first order stage is exact whatever the ticks
+        for name in ("ema", "lowpass"):
+            np.testing.assert_allclose(_step_response(name, self.times, 2.0)[1:],
+                                       1.0 - np.exp(-self.times[1:] / 2.0), atol=1e-12)
+
+    def test_highpass(self):
+        np.testing.assert_allclose(_step_response("highpass", self.times, 2.0)[1:],
+                                   np.exp(-self.times[1:] / 2.0), atol=1e-12)
+
+    def test_second_order(self):
+        # two stages in series, close to the continuous responses at these short time steps
+        t = self.times / 2.0
+        np.testing.assert_allclose(_step_response("lowpass2", self.times, 2.0), 1.0 - (1.0 + t) * np.exp(-t),
+                                   atol=0.01)
+        np.testing.assert_allclose(_step_response("highpass2", self.times, 2.0)[1:],
+                                   ((1.0 - t) * np.exp(-t))[1:], atol=0.01)
+
+    def test_derivative(self):
+        owner = StatefulFilters()
+        f = FILTERS["deriv"](owner)
+        owner.time = 0.0
+        self.assertTrue(math.isnan(f(1.0)))
+        for time in self.times[1:]:
+            owner.time = time
+            self.assertAlmostEqual(f(1.0 + 3.0 * time), 3.0, places=6)
+
+    def test_delay(self):
+        response = _step_response("delay", self.times, 1.0)
+        delayed = self.times >= 1.0
+        self.assertTrue(np.all(np.isnan(response[~delayed])))
+        # the input of the newest tick at least a second before
+        np.testing.assert_array_equal(response[delayed],
+                                      np.where(self.times[delayed] - 1.0 >= self.times[1], 1.0, 0.0))
+
+    def test_nan_keeps_the_state(self):
+        owner = StatefulFilters()
+        f = FILTERS["ema"](owner)
+        owner.time = 0.0
+        f(0.0, 1.0)
+        owner.time = 1.0
+        self.assertTrue(math.isnan(f(np.nan, 1.0)))
+        owner.time = 2.0
+        self.assertAlmostEqual(f(1.0, 1.0), 1.0 - math.exp(-2.0), places=12)
+
+
+class FilterChannelTest(unittest.TestCase):
+    def test_channel_step_response(self):
+        logging.disable(logging.WARNING)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        times = 100.0 + np.arange(300) * 0.1
+        bsp = np.where(np.arange(300) == 0, 0.0, 1.0)
+        math_channel = MathChannelConfig(
+            name="Filtered", output_expedition_var_enum_string="User0",
+            expression="ema(bsp, 5) - lowpass(bsp, 5) + highpass(bsp, 2)",
+            inputs=[InputVar(expedition_var_enum_string="Bsp", local_var_name="bsp")])
+        expedition = LogExpedition({Var.Bsp: bsp})
+        engine = Engine(Config(expedition=ExpeditionConfig(install_path=""), math_channels=[math_channel]), expedition)
+        results = []
+        for row, timestamp in enumerate(times):
+            expedition.row = row
+            results.extend(engine.tick(float(timestamp)))
+        # every call keeps a state of its own, so the two low-pass filters cancel out
+        np.testing.assert_allclose(results[1:], np.exp(-(times[1:] - times[0]) / 2.0), atol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
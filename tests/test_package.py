@@ -0,0 +1,17 @@
+import unittest
+
+
+class PackageTest(unittest.TestCase):
+    def test_import(self):
+        import ExpCalcs
+        self.assertTrue(hasattr(ExpCalcs, "Engine"))
+
+    def test_benchmark_config(self):
+        from ExpCalcs.benchmark import benchmark_config
+        config = benchmark_config(10, True)
+        self.assertEqual(len(config.math_channels), 10)
+        self.assertEqual(config.invalid_math_channels(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import math
+import os
+import tempfile
+import unittest
+
+from ExpCalcs import polars
+from ExpCalcs.polars import Polar, clear_polar_cache, load_polar
+
+
+class PolarTargetTest(unittest.TestCase):
+    def test_downwind_target_within_polar(self):
+        # a polar that stops at 150 TWA, above which the speed is only held constant
+        twa = [40, 52, 60, 75, 90, 110, 120, 135, 150]
+        polar = Polar([(tws, twa, [tws * 0.5 + angle / 100 for angle in twa]) for tws in (6, 8, 10, 12)])
+        self.assertEqual(polar.target_twa(8, False), 150.0)
+        self.assertAlmostEqual(polar.target_bsp(8, False), polar.bsp(8, 150))
+        self.assertEqual(polar.target_twa(8, True), 40.0)
+
+    def test_no_downwind_angles(self):
+        polar = Polar([(8, [40, 60, 80], [5, 6, 7])])
+        self.assertTrue(math.isnan(polar.target_twa(8, False)))
+        self.assertEqual(polar.target_twa(8, True), 40.0)
+
+
+class PolarCacheTest(unittest.TestCase):
+    def setUp(self):
+        clear_polar_cache()
+        self.addCleanup(clear_polar_cache)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "boat.pol")
+        self.write("6 45 5.2 60 5.9\n", 1000.0)
+
+    def write(self, text: str, mtime: float):
+        with open(self.path, "w") as f:
+            f.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_loaded_once(self):
+        with self.assertLogs("ExpCalcs.polars", level="INFO"):
+            polar = load_polar(self.path)
+        self.assertIs(load_polar(self.path), polar)
+
+    def test_changed_file_replaces_the_entry(self):
+        with self.assertLogs("ExpCalcs.polars", level="INFO"):
+            first = load_polar(self.path)
+            for mtime in (2000.0, 3000.0):
+                self.write("6 45 5.4 60 6.1\n", mtime)
+                polar = load_polar(self.path)
+        self.assertIsNot(polar, first)
+        self.assertAlmostEqual(polar.bsp(6, 45), 5.4)
+        self.assertEqual(list(polars._polar_cache), [os.path.abspath(self.path)])
+
+
+if __name__ == "__main__":
+    unittest.main()
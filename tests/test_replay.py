@@ -0,0 +1,64 @@
+import logging
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.replay import Replay
+
+
+def _channel(name: str, output: str, expression: str, inputs, **kwargs) -> MathChannelConfig:
+    return MathChannelConfig(name=name, output_expedition_var_enum_string=output, expression=expression,
+                             inputs=[InputVar(expedition_var_enum_string=var, local_var_name=local)
+                                     for var, local in inputs],
+                             **kwargs)
+
+
+class ReplayParityTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        rng = np.random.default_rng(1)
+        rows = 3000
+        self.times = 1000.0 + np.cumsum(rng.uniform(0.05, 0.25, rows))
+        self.columns = {
+            Var.Bsp: 6 + np.sin(self.times / 3) + rng.normal(0, 0.1, rows),
+            Var.Tws: 12 + rng.normal(0, 1, rows),
+            # a logged value of a channel's own output, which it only reads until it has written its own
+            Var.User14: np.full(rows, 5.0),
+        }
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def assert_parity(self, math_channels):
+        replay = Replay(Config(expedition=ExpeditionConfig(install_path=""), math_channels=math_channels))
+        _, vectorized = replay.run(self.times, self.columns)
+        _, live = replay.run(self.times, self.columns, vectorized=False)
+        for math_channel, a, b in zip(math_channels, vectorized, live):
+            with self.subTest(channel=math_channel.name):
+                self.assertFalse(np.all(np.isnan(a)))
+                np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+    def test_channels_that_read_their_own_output(self):
+        self.assert_parity([
+            _channel("recursive", "User14", "0.9 * u14 + 0.1 * bsp", [("User14", "u14"), ("Bsp", "bsp")]),
+            _channel("unlogged", "User15", "0.9 * u15 + 0.1 * tws if u15 == u15 else tws",
+                     [("User15", "u15"), ("Tws", "tws")]),
+            _channel("deadband", "User16", "0.8 * u16 + 0.2 * bsp if u16 == u16 else bsp",
+                     [("User16", "u16"), ("Bsp", "bsp")], output_deadband=0.05),
+            _channel("slow", "User17", "0.5 * u17 + 0.5 * tws if u17 == u17 else tws",
+                     [("User17", "u17"), ("Tws", "tws")], update_rate=2),
+        ])
+
+    def test_channel_read_by_itself_and_another(self):
+        # the output is passed on in memory, so the channel starts from NaN rather than the logged value
+        self.assert_parity([
+            _channel("recursive", "User14", "0.9 * u14 + 0.1 * bsp if u14 == u14 else bsp",
+                     [("User14", "u14"), ("Bsp", "bsp")]),
+            _channel("reader", "User15", "u14 * 2", [("User14", "u14")]),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import logging
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.replay import LogExpedition
+
+
+def _circular_mean(headings: np.ndarray) -> float:
+    radians = np.radians(headings)
+    return float(np.degrees(np.arctan2(np.sum(np.sin(radians)), np.sum(np.cos(radians)))) % 360.0)
+
+
+# expression -> the same reduction of the samples in the window, straight from numpy
+_REDUCTIONS = {
+    "mean(bsp)": np.mean,
+    "std(bsp)": np.std,
+    "var(bsp)": np.var,
+    "sum(bsp)": np.sum,
+    "min(bsp)": np.min,
+    "max(bsp)": np.max,
+    "median(bsp)": np.median,
+    "rolling_quantile(bsp, 0.9)": lambda samples: np.quantile(samples, 0.9),
+}
+
+
+class RollingStatisticsTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        rng = np.random.default_rng(5)
+        rows = 1500
+        # ticks every 0.1 s with jitter, so the windows hold more or fewer samples than their nominal length
+        self.times = 100.0 + np.arange(rows) * 0.1 + rng.uniform(-0.04, 0.04, rows)
+        bsp = 6.0 + np.sin(self.times / 5.0) + rng.normal(0.0, 0.3, rows)
+        # runs of NaN, as when an instrument drops out
+        bsp[300:305] = np.nan
+        bsp[900] = np.nan
+        hdg = (350.0 + 30.0 * np.sin(self.times / 7.0) + rng.normal(0.0, 5.0, rows)) % 360.0
+        self.columns = {Var.Bsp: bsp, Var.Hdg: hdg}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_against_numpy_over_the_window(self):
+        inputs = [InputVar(expedition_var_enum_string="Bsp", local_var_name="bsp")]
+        math_channels = [
+            MathChannelConfig(name=expression, output_expedition_var_enum_string=f"User{index}",
+                              expression=expression, inputs=inputs, window_length="10s")
+            for index, expression in enumerate(_REDUCTIONS)
+        ]
+        math_channels.append(MathChannelConfig(
+            name="circmean", output_expedition_var_enum_string="User20", expression="mean(hdg)",
+            inputs=[InputVar(expedition_var_enum_string="Hdg", local_var_name="hdg")], window_length="10s",
+            output_is_heading=True))
+        expedition = LogExpedition(self.columns)
+        engine = Engine(Config(expedition=ExpeditionConfig(install_path=""), math_channels=math_channels), expedition)
+        # the expressions are all replaced by accumulators
+        self.assertTrue(all(calculator.statistics is not None and not calculator.windowed_names
+                            for calculator in engine.calculators))
+
+        compared = 0
+        for row, timestamp in enumerate(self.times):
+            expedition.row = row
+            results = engine.tick(float(timestamp))
+            for calculator, result, reduction in zip(engine.calculators, results, _REDUCTIONS.values()):
+                samples = calculator.window.view("bsp")
+                with self.subTest(channel=calculator.name, row=row):
+                    self.assertEqual(np.isnan(result), np.isnan(samples).any())
+                    if not np.isnan(result):
+                        self.assertAlmostEqual(result, reduction(samples), delta=1e-9 * max(abs(result), 1.0))
+                        compared += 1
+            samples = engine.calculators[-1].window.view("hdg")
+            if not np.isnan(samples).any():
+                difference = (results[-1] - _circular_mean(samples) + 180.0) % 360.0 - 180.0
+                self.assertAlmostEqual(difference, 0.0, places=9)
+        self.assertGreater(compared, len(_REDUCTIONS) * 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
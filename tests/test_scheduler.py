@@ -0,0 +1,37 @@
+import unittest
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.scheduler import RateSchedule
+from ExpCalcs.simulation import SimulatedClock, SimulatedExpeditionDLL
+
+
+class RateScheduleTest(unittest.TestCase):
+    def test_update_period_longer_than_max_cycle(self):
+        # a 10 minute trend on a 10 Hz engine runs every 6000 ticks, more than the 3600 ticks of max_cycle
+        schedule = RateSchedule([0, 1, 2], [6000, 10, 1], [None, None, None], [1.0, 1.0, 1.0], [(), (), ()])
+        self.assertGreater(schedule.cycle, schedule.max_cycle)
+        self.assertIn(schedule.phases[0], range(6000))
+        evaluations = [tick for tick in range(12000)
+                       if any(index == 0 and evaluate for index, evaluate, _ in schedule.due(tick).channels)]
+        self.assertEqual(len(evaluations), 2)
+        self.assertEqual(evaluations[1] - evaluations[0], 6000)
+
+    def test_engine_with_slow_channel(self):
+        math_channels = [
+            MathChannelConfig(name=f"Trend{index}", output_expedition_var_enum_string=f"User{index}",
+                              expression="tws * 2", inputs=[InputVar(expedition_var_enum_string="Tws",
+                                                                     local_var_name="tws")],
+                              update_rate=rate)
+            for index, rate in enumerate((1 / 600, 0.001, 1.0))
+        ]
+        config = Config(expedition=ExpeditionConfig(install_path=""), math_channels=math_channels)
+        clock = SimulatedClock()
+        engine = Engine(config, SimulatedExpeditionDLL(clock=clock), time_step=0.1)
+        self.assertEqual(engine.schedule.update_periods[:2], [6000, 10000])
+        for _ in range(10):
+            clock.advance(engine.time_step)
+            engine.tick(clock())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import logging
+import unittest
+
+import numpy as np
+from Expedition import Var
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.replay import LogExpedition, Replay
+
+
+def _power(samples: np.ndarray):
+    # one sided power of each bin but DC of the samples, straight from np.fft
+    length = samples.size
+    bins = np.arange(1, length // 2 + 1)
+    power = np.abs(np.fft.rfft(samples)[1:length // 2 + 1]) ** 2 * np.where(2 * bins == length, 1.0, 2.0)
+    return bins, power / length ** 2
+
+
+def _dominant_period(samples: np.ndarray, time_step: float) -> float:
+    bins, power = _power(samples)
+    peak = int(np.argmax(power))
+    offset = 0.0
+    if 0 < peak < power.size - 1:
+        curvature = power[peak - 1] - 2.0 * power[peak] + power[peak + 1]
+        if curvature < 0.0:
+            offset = 0.5 * (power[peak - 1] - power[peak + 1]) / curvature
+    return samples.size * time_step / (bins[peak] + offset)
+
+
+def _band_power(samples: np.ndarray, low: float, high: float, time_step: float) -> float:
+    bins, power = _power(samples)
+    frequencies = bins / (samples.size * time_step)
+    return float(np.sum(power[(frequencies >= low) & (frequencies <= high)]))
+
+
+class SpectralTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        rng = np.random.default_rng(3)
+        rows = 600
+        # ticks every 0.1 s with jitter, so the 20 s window holds more or fewer than 200 samples
+        self.times = 100.0 + np.arange(rows) * 0.1 + rng.uniform(-0.04, 0.04, rows)
+        self.pitch = 2.0 * np.sin(2 * np.pi * self.times / 4.0) + rng.normal(0.0, 0.2, rows)
+        inputs = [InputVar(expedition_var_enum_string="Pitch", local_var_name="pitch")]
+        self.math_channels = [
+            MathChannelConfig(name=name, output_expedition_var_enum_string=f"User{index}", expression=expression,
+                              inputs=inputs, window_length="20s")
+            for index, (name, expression) in enumerate([
+                ("period", "dominant_period(pitch)"),
+                ("unrewritten period", "dominant_period(pitch - 0.0)"),
+                ("band", "band_power(pitch, 0.15, 0.45)"),
+                ("unrewritten band", "band_power(pitch - 0.0, 0.15, 0.45)"),
+            ])
+        ]
+        self.config = Config(expedition=ExpeditionConfig(install_path=""), math_channels=self.math_channels)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_against_fft_of_the_window(self):
+        expedition = LogExpedition({Var.Pitch: self.pitch})
+        engine = Engine(self.config, expedition)
+        window = engine.calculators[0].window
+        counts = set()
+        for row, timestamp in enumerate(self.times):
+            expedition.row = row
+            period, unrewritten_period, band, unrewritten_band = engine.tick(float(timestamp))
+            samples = window.view("pitch")
+            counts.add(samples.size)
+            if np.isnan(samples).any():
+                self.assertTrue(np.isnan(period))
+                continue
+            self.assertAlmostEqual(period, _dominant_period(samples, 0.1), places=9)
+            self.assertAlmostEqual(band, _band_power(samples, 0.15, 0.45, 0.1), places=9)
+            # the sliding DFT gives the same result as the spectrum of the whole window
+            self.assertAlmostEqual(period, unrewritten_period, places=9)
+            self.assertAlmostEqual(band, unrewritten_band, places=9)
+        self.assertGreater(len(counts), 1)
+        self.assertAlmostEqual(period, 4.0, delta=0.2)
+
+    def test_replay(self):
+        replay = Replay(self.config)
+        _, vectorized = replay.run(self.times, {Var.Pitch: self.pitch})
+        _, live = replay.run(self.times, {Var.Pitch: self.pitch}, vectorized=False)
+        for math_channel, a, b in zip(self.math_channels, vectorized, live):
+            with self.subTest(channel=math_channel.name):
+                self.assertFalse(np.all(np.isnan(a)))
+                np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
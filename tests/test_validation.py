@@ -0,0 +1,73 @@
+import logging
+import math
+import unittest
+
+import numpy as np
+
+from ExpCalcs import Config, Engine, ExpeditionConfig, InputVar, MathChannelConfig
+from ExpCalcs.expression import ExpressionError
+from ExpCalcs.replay import Replay
+from ExpCalcs.simulation import SimulatedClock, SimulatedExpeditionDLL
+from ExpCalcs.validation import FUNCTIONS, SIGNATURES, Shape, check_expression, expression_error
+from Expedition import Var
+
+
+class FunctionTableTest(unittest.TestCase):
+    def test_every_function_is_described(self):
+        # a function added to the calculator should have its arguments and shape described for the check
+        self.assertEqual([name for name, signature in FUNCTIONS.items() if signature.kind == 'unknown'], [])
+
+    def test_every_description_is_a_function(self):
+        self.assertEqual(set(SIGNATURES) - set(FUNCTIONS), set())
+
+    def test_min_max_take_one_argument(self):
+        # numpy's max(bsp, 0) is the maximum along axis 0, not bsp limited to 0
+        for expression in ("max(bsp, 0)", "min(bsp, 10)"):
+            with self.subTest(expression=expression):
+                with self.assertRaisesRegex(ExpressionError, "clip"):
+                    check_expression(expression, ["bsp"], windowed=True)
+        self.assertEqual(check_expression("max(bsp) - min(bsp)", ["bsp"], windowed=True), Shape.SCALAR)
+
+
+class InvalidChannelTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        inputs = [InputVar(expedition_var_enum_string="Bsp", local_var_name="bsp")]
+        self.config = Config(expedition=ExpeditionConfig(install_path=""), math_channels=[
+            MathChannelConfig(name="Valid", output_expedition_var_enum_string="User0", expression="bsp * 2",
+                              inputs=inputs),
+            # the window is never reduced
+            MathChannelConfig(name="Invalid", output_expedition_var_enum_string="User1", expression="bsp + 1",
+                              inputs=inputs, window_length="10s"),
+        ])
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_only_the_invalid_channel_is_disabled(self):
+        self.assertEqual([math_channel.name for math_channel, _ in self.config.invalid_math_channels()], ["Invalid"])
+        clock = SimulatedClock()
+        engine = Engine(self.config, SimulatedExpeditionDLL(clock=clock))
+        # the invalid channel is never built, so it is not run on every tick
+        self.assertEqual(list(engine.disabled), [1])
+        self.assertEqual([calculator.name for calculator in engine.calculators], ["Valid"])
+        for _ in range(5):
+            clock.advance(engine.time_step)
+            valid, = engine.tick(clock())
+        self.assertFalse(math.isnan(valid))
+
+    def test_expression_is_checked_once(self):
+        expression_error.cache_clear()
+        Engine(self.config, SimulatedExpeditionDLL(clock=SimulatedClock()))
+        self.config.invalid_math_channels()
+        self.assertEqual(expression_error.cache_info().misses, 2)
+
+    def test_replay_of_a_config_with_an_invalid_channel(self):
+        times = np.arange(100) * 0.1
+        _, (valid, invalid) = Replay(self.config).run(times, {Var.Bsp: np.full(100, 6.0)})
+        np.testing.assert_array_equal(valid, 12.0)
+        self.assertTrue(np.all(np.isnan(invalid)))
+
+
+if __name__ == "__main__":
+    unittest.main()
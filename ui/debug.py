@@ -1,6 +1,7 @@
 # dialogs.py
 from PySide6 import QtWidgets
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtCore import Qt, Signal, QTimer
+from collections import deque
 from datetime import datetime
 from typing import Dict, Any
 
@@ -78,8 +79,38 @@ class DebugDialog(QtWidgets.QDialog):
         self.layout.addWidget(self.button_box)
 
         self.update_info()
-        self.calculator.evaluated.connect(self.calculator_evaluated)
-        self.calculator.error.connect(self.calculator_error)
+
+        # the calculator runs in the engine's worker thread, so its events are queued here
+        # and the widgets are updated from the GUI thread by a timer
+        self.pending_values = deque(maxlen=1)
+        self.pending_errors = deque(maxlen=self.max_number_of_errors)
+        self.calculator.evaluated.connect(self.on_calculator_evaluated)
+        self.calculator.error.connect(self.on_calculator_error)
+        self.finished.connect(self.disconnect_calculator)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(100)
+
+    def disconnect_calculator(self):
+        # the calculator events are not Qt signals, so they are not disconnected when the dialog is destroyed
+        self.refresh_timer.stop()
+        self.calculator.evaluated.disconnect(self.on_calculator_evaluated)
+        self.calculator.error.disconnect(self.on_calculator_error)
+
+    def on_calculator_evaluated(self, float_value: float):
+        # called from the engine's worker thread
+        self.pending_values.append((datetime.now(), float_value))
+
+    def on_calculator_error(self, error_message: str):
+        # called from the engine's worker thread
+        self.pending_errors.append((datetime.now(), error_message))
+
+    def refresh(self):
+        while self.pending_errors:
+            self.calculator_error(*self.pending_errors.popleft())
+        if self.pending_values:
+            self.calculator_evaluated(*self.pending_values.pop())
 
     def update_info(self):
         info = f"Calculator: {self.calculator.__class__.__name__}\n"
@@ -94,14 +125,12 @@ class DebugDialog(QtWidgets.QDialog):
             variables += f"{var_name}: {var_value}\n"
         self.variables_display.setPlainText(variables)
 
-    def calculator_evaluated(self, float_value: float):
-        now = datetime.now()
+    def calculator_evaluated(self, now: datetime, float_value: float):
         value_text = f"{float_value}  ({now.strftime('%Y-%m-%d %H:%M:%S.%f')})"
         self.value_display.setText(value_text)
         self.update_variables()
 
-    def calculator_error(self, error_message: str):
-        now = datetime.now()
+    def calculator_error(self, now: datetime, error_message: str):
         error_text = f"{error_message}  ({now.strftime('%Y-%m-%d %H:%M:%S.%f')})"
         self.errors.append(error_text)
         if len(self.errors) > self.max_number_of_errors:
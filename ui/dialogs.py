@@ -1,6 +1,7 @@
 # dialogs.py
 from PySide6 import QtWidgets
 from PySide6.QtCore import Qt, Signal
+from pydantic import ValidationError
 
 from ExpCalcs import InputVar, MathChannelConfig
 from Expedition import Var
@@ -204,6 +205,46 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
         window_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
         expression_layout.addWidget(window_help_label)
 
+        # Update and sample rates
+        rate_layout = QtWidgets.QHBoxLayout()
+        self.update_rate_input = QtWidgets.QLineEdit()
+        self.update_rate_input.setPlaceholderText("10")
+        self.sample_rate_input = QtWidgets.QLineEdit()
+        rate_layout.addWidget(QtWidgets.QLabel("Update Rate Hz (optional):"))
+        rate_layout.addWidget(self.update_rate_input)
+        rate_layout.addWidget(QtWidgets.QLabel("Sample Rate Hz (optional):"))
+        rate_layout.addWidget(self.sample_rate_input)
+        expression_layout.addLayout(rate_layout)
+        rate_help_label = QtWidgets.QLabel("How often the expression is evaluated, and how often the inputs are added "
+                                           "to the window.\nThe sample rate defaults to the update rate")
+        rate_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
+        expression_layout.addWidget(rate_help_label)
+
+        # Resolution
+        resolution_layout = QtWidgets.QHBoxLayout()
+        self.resolution_input = QtWidgets.QLineEdit()
+        resolution_layout.addWidget(QtWidgets.QLabel("Resolution (optional):"))
+        resolution_layout.addWidget(self.resolution_input)
+        expression_layout.addLayout(resolution_layout)
+        resolution_help_label = QtWidgets.QLabel("Evaluate long windows over block averages of the inputs (e.g. 1s, 10s)"
+                                                 "\nor auto to let the engine choose")
+        resolution_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
+        expression_layout.addWidget(resolution_help_label)
+
+        # Polar
+        polar_layout = QtWidgets.QHBoxLayout()
+        self.polar_file_input = QtWidgets.QLineEdit()
+        self.polar_file_button = QtWidgets.QPushButton("Browse")
+        self.polar_file_button.clicked.connect(self.on_select_polar_file)
+        polar_layout.addWidget(QtWidgets.QLabel("Polar File (optional):"))
+        polar_layout.addWidget(self.polar_file_input)
+        polar_layout.addWidget(self.polar_file_button)
+        expression_layout.addLayout(polar_layout)
+        polar_help_label = QtWidgets.QLabel("Polar used by polar_bsp(tws, twa), target_twa(tws, upwind) and "
+                                            "target_bsp(tws, upwind)")
+        polar_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
+        expression_layout.addWidget(polar_help_label)
+
             # Output Variable
         outputs_group = QtWidgets.QGroupBox("Output")
         self.layout.addWidget(outputs_group)
@@ -236,6 +277,25 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
         output_name_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
         outputs_layout.addWidget(output_name_help_label)
 
+        output_deadband_layout = QtWidgets.QHBoxLayout()
+        output_deadband_layout.setContentsMargins(0, 0, 0, 0)
+        output_deadband_layout.setSpacing(10)
+        outputs_layout.addLayout(output_deadband_layout)
+        self.output_deadband_input = QtWidgets.QLineEdit()
+        self.output_deadband_input.setPlaceholderText("0.0")
+        output_deadband_layout.addWidget(QtWidgets.QLabel("Deadband (optional):"))
+        output_deadband_layout.addWidget(self.output_deadband_input)
+        output_deadband_help_label = QtWidgets.QLabel("Changes smaller than the deadband are not written to Expedition")
+        output_deadband_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
+        outputs_layout.addWidget(output_deadband_help_label)
+
+        self.output_is_heading_input = QtWidgets.QCheckBox("Output is a heading")
+        outputs_layout.addWidget(self.output_is_heading_input)
+        output_is_heading_help_label = QtWidgets.QLabel("Heading outputs are wrapped to 0-360 and rolling mean/std "
+                                                        "are calculated as circular statistics")
+        output_is_heading_help_label.setStyleSheet("color: gray; font-size: 10px; font-style: italic;")
+        outputs_layout.addWidget(output_is_heading_help_label)
+
         # Buttons
         self.button_box = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
         self.dialog_layout.addWidget(self.button_box)
@@ -249,6 +309,17 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
             self.window_length_input.setText(config.window_length)
             self.output_var_name.setText(config.output_expedition_var.name)
             self.output_label_input.setText(config.output_expedition_user_name)
+            self.output_is_heading_input.setChecked(bool(config.output_is_heading))
+            if config.output_deadband is not None:
+                self.output_deadband_input.setText(str(config.output_deadband))
+            if config.update_rate is not None:
+                self.update_rate_input.setText(str(config.update_rate))
+            if config.sample_rate is not None:
+                self.sample_rate_input.setText(str(config.sample_rate))
+            if config.resolution is not None:
+                self.resolution_input.setText(config.resolution)
+            if config.polar_file is not None:
+                self.polar_file_input.setText(config.polar_file)
             # add items to the table widget (Var name in first column, local name in second column)
             for i in self.inputs:
                 item = QtWidgets.QTreeWidgetItem([i.expedition_var.name, i.local_var_name])
@@ -270,6 +341,23 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
                 item = QtWidgets.QTreeWidgetItem([iv.expedition_var.name, iv.local_var_name])
                 self.inputs_table.addTopLevelItem(item)
 
+    def on_select_polar_file(self):
+        file_name, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Polar File", self.polar_file_input.text(),
+                                                             "Polar Files (*.txt *.pol *.csv);;All Files (*)")
+        if file_name:
+            self.polar_file_input.setText(file_name)
+
+    def accept(self):
+        # check the channel before closing, so that an invalid expression can be corrected in place
+        try:
+            error = self.get_config().expression_error()
+        except ValidationError as e:
+            error = "\n".join(error['msg'] for error in e.errors())
+        if error is not None:
+            QtWidgets.QMessageBox.critical(self, "Error", f"Invalid math channel:\n{error}")
+            return
+        super().accept()
+
     # add a window length input
     def get_config(self):
         # Return a RollingMathChannelConfig object based on user input
@@ -283,6 +371,13 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
         window_length = self.window_length_input.text()
         if not window_length:
             window_length = None
+        output_deadband = self.output_deadband_input.text()
+        if not output_deadband:
+            output_deadband = None
+        update_rate = self.update_rate_input.text() or None
+        sample_rate = self.sample_rate_input.text() or None
+        resolution = self.resolution_input.text() or None
+        polar_file = self.polar_file_input.text() or None
 
         return MathChannelConfig(
             name=name,
@@ -290,5 +385,11 @@ class MathChannelConfigDialog(QtWidgets.QDialog):
             output_expedition_var_enum_string=output_var,
             output_expedition_user_name=output_label,
             inputs=input_vars,
-            window_length=window_length
+            output_is_heading=self.output_is_heading_input.isChecked(),
+            window_length=window_length,
+            output_deadband=output_deadband,
+            update_rate=update_rate,
+            sample_rate=sample_rate,
+            resolution=resolution,
+            polar_file=polar_file
         )
@@ -0,0 +1,155 @@
+# performance.py
+from PySide6 import QtWidgets
+from PySide6.QtCore import Qt, QTimer
+from typing import Any, Callable, Dict, Optional
+
+import math
+
+
+class NumberItem(QtWidgets.QTableWidgetItem):
+    """
+    A table item that shows a formatted number and sorts by its value
+    """
+
+    def __init__(self, value: float, text: str):
+        super().__init__(text)
+        self.value = value
+        self.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    def __lt__(self, other):
+        if isinstance(other, NumberItem):
+            # NaN sorts first
+            return (not math.isnan(other.value) and math.isnan(self.value)) or self.value < other.value
+        return super().__lt__(other)
+
+
+def milliseconds(seconds: float) -> str:
+    return "-" if math.isnan(seconds) else f"{seconds * 1000:.3f}"
+
+
+class PerformanceDialog(QtWidgets.QDialog):
+    """
+    Shows the engine's profile while it runs: the tick, DLL read and DLL write times and, for each channel, the
+    time and errors of its evaluations and the evaluations skipped because it kept failing. The channels are sorted
+    by their total time, so the most expensive one is at the top. Reset starts the profile again without restarting
+    the engine.
+    """
+
+    COLUMNS = ["Channel", "Evaluations", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Max (ms)", "Total (s)", "Share",
+               "Errors", "Error Rate", "Skipped"]
+
+    def __init__(self,
+                 get_stats: Callable[[], Optional[Dict[str, Any]]],
+                 reset_stats: Callable[[], None],
+                 parent=None):
+        """
+        :param get_stats: returns the stats of the running engine, see EngineRunner.stats(), None if not running
+        :param reset_stats: resets the stats of the running engine
+        """
+        super().__init__(parent)
+        self.get_stats = get_stats
+        self.reset_stats = reset_stats
+        self.setWindowTitle("⏱️ Performance")
+        self.setMinimumSize(800, 500)
+        self.layout = QtWidgets.QVBoxLayout(self)
+
+        self.summary_label = QtWidgets.QLabel("Ticks")
+        self.summary_label.setStyleSheet("font-weight: bold; margin-top: 10px; margin-bottom: 4px;")
+        self.layout.addWidget(self.summary_label)
+
+        self.summary_display = QtWidgets.QLabel(self)
+        self.summary_display.setStyleSheet(
+            "font-family: 'Courier New'; font-size: 12pt; background-color: #f4f4f4; padding: 6px; border: 1px solid #ccc;"
+        )
+        self.summary_display.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.layout.addWidget(self.summary_display)
+
+        self.channels_label = QtWidgets.QLabel("Channels")
+        self.channels_label.setStyleSheet("font-weight: bold; margin-top: 10px; margin-bottom: 4px;")
+        self.layout.addWidget(self.channels_label)
+
+        self.channels_table = QtWidgets.QTableWidget(0, len(self.COLUMNS), self)
+        self.channels_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.channels_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+        self.channels_table.verticalHeader().setVisible(False)
+        self.channels_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.channels_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.channels_table.setSortingEnabled(True)
+        self.channels_table.sortByColumn(self.COLUMNS.index("Total (s)"), Qt.DescendingOrder)
+        self.layout.addWidget(self.channels_table)
+
+        self.button_layout = QtWidgets.QHBoxLayout()
+        self.pause_button = QtWidgets.QPushButton("⏸️ Pause")
+        self.pause_button.setCheckable(True)
+        self.reset_button = QtWidgets.QPushButton("🔄 Reset")
+        self.reset_button.clicked.connect(self.on_reset)
+        self.close_button = QtWidgets.QPushButton("Close")
+        self.close_button.clicked.connect(self.accept)
+        self.button_layout.addWidget(self.pause_button)
+        self.button_layout.addWidget(self.reset_button)
+        self.button_layout.addStretch()
+        self.button_layout.addWidget(self.close_button)
+        self.layout.addLayout(self.button_layout)
+
+        # the stats are recorded in the engine's worker thread and sampled here by a timer
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.finished.connect(self.refresh_timer.stop)
+        self.refresh()
+
+    def on_reset(self):
+        self.reset_stats()
+        self.refresh()
+
+    def refresh(self):
+        if self.pause_button.isChecked():
+            return
+        stats = self.get_stats()
+        if stats is None:
+            self.summary_display.setText("The math channels are not running")
+            self.channels_table.setRowCount(0)
+            return
+        self.update_summary(stats)
+        self.update_channels(stats)
+
+    def update_summary(self, stats: Dict[str, Any]):
+        ticks = stats['ticks']
+        overruns = stats['overruns']
+        lines = [f"Ticks: {ticks}   Overruns: {overruns} ({overruns / ticks if ticks else 0:.1%})"]
+        if 'scheduler' in stats:
+            lines[0] += f"   Missed: {stats['scheduler']['missed_ticks']}"
+        for label, key in (("Tick", 'tick'), ("DLL read", 'read'), ("DLL write", 'write')):
+            summary = stats[key]
+            lines.append(f"{label + ':':<11} mean {milliseconds(summary['mean'])} ms   "
+                         f"p50 {milliseconds(summary['p50'])} ms   p99 {milliseconds(summary['p99'])} ms   "
+                         f"max {milliseconds(summary['max'])} ms")
+        self.summary_display.setText("\n".join(lines))
+
+    def update_channels(self, stats: Dict[str, Any]):
+        channels = stats['channels']
+        total_time = sum(channel['time']['total'] + channel['sample_time'] for channel in channels)
+
+        # sorting while the rows are filled in would move them under the items being set
+        self.channels_table.setSortingEnabled(False)
+        self.channels_table.setRowCount(len(channels))
+        for row, channel in enumerate(channels):
+            time = channel['time']
+            channel_time = time['total'] + channel['sample_time']
+            share = channel_time / total_time if total_time else 0.0
+            items = [
+                QtWidgets.QTableWidgetItem(channel['name']),
+                NumberItem(channel['evaluations'], str(channel['evaluations'])),
+                NumberItem(time['mean'], milliseconds(time['mean'])),
+                NumberItem(time['p50'], milliseconds(time['p50'])),
+                NumberItem(time['p99'], milliseconds(time['p99'])),
+                NumberItem(time['max'], milliseconds(time['max'])),
+                NumberItem(channel_time, f"{channel_time:.3f}"),
+                NumberItem(share, f"{share:.1%}"),
+                NumberItem(channel['errors'], str(channel['errors'])),
+                NumberItem(channel['error_rate'], f"{channel['error_rate']:.1%}"),
+                NumberItem(channel['skipped'], str(channel['skipped'])),
+            ]
+            for column, item in enumerate(items):
+                self.channels_table.setItem(row, column, item)
+        self.channels_table.setSortingEnabled(True)